@@ -15,6 +15,16 @@ class DefaultConfig:
     JSON_SORT_KEYS = False
     CSRF_ENABLED = True  # cross-site forgery protection
     HOST = '0.0.0.0'
+    SHARED_VERSIONS_ENABLED = True  # share notice of changes across processes
+    SHARED_VERSIONS_INTERVAL = 1  # max seconds until changes are noticed
+    RESPONSE_CACHE_SIZE = 1024  # max cached responses; 0 disables
+    RESPONSE_CACHE_TTL = 300  # seconds
+    GEO_SEARCH_INDEX_ENABLED = True  # in-memory geo name search index
+    GEO_SEARCH_INDEX_SNAPSHOT = None  # path to index snapshot file
+    GEO_SPATIAL_INDEX_ENABLED = True  # in-memory geo location index
+    GEO_SNAPSHOT_ENABLED = True  # in-memory geo graph snapshot
+    GEO_SNAPSHOT_PATH = None  # path to geo snapshot file
+    GEO_RESOLVER_ENABLED = True  # in-memory geo human_id resolution map
 
 
 class DevelopmentConfig(DefaultConfig):
@@ -39,6 +49,15 @@ class TestingConfig(DefaultConfig):
     TRAP_BAD_REQUEST_ERRORS = True  # regular traceback on bad requests
     JSON_SORT_KEYS = False
     JSONIFY_PRETTYPRINT_REGULAR = True
+    # Process-wide caches and indexes outlive each test, whose session
+    # rolls back all writes on teardown, so they would serve data of
+    # prior tests; tests exercising them enable them explicitly
+    RESPONSE_CACHE_SIZE = 0
+    SHARED_VERSIONS_ENABLED = False
+    GEO_SEARCH_INDEX_ENABLED = False
+    GEO_SPATIAL_INDEX_ENABLED = False
+    GEO_SNAPSHOT_ENABLED = False
+    GEO_RESOLVER_ENABLED = False
 
 
 class DeployableConfig(DefaultConfig):
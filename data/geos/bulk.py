@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""Bulk insert mode and progress reporting for geo data loads"""
+from collections import Counter, namedtuple
+from contextlib import contextmanager
+from time import perf_counter
+
+from sqlalchemy import event, func
+from sqlalchemy.orm import attributes, scoped_session
+
+from intertwine.geos.models import Geo, GeoData, GeoLevel, GeoID
+
+
+def resolve_session(session):
+    """Return the underlying session if given a scoped session"""
+    return session() if isinstance(session, scoped_session) else session
+
+
+def advance_sequences(session, models):
+    """Advance Postgres id sequences for models past the max ids"""
+    bind = session.get_bind()
+    if bind.dialect.name != 'postgresql':
+        return
+    for model in models:
+        table = model.__table__.name
+        session.execute(
+            "SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+            "(SELECT COALESCE(MAX(id), 0) + 1 FROM {table}), false)"
+            .format(table=table))
+
+
+class BulkInsertMode:
+    """
+    Bulk Insert Mode
+
+    The unit of work must issue one INSERT per new instance whose
+    primary key is unknown in order to retrieve the key, whereas new
+    instances with primary keys already set are written with a single
+    executemany per table. In bulk insert mode, primary keys are
+    allocated on each flush to new instances of the given models, so the
+    geos, data, levels and ids created by the loaders are written in
+    batches rather than row by row.
+
+    Keys are allocated in creation order starting after the max existing
+    id of each model, so no other writers may insert concurrently. On
+    Postgres, the id sequences are advanced past the allocated keys
+    before each commit and on exit, so the sequences are valid for each
+    committed batch even if a later batch fails. Call sync() to resume
+    allocation after rows are inserted by other means, such as a merge
+    of staged data.
+
+    Usage:
+
+        with BulkInsertMode(session):
+            load_geos(...)
+    """
+    MODELS = (Geo, GeoData, GeoLevel, GeoID)
+
+    def sync(self):
+        """Resume key allocation after the max existing id of each model"""
+        session = self.session
+        self.next_ids = {model: (session.query(func.max(model.id)).scalar() or 0) + 1
+                         for model in self.models}
+
+    def __enter__(self):
+        self.sync()
+        event.listen(self.session, 'before_flush', self._allocate_ids)
+        event.listen(self.session, 'before_commit', self._advance_sequences)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if exc_type is None:
+                self.session.flush()
+        finally:
+            event.remove(self.session, 'before_flush', self._allocate_ids)
+            event.remove(self.session, 'before_commit',
+                         self._advance_sequences)
+        if exc_type is None:
+            advance_sequences(self.session, self.models)
+
+    def _advance_sequences(self, session):
+        # Flush first, as the commit flushes only after this event
+        session.flush()
+        advance_sequences(session, self.models)
+
+    def _allocate_ids(self, session, flush_context, instances):
+        next_ids = self.next_ids
+        new = sorted((attributes.instance_state(inst) for inst in session.new
+                      if type(inst) in next_ids),
+                     key=lambda state: state.insert_order)
+        for state in new:
+            inst = state.obj()
+            if inst.id is None:
+                model = type(inst)
+                inst.id = next_ids[model]
+                next_ids[model] += 1
+
+    def __init__(self, session, models=MODELS):
+        self.session = resolve_session(session)
+        self.models = models
+        self.next_ids = {}
+
+
+class LoadProgress:
+    """
+    Load Progress
+
+    Tracks elapsed time and rows inserted (counted by model as new
+    instances are flushed) for each stage of a load and reports the
+    throughput per stage and overall:
+
+        progress = LoadProgress(session)
+        with progress:
+            with progress.stage('places'):
+                load_place_geos(...)
+        progress.report()
+    """
+    Stage = namedtuple('LoadStage', 'name, elapsed, inserted')
+
+    @property
+    def elapsed(self):
+        return sum(stage.elapsed for stage in self.stages)
+
+    @property
+    def inserted(self):
+        return sum((stage.inserted for stage in self.stages), Counter())
+
+    @contextmanager
+    def stage(self, name):
+        """Context manager timing a stage and counting its inserts"""
+        self.out('Stage: {}'.format(name))
+        start = perf_counter()
+        counts = self.counts.copy()
+        try:
+            yield
+        finally:
+            self.session.flush()  # Count pending inserts within stage
+            stage = self.Stage(name=name, elapsed=perf_counter() - start,
+                               inserted=self.counts - counts)
+            self.stages.append(stage)
+            self.out(self.format_line(stage.name, stage.elapsed, stage.inserted))
+
+    def count(self, name, inserted):
+        """Count rows inserted outside of flushes, such as by a merge"""
+        self.counts[name] += inserted
+
+    def report(self):
+        """Report throughput per stage and in total"""
+        self.out('Load report:')
+        for stage in self.stages:
+            self.out(self.format_line(stage.name, stage.elapsed, stage.inserted))
+        self.out(self.format_line('total', self.elapsed, self.inserted))
+
+    @staticmethod
+    def format_line(name, elapsed, inserted):
+        total = sum(inserted.values())
+        rate = total / elapsed if elapsed else 0
+        details = ', '.join('{}: {:,}'.format(model, count)
+                            for model, count in sorted(inserted.items()))
+        return ('\t{name:<16} {elapsed:>9.1f}s {total:>10,} rows {rate:>10,.0f} rows/s'
+                '{details}'.format(name=name, elapsed=elapsed, total=total, rate=rate,
+                                   details=' ({})'.format(details) if details else ''))
+
+    def _count_inserts(self, session, flush_context, instances):
+        self.counts.update(type(inst).__name__ for inst in session.new)
+
+    def __enter__(self):
+        event.listen(self.session, 'before_flush', self._count_inserts)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        event.remove(self.session, 'before_flush', self._count_inserts)
+
+    def __init__(self, session, out=print):
+        self.session = resolve_session(session)
+        self.out = out
+        self.counts = Counter()
+        self.stages = []
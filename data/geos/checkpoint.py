@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""Checkpoints for resuming geo data loads"""
+from sqlalchemy import Column, MetaData, Table, and_, func, select, types
+
+from data.geos.bulk import resolve_session
+from intertwine.geos.models import Geo
+
+# Kept apart from the model metadata as it is only used by data loads
+metadata = MetaData()
+
+geo_load_checkpoint_table = Table(
+    'geo_load_checkpoint', metadata,
+    Column('stage', types.String(30), primary_key=True),
+    Column('sub1key', types.String(2), primary_key=True),
+    Column('completed', types.DateTime(), server_default=func.now())
+)
+
+
+class LoadCheckpoints:
+    """
+    Load Checkpoints
+
+    Runs each batch of a load (a stage, optionally for a single state)
+    and commits it along with a checkpoint, so a batch is either fully
+    committed and checkpointed or not at all. A rerun after a failure
+    skips checkpointed batches and resumes with the one that failed:
+
+        checkpoints = LoadCheckpoints(session)
+        for sub1key in sub1keys:
+            checkpoints.run('place', sub1key, load_place_batch)
+
+    Batches not scoped by state are checkpointed with sub1key ALL.
+    """
+    ALL = ''
+
+    table = geo_load_checkpoint_table
+
+    @property
+    def connection(self):
+        """
+        Connection of the session on which geos are written
+
+        The table is kept apart from the model metadata, so the session
+        cannot bind statements on it by table. They are executed on the
+        connection of the Geo mapper instead, so checkpoints commit in
+        the same transaction as the batches they record.
+        """
+        return self.session.connection(mapper=Geo.__mapper__)
+
+    def __contains__(self, batch):
+        stage, sub1key = batch
+        return self.connection.execute(
+            select([self.table.c.stage])
+            .where(and_(self.table.c.stage == stage,
+                        self.table.c.sub1key == sub1key))).first() is not None
+
+    def run(self, stage, sub1key, load, force=False):
+        """
+        Run batch unless checkpointed, committing it with a checkpoint
+
+        I/O:
+        stage: name of the stage
+        sub1key: state abbrev for the batch or ALL if not scoped by state
+        load: callable taking no arguments that loads the batch
+        force=False: if True, run the batch even if checkpointed
+        return: True iff the batch was run
+        """
+        session = self.session
+        if (stage, sub1key) in self:
+            if not force:
+                self.out('\tSkipping {}: checkpointed'.format(
+                    ' '.join(filter(None, (stage, sub1key)))))
+                return False
+            self.clear(stages=[stage], sub1keys=[sub1key])
+        # Loaded instances remain valid as the load is the only writer
+        expire_on_commit, session.expire_on_commit = (
+            session.expire_on_commit, False)
+        try:
+            load()
+            self.connection.execute(self.table.insert().values(
+                stage=stage, sub1key=sub1key))
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.expire_on_commit = expire_on_commit
+        return True
+
+    def clear(self, stages=None, sub1keys=None):
+        """Clear checkpoints, optionally only for given stages/states"""
+        delete = self.table.delete()
+        if stages is not None:
+            delete = delete.where(self.table.c.stage.in_(stages))
+        if sub1keys is not None:
+            delete = delete.where(self.table.c.sub1key.in_(sub1keys))
+        self.connection.execute(delete)
+
+    def __init__(self, session, out=print):
+        self.session = resolve_session(session)
+        self.out = out
+        self.table.create(self.connection, checkfirst=True)
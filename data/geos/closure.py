@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Rebuild the geo closure table from the geo hierarchy
+
+Usage:
+    closure.py rebuild
+
+Options:
+    -h --help               This message
+
+Databases loaded before the closure table existed must be rebuilt once,
+after which the table is maintained on flush.
+"""
+from alchy import Manager
+from alchy.model import extend_declarative_base
+
+from config import DevConfig
+from intertwine.geos.closure import GeoClosure
+from intertwine.geos.models import BaseGeoModel
+
+
+if __name__ == '__main__':
+    from docopt import docopt
+
+    docopt(__doc__)
+
+    db = Manager(Model=BaseGeoModel, config=DevConfig)
+    db.create_all()
+    session = db.session
+    extend_declarative_base(BaseGeoModel, session=session)
+
+    GeoClosure.rebuild(session)
+    session.commit()
+    print('Rebuilt geo closure table')
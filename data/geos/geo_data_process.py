@@ -2,6 +2,7 @@
 # -*- coding: utf-8 -*-
 """Load geo data into Intertwine"""
 from collections import Counter, defaultdict, namedtuple
+from functools import partial
 
 from sqlalchemy import desc
 from alchy import Manager
@@ -9,11 +10,15 @@ from alchy.model import extend_declarative_base
 
 from config import DevConfig
 from data.data_process import DataSessionManager
+from data.geos.bulk import BulkInsertMode, LoadProgress
+from data.geos.checkpoint import LoadCheckpoints
 from data.geos.models import (BaseGeoDataModel, LSAD, GHRP,
                               State, CBSA, County, Cousub, Place)
 from intertwine.trackable import Trackable
 from intertwine.trackable.exceptions import (KeyMissingFromRegistry,
                                              KeyRegisteredAndNoModify)
+from intertwine.geos.closure import GeoClosure
+from intertwine.geos.snapshot import GeoSnapshot
 from intertwine.utils.structures import PeekableIterator
 from intertwine.utils.tools import add_leading_zeros
 from intertwine.geos.models import (
@@ -63,6 +68,17 @@ def define_record(name, *fields):
     return namedtuple_class, columns
 
 
+def flush_geos():
+    """
+    Flush pending geos
+
+    Stages run with autoflush disabled, so dynamic relationship queries
+    (e.g. children, aliases or get_related_geos) must be preceded by a
+    flush to include geos pending in the current batch.
+    """
+    Geo.session().flush()
+
+
 def find_non_place_cousubs(geo=None, include_all=False):
     """Utility to find non-place cousubs"""
     geos = []
@@ -126,16 +142,73 @@ def find_non_place_cousubs(geo=None, include_all=False):
     return geos
 
 
-def load_geos(geo_session, session):
-    """Load geos for the US"""
-    load_country_geos(geo_session, session)
-    load_subdivision1_geos(geo_session, session)
-    load_subdivision2_geos(geo_session, session)
-    load_subdivision3_geos(geo_session, session)
-    load_place_geos(geo_session, session)
-    load_cbsa_geos(geo_session, session)
-    load_manual_fixes(geo_session, session)
+def load_geos(geo_session, session, stages=None, sub1keys=None, force=False,
+              snapshot_path=None, out=print):
+    """
+    Load geos for the US
+
+    Loads in bulk insert mode with autoflush disabled, so new geos and
+    their data, levels and ids are written in batches, and reports
+    throughput per stage via out.
+
+    Stages scoped by state (subdivision1 through place) are committed
+    state by state, and the others as a whole, each batch along with a
+    checkpoint. A rerun after a failure thus skips checkpointed batches
+    and resumes with the batch that failed.
 
+    I/O:
+    stages=None: names of the stages to load; all stages if None
+    sub1keys=None: state abbrevs to which stages scoped by state are
+        limited; all states if None. Other stages are not limited.
+    force=False: if True, reload batches even if checkpointed. The geos
+        loaded by these batches must have been removed beforehand.
+    snapshot_path=None: if provided, write a geo snapshot file to the
+        path once all stages are loaded
+    """
+    def rebuild_closure(geo_session, session):
+        GeoClosure.rebuild(session)
+
+    all_stages = (('country', load_country_geos),
+                  ('subdivision1', load_subdivision1_geos),
+                  ('subdivision2', load_subdivision2_geos),
+                  ('subdivision3', load_subdivision3_geos),
+                  ('place', load_place_geos),
+                  ('cbsa', load_cbsa_geos),
+                  ('manual fixes', load_manual_fixes),
+                  ('timezones', load_timezones),
+                  ('closure', rebuild_closure))
+    state_stages = {'subdivision1', 'subdivision2', 'subdivision3', 'place'}
+
+    if sub1keys is None:
+        sub1keys = [state.stusps for state in geo_session.query(State)]
+    sub1keys = sorted(sub1keys)
+
+    checkpoints = LoadCheckpoints(session, out=out)
+    progress = LoadProgress(session, out=out)
+    # Defer closure maintenance on flush and rebuild once at the end
+    with GeoClosure.deferred(session), BulkInsertMode(session), progress:
+        for name, load_stage in all_stages:
+            if stages is not None and name not in stages:
+                continue
+            with progress.stage(name), session.no_autoflush:
+                if name not in state_stages:
+                    checkpoints.run(name, checkpoints.ALL, partial(
+                        load_stage, geo_session, session), force=force)
+                    continue
+                for sub1key in sub1keys:
+                    checkpoints.run(name, sub1key, partial(
+                        load_stage, geo_session, session, [sub1key]),
+                        force=force)
+                if name == 'subdivision1':
+                    # Sum US totals once all states have been loaded
+                    update_us_data()
+                    session.commit()
+
+        if snapshot_path:
+            with progress.stage('snapshot'):
+                write_snapshot(session, snapshot_path)
+
+    progress.report()
     return Trackable.catalog_updates()
 
 
@@ -158,12 +231,20 @@ def load_country_geos(geo_session, session):
     GeoID(level=glvl, standard=ISO_A3, code='USA')
     GeoID(level=glvl, standard=ISO_N3, code='840')
 
+    # Later stages link their geos to the US, so they cascade into the
+    # session and are committed with their batches
+    session.add(us)
+
 
 def load_subdivision1_geos(geo_session, session, sub1keys=None):
-    """Load SUBDIVISION1 geos"""
+    """
+    Load SUBDIVISION1 geos
+
+    US totals are not updated, as states may be loaded in batches; call
+    update_us_data once all states have been loaded.
+    """
     load_states(geo_session, session, sub1keys)
     load_territories(geo_session, session, sub1keys)
-    update_us_data()
 
 
 def load_states(geo_session, session, sub1keys=None):
@@ -264,6 +345,7 @@ def load_territories(geo_session, session, sub1keys=None):
 def update_us_data():
     """Update US population and area values based on subdivision1 values"""
     us = Geo['us']
+    flush_geos()
     children = us.children.all()
     us.data.total_pop = sum((c.data.total_pop for c in children if c.data))
     us.data.urban_pop = sum((c.data.urban_pop for c in children if c.data))
@@ -277,8 +359,16 @@ def load_subdivision2_geos(geo_session, session, sub1keys=None):
     load_territory_counties(geo_session, session, sub1keys)
 
 
-def load_state_counties(geo_session, session, sub1keys=None):
-    """Load county geos in states, DC, and Puerto Rico"""
+def load_state_counties(geo_session, session, sub1keys=None, countyids=None):
+    """
+    Load county geos in states, DC, and Puerto Rico
+
+    I/O:
+    geo_session: sqlalchemy session for geo database of US census data
+    session: sqlalchemy session for Intertwine database
+    sub1keys=None: sequence of state abbrevs to scope the data load
+    countyids=None: sequence of county fips ids to scope the data load
+    """
     CountyRecord, columns = define_record(
         'CountyRecord',
         'GHRP.name, GHRP.lsadc, GHRP.statefp, '
@@ -296,6 +386,9 @@ def load_state_counties(geo_session, session, sub1keys=None):
         statefps = {State.get_by('stusps', k).statefp for k in sub1keys}
         base_query = base_query.filter(GHRP.statefp.in_(statefps))
 
+    if countyids:
+        base_query = base_query.filter(GHRP.countyid.in_(set(countyids)))
+
     records = base_query.order_by(GHRP.statefp, GHRP.countyid).values(*columns)
 
     us = Geo['us']
@@ -479,7 +572,8 @@ def load_territory_counties(geo_session, session, sub1keys=None):
     # TODO: Consolidate Guam county into Guam the territory
 
 
-def load_subdivision3_geos(geo_session, session, sub1keys=None, sub2keys=None):
+def load_subdivision3_geos(geo_session, session, sub1keys=None, sub2keys=None,
+                           cousubkeys=None):
     """
     Load SUBDIVISION3 geos
 
@@ -494,6 +588,7 @@ def load_subdivision3_geos(geo_session, session, sub1keys=None, sub2keys=None):
     session: sqlalchemy session for Intertwine database
     sub1keys=None: sequence of state abbrevs to scope the data load
     sub2keys=None: sequence of county fips ids to scope the data load
+    cousubkeys=None: sequence of cousub ansi ids to scope the data load
     """
     CousubRecord, columns = define_record(
         'CousubRecord', 'GHRP.name, GHRP.lsadc, GHRP.statefp, '
@@ -517,6 +612,9 @@ def load_subdivision3_geos(geo_session, session, sub1keys=None, sub2keys=None):
         countyfps = {add_leading_zeros(cfp, 3) for cfp in sub2keys}
         base_query = base_query.filter(GHRP.countyfp.in_(countyfps))
 
+    if cousubkeys:
+        base_query = base_query.filter(GHRP.cousubns.in_(set(cousubkeys)))
+
     records = (
         base_query.order_by(GHRP.statefp, GHRP.cousubns)
                   .values(*columns))
@@ -649,7 +747,7 @@ def load_subdivision3_geos(geo_session, session, sub1keys=None, sub2keys=None):
             # GeoIDs for the PLACE level must be added by load_place_geos
             geo_level, level_created = GeoLevel.update_or_create(
                 geo=place, level=place_level, designation=designation,
-                _query_on_miss=False)
+                _query_on_miss=False, _save=False)  # Flushed in bulk
 
             if place is county:
                 continue
@@ -1117,6 +1215,7 @@ def manifest_geo(name, lsad, path_parent, state, county,
             lsad_geo_alias = lsad_geo_conflict
 
         else:
+            flush_geos()
             lsad_geo_conflict.qualifier = ' in '.join((
                 get_primary_designation(lsad_geo_conflict, state),
                 lsad_geo_conflict.get_related_geos(
@@ -1198,6 +1297,7 @@ def add_level_and_rename(geo, level, designation, geoids, name, lsad,
             old_geo_alias = Geo(name=geo_name, qualifier=geo_qualifier,
                                 path_parent=path_parent, alias_targets=[geo])
             # Create alias for each child using old path
+            flush_geos()
             for child_geo in geo.children.all():
                 Geo(name=child_geo.name, qualifier=child_geo.qualifier,
                     abbrev=child_geo.abbrev, path_parent=old_geo_alias,
@@ -1279,6 +1379,7 @@ def resolve_geo_conflict(geo_conflict, geo, lsad, state):
                 return
 
         else:
+            flush_geos()
             qgc.qualifier = ' in '.join((
                 get_primary_designation(qgc, state),
                 qgc.get_related_geos(
@@ -1327,6 +1428,7 @@ def resolve_geo_conflict(geo_conflict, geo, lsad, state):
         else:
             qualified_geo_alias.add_alias_target(geo_conflict)
 
+            flush_geos()
             geo_conflict.qualifier = ' in '.join((
                 get_primary_designation(geo_conflict, state),
                 geo_conflict.get_related_geos(relation=PARENTS,
@@ -1370,6 +1472,8 @@ def create_place_from_cousub(cousub, county=None, state=None, lsad=None,
     lsad=None: LSAD for the cousub
     """
     name = cousub.name
+    if county is None or state is None:
+        flush_geos()
     county = county or cousub.get_related_geos(
                     relation=PARENTS, level=SUBDIVISION2)[0]
     state = state or cousub.get_related_geos(
@@ -1471,10 +1575,17 @@ def load_cbsa_geos(geo_session, session, sub1keys=None, cbsa_keys=None):
         cbsa_keys = cbsa_keys if isinstance(cbsa_keys, set) else set(cbsa_keys)
         base_query = base_query.filter(CBSA.cbsa_code.in_(cbsa_keys))
 
-    records = (
+    records = list(
         base_query.order_by(CBSA.csa_code, CBSA.cbsa_code, desc(GHRP.p0020001))
                   .values(*columns))
 
+    # Resolve all referenced geo IDs in bulk rather than per record
+    geoid_keys = list({GeoID.Key(FIPS, fips)
+                       for r in (CBSARecord(*record) for record in records)
+                       for fips in (r.ghrp_statefp, r.ghrp_countyid, r.ghrp_placeid)})
+    geoids = {k: geoid for k, geoid in zip(geoid_keys, GeoID.tget_many(geoid_keys))
+              if geoid is not None}
+
     records = PeekableIterator(records)
 
     us = Geo['us']
@@ -1528,7 +1639,7 @@ def load_cbsa_geos(geo_session, session, sub1keys=None, cbsa_keys=None):
                 prior_csa_code = csa_code
 
         statefp = r.ghrp_statefp
-        state = GeoID[FIPS, statefp].level.geo
+        state = geoids[FIPS, statefp].level.geo
         if not state.levels.get(SUBDIVISION1):
             raise ValueError('State {!r} missing geo level'.format(state))
         if state.alias_targets:
@@ -1536,7 +1647,7 @@ def load_cbsa_geos(geo_session, session, sub1keys=None, cbsa_keys=None):
         cbsa_states[state] += r.ghrp_p0020001
 
         countyid = r.ghrp_countyid
-        county = GeoID[(FIPS, countyid)].level.geo
+        county = geoids[FIPS, countyid].level.geo
         if not county.levels.get(SUBDIVISION2):
             raise ValueError('County {!r} missing geo level'.format(county))
         if county.alias_targets:
@@ -1544,10 +1655,11 @@ def load_cbsa_geos(geo_session, session, sub1keys=None, cbsa_keys=None):
         # Store pop of county (CBSAs consist of whole counties)
         if not cbsa_counties.get(county):
             cbsa_counties[county] = county.data.total_pop
+            flush_geos()
             cbsa_county_children |= set(county.children.all())
 
         placeid = r.ghrp_placeid
-        place = GeoID[(FIPS, placeid)].level.geo
+        place = geoids[FIPS, placeid].level.geo
         if not (place.levels.get(PLACE) or place.levels.get(SUBPLACE)):
             raise ValueError('Place {!r} missing geo level'.format(place))
         if place.alias_targets:
@@ -1610,6 +1722,7 @@ def load_cbsa_geos(geo_session, session, sub1keys=None, cbsa_keys=None):
                 cbsa_main_places.append(cbsa_place_2)
 
             name_match = False
+            flush_geos()
             for place in cbsa_main_places:
                 place_geos = place.aliases.all()
                 place_geos.insert(0, place)
@@ -1862,6 +1975,20 @@ def load_manual_fixes(geo_session, session):
         esp.name = 'Espa\xf1ola'  # Geo['us/nm/española']
 
 
+def load_timezones(geo_session, session):
+    """Load timezone names precomputed from geo data locations"""
+    resolved = GeoData.resolve_timezones(session)
+    print('Resolved timezones for {:,} geos'.format(resolved))
+
+
+def write_snapshot(session, snapshot_path):
+    """Write geo snapshot file of the geos loaded"""
+    snapshot = GeoSnapshot.build(session)
+    snapshot.save(snapshot_path)
+    print('Wrote snapshot of {:,} geos to {}'.format(len(snapshot),
+                                                     snapshot_path))
+
+
 if __name__ == '__main__':
     # Session for geo.db, which contains the geo source data
     geo_dsm = DataSessionManager(db_config=DevConfig.GEO_DATABASE,
@@ -1878,4 +2005,4 @@ if __name__ == '__main__':
     Trackable.register_existing(session, Geo, GeoData, GeoLevel, GeoID)
     Trackable.clear_updates()
 
-    load_geos(geo_session, session)
+    load_geos(geo_session, session, snapshot_path=DevConfig.GEO_SNAPSHOT_PATH)
@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Load geo data into Intertwine, loading states in parallel
+
+Usage:
+    parallel.py [options]
+
+Options:
+    -h --help               This message
+    -p --processes=<n>      Number of worker processes (default: cpu count)
+    -s --staging-dir=<dir>  Keep staging databases and logs in dir
+    -n --snapshot=<path>    Write geo snapshot file to path
+                            (default: GEO_SNAPSHOT_PATH of DevConfig)
+"""
+import os
+from collections import Counter
+from contextlib import redirect_stdout
+from multiprocessing import get_context
+from tempfile import TemporaryDirectory
+
+from alchy import Manager
+from alchy.model import extend_declarative_base
+from sqlalchemy import bindparam, create_engine, select
+from sqlalchemy.orm import scoped_session, sessionmaker
+
+from config import DevConfig
+from data.data_process import DataSessionManager
+from data.geos.bulk import BulkInsertMode, LoadProgress, resolve_session
+from data.geos.geo_data_process import (
+    load_country_geos, load_subdivision1_geos, load_subdivision2_geos,
+    load_subdivision3_geos, load_place_geos, load_cbsa_geos,
+    load_manual_fixes, load_timezones, update_us_data, write_snapshot)
+from data.geos.models import BaseGeoDataModel, State
+from intertwine.geos.closure import GeoClosure
+from intertwine.geos.models import (
+    BaseGeoModel, Geo, GeoData, GeoLevel, GeoID,
+    geo_alias_association_table, geo_parent_child_association_table)
+from intertwine.trackable import Trackable
+
+# Stages scoped by state and therefore loaded by workers
+STATE_STAGES = (load_subdivision2_geos, load_subdivision3_geos,
+                load_place_geos)
+
+
+def stage_state(sub1key, staging_dir, geo_db_config=DevConfig.GEO_DATABASE):
+    """
+    Stage state
+
+    Load the geos for a state (or territory) into a new SQLite staging
+    database in staging_dir, along with the country and the state
+    itself so the state's geos have their parents. Loader output is
+    written to a log alongside the database. Intended to be run in its
+    own process. Returns the state key and the path to the database.
+    """
+    geo_dsm = DataSessionManager(db_config=geo_db_config,
+                                 ModelBases=[BaseGeoDataModel])
+    geo_session = geo_dsm.session
+    extend_declarative_base(BaseGeoDataModel, session=geo_session)
+
+    name = sub1key.lower()
+    path = os.path.join(staging_dir, '{}.db'.format(name))
+    engine = create_engine('sqlite:///{}'.format(path))
+    BaseGeoModel.metadata.create_all(engine)
+    session = scoped_session(sessionmaker(bind=engine))
+    extend_declarative_base(BaseGeoModel, session=session)
+    Trackable.clear_instances()
+    Trackable.clear_updates()
+
+    sub1keys = [sub1key]
+    log_path = os.path.join(staging_dir, '{}.log'.format(name))
+    with open(log_path, 'w') as log, redirect_stdout(log):
+        with GeoClosure.deferred(session), BulkInsertMode(session), \
+                session.no_autoflush:
+            # Flush between stages, as with LoadProgress.stage, so each
+            # stage's queries include the geos of the preceding stages
+            load_country_geos(geo_session, session)
+            session.flush()
+            load_subdivision1_geos(geo_session, session, sub1keys)
+            session.flush()
+            for load_stage in STATE_STAGES:
+                load_stage(geo_session, session, sub1keys)
+                session.flush()
+
+    session.commit()
+    session.remove()
+    engine.dispose()
+    return sub1key, path
+
+
+def _stage_state(args):
+    return stage_state(*args)
+
+
+def stage_states(sub1keys, staging_dir, processes=None,
+                 geo_db_config=DevConfig.GEO_DATABASE, out=print):
+    """Stage states in a pool of processes and return paths by key"""
+    paths = {}
+    args = [(sub1key, staging_dir, geo_db_config) for sub1key in sub1keys]
+    # Spawn rather than fork so workers do not share db connections
+    with get_context('spawn').Pool(processes) as pool:
+        for sub1key, path in pool.imap_unordered(_stage_state, args):
+            out('\tStaged {}'.format(sub1key))
+            paths[sub1key] = path
+    return paths
+
+
+class StagingMerge:
+    """
+    Staging Merge
+
+    Merges staging databases into the main database. Geos are matched on
+    human_id, data on geo, levels on (geo, level) and ids on (standard,
+    code), so a row staged by several workers, such as the country, is
+    inserted only once. Parent/child and alias links are unioned.
+
+    Within a state, geo conflicts have already been resolved by the
+    worker via resolve_geo_conflict, and as states have disjoint
+    namespaces, staged geos can only collide on geos outside them, like
+    the country. A matched row is therefore updated only if it is in the
+    scope of the staging database (the state geo and the geos within
+    its namespace, along with their data, levels and ids); otherwise
+    the existing row is kept.
+
+    Staged rows are assigned ids in staging (i.e. creation) order, so as
+    long as staging databases are merged in a fixed order, ids do not
+    depend on which worker finished first.
+
+    Usage:
+
+        merge = StagingMerge(session)
+        for sub1key in sorted(paths):
+            merge.merge(paths[sub1key], scope='us/' + sub1key.lower())
+    """
+    geo = Geo.__table__
+    data = GeoData.__table__
+    level = GeoLevel.__table__
+    geoid = GeoID.__table__
+    parent_child = geo_parent_child_association_table
+    alias = geo_alias_association_table
+
+    KEY_COLUMNS = {geo: ('human_id',),
+                   data: ('geo_id',),
+                   level: ('geo_id', 'level'),
+                   geoid: ('standard', 'code')}
+
+    def merge(self, path, scope):
+        """Merge staging database at path and return insert counts"""
+        engine = create_engine('sqlite:///{}'.format(path))
+        inserted = Counter()
+        try:
+            with engine.connect() as staging:
+                scope_prefix = scope + '/'
+
+                def in_scope(values):
+                    human_id = values['human_id']
+                    return (human_id == scope or
+                            human_id.startswith(scope_prefix))
+
+                geo_map, owned_geo_ids = self._merge_table(
+                    staging, self.geo, {'path_parent_id': None}, in_scope,
+                    inserted)
+                self._merge_table(
+                    staging, self.data, {'geo_id': geo_map},
+                    lambda values: values['geo_id'] in owned_geo_ids,
+                    inserted)
+                level_map, owned_level_ids = self._merge_table(
+                    staging, self.level, {'geo_id': geo_map},
+                    lambda values: values['geo_id'] in owned_geo_ids,
+                    inserted)
+                self._merge_table(
+                    staging, self.geoid, {'level_id': level_map},
+                    lambda values: values['level_id'] in owned_level_ids,
+                    inserted)
+                for table in (self.parent_child, self.alias):
+                    self._merge_links(staging, table, geo_map, inserted)
+        finally:
+            engine.dispose()
+        return inserted
+
+    def _merge_table(self, staging, table, foreign_maps, owned, inserted):
+        """
+        Merge staged rows of table, returning the id map and owned ids
+
+        foreign_maps maps each foreign key column to the map of staged
+        to merged ids for the table it references, or None if it
+        references this table.
+        """
+        keys = self.keys[table]
+        key_columns = self.KEY_COLUMNS[table]
+        self_columns = [c for c, fk_map in foreign_maps.items() if fk_map is None]
+        id_map = {}
+        rows = []
+        for row in staging.execute(select([table]).order_by(table.c.id)):
+            values = dict(row)
+            for column, fk_map in foreign_maps.items():
+                if fk_map is not None and values[column] is not None:
+                    values[column] = fk_map[values[column]]
+            key = tuple(values[c] for c in key_columns)
+            staged_id = values.pop('id')
+            merged_id = keys.get(key)
+            if merged_id is None:
+                merged_id = keys[key] = self.next_ids[table]
+                self.next_ids[table] += 1
+                values['id'] = merged_id
+            id_map[staged_id] = merged_id
+            rows.append(values)
+
+        inserts, updates = [], []
+        owned_ids = set()
+        for values in rows:
+            for column in self_columns:
+                if values[column] is not None:
+                    values[column] = id_map[values[column]]
+            if 'id' in values:
+                inserts.append(values)
+                owned_ids.add(values['id'])
+            elif owned(values):
+                values['merged_id'] = keys[tuple(values[c] for c in key_columns)]
+                updates.append(values)
+                owned_ids.add(values['merged_id'])
+
+        if inserts:
+            self.session.execute(table.insert(), inserts)
+            inserted[table.name] += len(inserts)
+        if updates:
+            self.session.execute(
+                table.update().where(table.c.id == bindparam('merged_id')),
+                updates)
+        return id_map, owned_ids
+
+    def _merge_links(self, staging, table, geo_map, inserted):
+        """Merge staged association rows not already linked"""
+        links = self.links[table]
+        columns = list(table.c.keys())
+        inserts = []
+        for row in staging.execute(select([table])):
+            link = tuple(geo_map[row[c]] for c in columns)
+            if link not in links:
+                links.add(link)
+                inserts.append(dict(zip(columns, link)))
+        if inserts:
+            self.session.execute(table.insert(), inserts)
+            inserted[table.name] += len(inserts)
+
+    def __init__(self, session):
+        self.session = session = resolve_session(session)
+        self.keys = {}
+        self.next_ids = {}
+        for table, key_columns in self.KEY_COLUMNS.items():
+            columns = [table.c[c] for c in key_columns]
+            self.keys[table] = {tuple(row[1:]): row[0] for row in
+                                session.execute(select([table.c.id] + columns))}
+            self.next_ids[table] = max(self.keys[table].values(), default=0) + 1
+        self.links = {table: set(map(tuple, session.execute(select([table]))))
+                      for table in (self.parent_child, self.alias)}
+
+
+def load_geos_parallel(geo_session, session, sub1keys=None, processes=None,
+                       staging_dir=None, geo_db_config=DevConfig.GEO_DATABASE,
+                       snapshot_path=None, out=print):
+    """
+    Load geos for the US, loading states in parallel
+
+    The country and states are loaded first, followed by counties,
+    subdivisions and places for each state in a pool of processes, each
+    state into its own staging database. These are merged into the main
+    database in order by state, after which CBSAs and manual fixes are
+    loaded, timezones are resolved and the closure is rebuilt. Staging databases and worker logs
+    are kept in staging_dir if provided. A geo snapshot file is written
+    to snapshot_path if provided.
+
+    Rows merged from staging are not tracked as Trackable updates.
+    """
+    if sub1keys is None:
+        sub1keys = [state.stusps for state in geo_session.query(State)]
+    sub1keys = sorted(sub1keys)
+
+    progress = LoadProgress(session, out=out)
+    bulk_insert_mode = BulkInsertMode(session)
+    with GeoClosure.deferred(session), bulk_insert_mode, progress:
+        with progress.stage('country'), session.no_autoflush:
+            load_country_geos(geo_session, session)
+        with progress.stage('subdivision1'), session.no_autoflush:
+            load_subdivision1_geos(geo_session, session, sub1keys)
+            update_us_data()
+
+        with TemporaryDirectory(prefix='geo_staging_') as temp_dir:
+            staging_dir = staging_dir or temp_dir
+            with progress.stage('states'):
+                paths = stage_states(sub1keys, staging_dir, processes,
+                                     geo_db_config, out)
+            with progress.stage('merge'):
+                us = Geo['us']
+                merge = StagingMerge(session)
+                for sub1key in sub1keys:
+                    state = us[sub1key.lower()]
+                    inserted = merge.merge(paths[sub1key], scope=state.human_id)
+                    for name, count in inserted.items():
+                        progress.count(name, count)
+                session.expire_all()
+                bulk_insert_mode.sync()
+
+        with progress.stage('cbsa'), session.no_autoflush:
+            load_cbsa_geos(geo_session, session, sub1keys)
+        with progress.stage('manual fixes'), session.no_autoflush:
+            load_manual_fixes(geo_session, session)
+        with progress.stage('timezones'):
+            load_timezones(geo_session, session)
+        with progress.stage('closure'):
+            GeoClosure.rebuild(session)
+        if snapshot_path:
+            with progress.stage('snapshot'):
+                write_snapshot(session, snapshot_path)
+
+    progress.report()
+    return Trackable.catalog_updates()
+
+
+if __name__ == '__main__':
+    from docopt import docopt
+
+    options = docopt(__doc__)
+    processes = options['--processes']
+
+    # Session for geo.db, which contains the geo source data
+    geo_dsm = DataSessionManager(db_config=DevConfig.GEO_DATABASE,
+                                 ModelBases=[BaseGeoDataModel])
+    geo_session = geo_dsm.session
+    extend_declarative_base(BaseGeoDataModel, session=geo_session)
+
+    # Session for main Intertwine db, where geo data is loaded
+    db = Manager(Model=BaseGeoModel, config=DevConfig)
+    session = db.session
+    extend_declarative_base(BaseGeoModel, session=session)
+    db.create_all()
+
+    Trackable.register_existing(session, Geo, GeoData, GeoLevel, GeoID)
+    Trackable.clear_updates()
+
+    load_geos_parallel(geo_session, session,
+                       processes=int(processes) if processes else None,
+                       staging_dir=options['--staging-dir'],
+                       snapshot_path=(options['--snapshot'] or
+                                      DevConfig.GEO_SNAPSHOT_PATH))
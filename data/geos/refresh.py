@@ -0,0 +1,327 @@
+# -*- coding: utf-8 -*-
+"""Refresh geos from a new census extract, applying only the changes"""
+from collections import OrderedDict, namedtuple
+
+from sqlalchemy import or_, orm
+
+from data.geos.geo_data_process import (
+    GHRP_DATA_FIELDS, PREFIXED_GHRP_DATA_FIELDS, define_record,
+    load_state_counties, load_subdivision3_geos, load_place_geos,
+    update_us_data)
+from data.geos.models import GHRP, State
+from intertwine.geos.aggregates import GeoDataAggregates
+from intertwine.geos.closure import GeoClosure
+from intertwine.geos.models import (
+    Geo, GeoData, GeoLevel, GeoID,
+    SUBDIVISION1, SUBDIVISION2, SUBDIVISION3, PLACE, SUBPLACE,
+    CORE_AREA, COMBINED_AREA, FIPS, ANSI)
+from intertwine.utils.space import Area, GeoLocation
+
+GeoDiff = namedtuple('GeoDiff', 'inserts, updates, deletes')
+
+# Levels with data aggregated from children, in order of aggregation,
+# along with the level of the children from which they are aggregated
+AGGREGATE_LEVELS = ((CORE_AREA, SUBDIVISION2), (COMBINED_AREA, CORE_AREA))
+
+
+def incoming_state_data(geo_session, statefps=None):
+    """Return data records for states from GHRP by state fips id"""
+    query = geo_session.query(GHRP).filter(GHRP.sumlev == '040',
+                                           GHRP.geocomp == '00')
+    if statefps:
+        query = query.filter(GHRP.statefp.in_(statefps))
+    return {r.statefp: GeoData.extract_data(r, GHRP_DATA_FIELDS)
+            for r in query}
+
+
+def incoming_county_data(geo_session, statefps=None):
+    """Return data records for counties from GHRP by county fips id"""
+    CountyRecord, columns = define_record(
+        'CountyRecord',
+        'GHRP.countyid, GHRP.p0020001, GHRP.p0020002, '
+        'GHRP.intptlat, GHRP.intptlon, GHRP.arealand, GHRP.areawatr')
+
+    query = geo_session.query(GHRP).filter(GHRP.sumlev == '050',
+                                           GHRP.geocomp == '00')
+    if statefps:
+        query = query.filter(GHRP.statefp.in_(statefps))
+
+    return {r.ghrp_countyid: GeoData.extract_data(r, PREFIXED_GHRP_DATA_FIELDS)
+            for r in (CountyRecord(*record) for record in query.values(*columns))}
+
+
+def incoming_cousub_data(geo_session, statefps=None):
+    """
+    Return data records for cousubs from GHRP by cousub ansi id
+
+    A cousub spanning counties has a record per county, which are
+    aggregated as done by load_subdivision3_geos.
+    """
+    CousubRecord, columns = define_record(
+        'CousubRecord',
+        'GHRP.cousubns, GHRP.p0020001, GHRP.p0020002, '
+        'GHRP.intptlat, GHRP.intptlon, GHRP.arealand, GHRP.areawatr')
+
+    query = geo_session.query(GHRP).filter(GHRP.sumlev == '060',
+                                           GHRP.geocomp == '00',
+                                           GHRP.cousubns != '00000000')
+    if statefps:
+        query = query.filter(GHRP.statefp.in_(statefps))
+
+    aggregates = OrderedDict()
+    for r in (CousubRecord(*record) for record in
+              query.order_by(GHRP.cousubns).values(*columns)):
+        land_area = Area(r.ghrp_arealand, requantize=True)
+        water_area = Area(r.ghrp_areawatr, requantize=True)
+        coordinates = GeoLocation(r.ghrp_intptlat, r.ghrp_intptlon).values
+        aggregate = aggregates.get(r.ghrp_cousubns)
+        if aggregate is not None:
+            total_pop, urban_pop, prior_coordinates, prior_land, prior_water = (
+                aggregate)
+            coordinates = GeoLocation.combine_coordinates(
+                (prior_coordinates, prior_land + prior_water),
+                (coordinates, land_area + water_area))
+            total_pop += r.ghrp_p0020001
+            urban_pop += r.ghrp_p0020002
+            land_area += prior_land
+            water_area += prior_water
+        else:
+            total_pop, urban_pop = r.ghrp_p0020001, r.ghrp_p0020002
+        aggregates[r.ghrp_cousubns] = (
+            total_pop, urban_pop, coordinates, land_area, water_area)
+
+    return {cousubns: GeoData.Record(total_pop, urban_pop,
+                                     *GeoLocation(*coordinates),
+                                     land_area, water_area)
+            for cousubns, (total_pop, urban_pop, coordinates,
+                           land_area, water_area) in aggregates.items()}
+
+
+def incoming_place_data(geo_session, statefps=None):
+    """
+    Return data records for places from GHRP by place fips id
+
+    A place spanning counties or cousubs has a record per county/cousub,
+    which are aggregated as done by load_place_geos.
+    """
+    PlaceRecord, columns = define_record(
+        'PlaceRecord',
+        'GHRP.placeid, GHRP.p0020001, GHRP.p0020002, '
+        'Place.intptlat, Place.intptlong, GHRP.arealand, GHRP.areawatr')
+
+    query = (geo_session.query(GHRP)
+                        .outerjoin(GHRP.place)
+                        .filter(GHRP.sumlev == '070', GHRP.geocomp == '00',
+                                GHRP.cousubns != '00000000',
+                                GHRP.placens != '99999999'))
+    if statefps:
+        query = query.filter(GHRP.statefp.in_(statefps))
+
+    aggregates = OrderedDict()
+    for r in (PlaceRecord(*record) for record in
+              query.order_by(GHRP.placeid).values(*columns)):
+        total_pop, urban_pop, land_area, water_area = aggregates.get(
+            r.ghrp_placeid, (0, 0, 0, 0))[:4]
+        aggregates[r.ghrp_placeid] = (
+            total_pop + r.ghrp_p0020001,
+            urban_pop + r.ghrp_p0020002,
+            land_area + Area(r.ghrp_arealand, requantize=True),
+            water_area + Area(r.ghrp_areawatr, requantize=True),
+            GeoLocation(r.place_intptlat, r.place_intptlong).coordinates)
+
+    return {placeid: GeoData.Record(total_pop, urban_pop, latitude, longitude,
+                                    land_area, water_area)
+            for placeid, (total_pop, urban_pop, land_area, water_area,
+                          (latitude, longitude)) in aggregates.items()}
+
+
+def existing_levels(session, standard, levels, sub1keys=None):
+    """
+    Return existing geo levels by code for the given standard
+
+    I/O:
+    session: sqlalchemy session for Intertwine database
+    standard: standard of the geo ids by which levels are returned
+    levels: sequence of levels to be returned
+    sub1keys=None: sequence of state abbrevs to scope the levels
+    """
+    query = (session.query(GeoID)
+                    .join(GeoLevel, GeoID.level)
+                    .join(Geo, GeoLevel._geo)
+                    .filter(GeoID.standard == standard,
+                            GeoLevel.level.in_(levels))
+                    .options(orm.contains_eager(GeoID.level)
+                                .contains_eager(GeoLevel._geo)
+                                .joinedload(Geo._data)))
+    if sub1keys:
+        state_human_ids = [Geo['us'][k.lower()].human_id for k in sub1keys]
+        query = query.filter(or_(*(
+            criterion for human_id in state_human_ids for criterion in
+            (Geo.human_id == human_id, Geo.human_id.like(human_id + '/%')))))
+    return {geoid.code: geoid.level for geoid in query}
+
+
+def diff_geos(incoming, existing):
+    """
+    Diff geos
+
+    Compare incoming data records with existing geo levels, both keyed
+    by code, and return a GeoDiff of the codes to be inserted, the
+    (level, record) pairs whose data is to be updated, and the levels
+    to be deleted.
+    """
+    inserts = sorted(incoming.keys() - existing.keys())
+    updates = [(existing[code], incoming[code])
+               for code in sorted(incoming.keys() & existing.keys())
+               if existing[code].geo.data is None or
+               not existing[code].geo.data.matches(**incoming[code]._asdict())]
+    deletes = [existing[code]
+               for code in sorted(existing.keys() - incoming.keys())]
+    return GeoDiff(inserts, updates, deletes)
+
+
+def update_geo_data(geo, record):
+    """Update geo data from record, creating it if necessary"""
+    if geo.data is None:
+        GeoData(geo=geo, **record._asdict())
+        return
+    for field, value in record._asdict().items():
+        setattr(geo.data, field, value)
+
+
+def delete_geo_level(geo_level):
+    """
+    Delete geo level along with its ids
+
+    If the geo has no other levels, delete the geo and its data too,
+    along with any aliases targeting only the geo.
+    """
+    geo = geo_level.geo
+    for geoid in tuple(geo_level.ids.values()):
+        geoid.deregister()
+    geo_level.deregister()
+    del geo.levels[geo_level.level]  # Orphaned level and ids deleted
+
+    if geo.levels:
+        return
+    for alias in tuple(geo.aliases):
+        if list(alias.alias_targets) == [geo]:
+            alias.destroy()
+    if geo.data is not None:
+        geo.data.destroy()
+    geo.destroy()
+
+
+def aggregate_parents(geos, level=AGGREGATE_LEVELS[0][0]):
+    """Return the parents of the geos at the given aggregate level"""
+    return {parent for geo in geos for parent in geo.parents
+            if parent.levels.get(level) is not None}
+
+
+def refresh_aggregate_data(session, geos):
+    """
+    Refresh aggregate data
+
+    Recompute the data of the given CBSAs from their children and then
+    of their CSA parents, each level in a batch, and return the set of
+    ids of the geos refreshed.
+    """
+    refreshed = set()
+    for i, (level, child_level) in enumerate(AGGREGATE_LEVELS):
+        if i:
+            geos = aggregate_parents(geos, level)
+        refreshed.update(GeoDataAggregates.refresh(
+            session, level, child_level, parent_ids=[geo.id for geo in geos]))
+    return refreshed
+
+
+def refresh_geos(geo_session, session, sub1keys=None, dry_run=False,
+                 out=print):
+    """
+    Refresh geos
+
+    Compare the census records in the geo database with the geos in the
+    Intertwine database (via GeoID codes) and apply only the changes:
+    data is updated for geos whose data differs, geos are inserted for
+    new records via the loaders scoped to them, and levels are deleted
+    for records no longer present, along with their geos if no levels
+    remain. Closure rows affected by these changes are refreshed once
+    they have all been applied. The data of the US and of CBSAs and CSAs
+    is then recomputed, but only if aggregated from states/counties that
+    changed.
+
+    States are only updated, as inserting or deleting them requires a
+    full load. Likewise, new counties are not added to CBSAs, and
+    renames are not detected.
+
+    I/O:
+    geo_session: sqlalchemy session for geo database of US census data
+    session: sqlalchemy session for Intertwine database
+    sub1keys=None: sequence of state abbrevs to scope the refresh
+    dry_run=False: if True, report the changes without applying them
+    return: ordered dictionary of GeoDiffs keyed by level
+    """
+    statefps = ({State.get_by('stusps', k).statefp for k in sub1keys}
+                if sub1keys else None)
+
+    diffs = OrderedDict((
+        (SUBDIVISION1, diff_geos(
+            incoming_state_data(geo_session, statefps),
+            existing_levels(session, FIPS, [SUBDIVISION1], sub1keys))),
+        (SUBDIVISION2, diff_geos(
+            incoming_county_data(geo_session, statefps),
+            existing_levels(session, FIPS, [SUBDIVISION2], sub1keys))),
+        (SUBDIVISION3, diff_geos(
+            incoming_cousub_data(geo_session, statefps),
+            existing_levels(session, ANSI, [SUBDIVISION3], sub1keys))),
+        (PLACE, diff_geos(
+            incoming_place_data(geo_session, statefps),
+            existing_levels(session, FIPS, [PLACE, SUBPLACE], sub1keys))),
+    ))
+
+    out('Geo refresh:')
+    for level, diff in diffs.items():
+        out('\t{level:<16} {inserts:>8,} inserts {updates:>8,} updates '
+            '{deletes:>8,} deletes'.format(
+                level=level, inserts=len(diff.inserts),
+                updates=len(diff.updates), deletes=len(diff.deletes)))
+    if dry_run:
+        return diffs
+
+    # Refresh the closure rows affected once all changes are flushed
+    with GeoClosure.deferred(session, refresh=True):
+        stale_aggregates = set()
+        for level, diff in diffs.items():
+            for geo_level, record in diff.updates:
+                update_geo_data(geo_level.geo, record)
+                if level == SUBDIVISION2:
+                    stale_aggregates |= aggregate_parents([geo_level.geo])
+
+        # Delete bottom up so parents outlive their children
+        for level in (PLACE, SUBDIVISION3, SUBDIVISION2):
+            for geo_level in diffs[level].deletes:
+                if level == SUBDIVISION2:
+                    stale_aggregates |= aggregate_parents([geo_level.geo])
+                delete_geo_level(geo_level)
+
+        inserts = diffs[SUBDIVISION2].inserts
+        if inserts:
+            load_state_counties(geo_session, session, sub1keys,
+                                countyids=inserts)
+        inserts = diffs[SUBDIVISION3].inserts
+        if inserts:
+            load_subdivision3_geos(geo_session, session, sub1keys,
+                                   cousubkeys=inserts)
+        inserts = diffs[PLACE].inserts
+        if inserts:
+            load_place_geos(geo_session, session, sub1keys, placeids=inserts)
+
+    refreshed = refresh_aggregate_data(session, stale_aggregates)
+    if diffs[SUBDIVISION1].updates:
+        update_us_data()
+        refreshed.add(Geo['us'].id)
+    out('\tRefreshed aggregate data for {:,} geos'.format(len(refreshed)))
+    resolved = GeoData.resolve_timezones(session)
+    out('\tResolved timezones for {:,} geos'.format(resolved))
+
+    return diffs
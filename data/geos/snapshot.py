@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Write geo snapshot files and validate them against the database
+
+Usage:
+    snapshot.py write [<path>]
+    snapshot.py validate [<path>]
+
+Options:
+    -h --help               This message
+
+The path defaults to GEO_SNAPSHOT_PATH of DevConfig.
+"""
+import sys
+
+from alchy import Manager
+from alchy.model import extend_declarative_base
+
+from config import DevConfig
+from data.geos.geo_data_process import write_snapshot
+from intertwine.geos.models import BaseGeoModel
+from intertwine.geos.snapshot import GeoSnapshot
+
+
+def validate_snapshot(session, snapshot_path):
+    """Validate geo snapshot file against the database"""
+    snapshot = GeoSnapshot.load(snapshot_path)
+    errors = snapshot.validate(session)
+    for error in errors:
+        print(error)
+    print('Snapshot of {:,} geos at {} is {}'.format(
+        len(snapshot), snapshot_path, 'invalid' if errors else 'valid'))
+    return not errors
+
+
+if __name__ == '__main__':
+    from docopt import docopt
+
+    options = docopt(__doc__)
+    snapshot_path = options['<path>'] or DevConfig.GEO_SNAPSHOT_PATH
+    if not snapshot_path:
+        sys.exit('No snapshot path provided or configured')
+
+    db = Manager(Model=BaseGeoModel, config=DevConfig)
+    session = db.session
+    extend_declarative_base(BaseGeoModel, session=session)
+
+    if options['write']:
+        write_snapshot(session, snapshot_path)
+    elif not validate_snapshot(session, snapshot_path):
+        sys.exit(1)
@@ -19,6 +19,8 @@ intertwine_db = Manager(Model=IntertwineModel)
 extend_declarative_base(IntertwineModel, session=intertwine_db.session)
 
 from . import auth, communities, content, geos, main, problems, signup  # noqa
+from .utils.response_cache import response_cache  # noqa
+from .utils.versions import shared_versions  # noqa
 
 IntertwineModel.initialize_table_model_map()
 
@@ -49,6 +51,13 @@ def create_app(name=None, config=None):
     #     from flask_debugtoolbar import DebugToolbarExtension
     #     toolbar = DebugToolbarExtension()
 
+    shared_versions.configure(
+        enabled=app.config.get('SHARED_VERSIONS_ENABLED'),
+        interval=app.config.get('SHARED_VERSIONS_INTERVAL'))
+    response_cache.configure(size=app.config.get('RESPONSE_CACHE_SIZE'),
+                             ttl=app.config.get('RESPONSE_CACHE_TTL'),
+                             session=intertwine_db.session)
+
     # TODO: replace with Bootstrap 4
     Bootstrap(app)
 
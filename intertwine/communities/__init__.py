@@ -4,6 +4,7 @@ from alchy import Manager
 from alchy.model import extend_declarative_base
 
 from . import models
+from . import stats  # noqa: F401 (maintains community stats table on flush)
 
 
 blueprint = Blueprint(models.Community.blueprint_name(), __name__,
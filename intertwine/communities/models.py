@@ -4,10 +4,12 @@ from collections import namedtuple
 from itertools import groupby
 from operator import attrgetter
 
-from sqlalchemy import Column, ForeignKey, Index, desc, orm, types
+from sqlalchemy import Column, ForeignKey, Index, Table, desc, or_, orm, types
 from sqlalchemy.orm.exc import DetachedInstanceError
 
 from intertwine import IntertwineModel
+from intertwine.geos.closure import GeoClosure
+from intertwine.geos.models import Geo
 from intertwine.problems.exceptions import InvalidAggregation
 from intertwine.problems.models import (
     AggregateProblemConnectionRating as APCR,
@@ -17,11 +19,23 @@ from intertwine.problems.models import (
 from intertwine.trackable.exceptions import KeyMissingFromRegistryAndDatabase
 from intertwine.utils.jsonable import JsonProperty
 from intertwine.utils.structures import PeekableIterator
-from intertwine.utils.vardygr import vardygrify
+from intertwine.utils.vardygr import vardygrify, vardygrify_many
 
 BaseCommunityModel = IntertwineModel
 
 
+community_stats_table = Table(
+    'community_stats', BaseCommunityModel.metadata,
+    Column('community_id', types.Integer, ForeignKey('community.id'),
+           primary_key=True),
+    Column('num_followers', types.Integer, nullable=False),
+    Column('significance', types.Float, nullable=False),
+    Column('num_ratings', types.Integer, nullable=False),
+    Column('num_aggregate_ratings', types.Integer, nullable=False),
+    Column('last_activity', types.DateTime()),  # UTC
+)
+
+
 class Community(BaseCommunityModel):
     """Base class for communities
 
@@ -40,6 +54,11 @@ class Community(BaseCommunityModel):
 
     ALPHABETIZE_UNRATED_CONNECTIONS = False  # Adds overhead when True
 
+    # Fields of vardygr aggregate ratings furnished for unrated connections
+    UNRATED_AGGREGATE_RATING_FIELDS = ('community', 'connection',
+                                       'connection_category', 'aggregation',
+                                       'rating', 'weight')
+
     problem_id = Column(types.Integer, ForeignKey('problem.id'))
     _problem = orm.relationship('Problem', lazy='joined')
 
@@ -123,7 +142,12 @@ class Community(BaseCommunityModel):
     @property
     def significance(self):
         """Float reflecting a community's importance; minimum 1"""
-        return math.log((self.num_followers or 0) + 1) + 1
+        return self.calculate_significance(self.num_followers)
+
+    @classmethod
+    def calculate_significance(cls, num_followers):
+        """Calculate significance given number of followers"""
+        return math.log((num_followers or 0) + 1) + 1
 
     # Querying use cases:
     #
@@ -178,9 +202,23 @@ class Community(BaseCommunityModel):
 
     @classmethod
     def manifest(cls, problem_huid, org_huid, geo_huid):
-        """Manifest community, either real or vardygr"""
+        """
+        Manifest community, either real or vardygr
+
+        The geo is resolved via Geo.resolve_human_id, such that the
+        community of an alias is that of its alias target.
+        """
         # Raise if any human ids don't exist
-        key = cls.reconstruct((problem_huid, org_huid, geo_huid), as_key=True)
+        problem = Problem[Problem.create_key(human_id=problem_huid)]
+        geo = None
+        if geo_huid:
+            resolution = Geo.resolve_human_id(geo_huid)
+            if resolution is None:
+                raise KeyMissingFromRegistryAndDatabase(key=Geo.Key(geo_huid))
+            if resolution.is_alias:
+                resolution = Geo.resolve_human_id(resolution.human_id)
+            geo = Geo.query.get(resolution.geo_id)
+        key = cls.create_key(problem, org_huid, geo)
         try:
             return cls[key]
         except KeyMissingFromRegistryAndDatabase:
@@ -194,39 +232,117 @@ class Community(BaseCommunityModel):
         self.num_followers = num_followers
 
     def update_inclusive_aggregate_ratings(self, connection, user,
-                                           new_user_rating,
-                                           old_user_rating=None):
+                                           new_user_rating, new_user_weight,
+                                           old_user_rating=None,
+                                           old_user_weight=None, rating=None):
         """
         Update inclusive aggregate ratings
 
-        Update aggregate ratings for the current community and recurse
-        on immediately encompassing communities.
+        Apply a rating change to the inclusive aggregate ratings of the
+        current community and all encompassing communities, i.e. those
+        with the same problem and org whose geo is above the current
+        community's geo in the geo hierarchy, or is None (the world).
+        Each encompassing community is updated once, even if its geo is
+        reachable via multiple paths (e.g. place -> county -> state and
+        place -> state). Only communities with materialized inclusive
+        aggregate ratings are updated, found in a single query via the
+        geo closure table.
         """
-        # TODO
-        pass
+        problem, org, geo = self.derive_key()
+        communities = (
+            Community.query.filter_by(problem=problem, org=org)
+                           .filter(Community.aggregate_ratings.any(
+                               aggregation=APCR.INCLUSIVE)))
+        if geo is None:
+            communities = communities.filter(Community.geo_id.is_(None))
+        else:
+            communities = communities.filter(or_(
+                Community.geo_id == geo.id,
+                Community.geo_id.in_(GeoClosure.select_ancestor_ids(geo.id)),
+                Community.geo_id.is_(None)))
+
+        for community in communities:
+            community.apply_aggregate_rating_change(
+                connection=connection, aggregation=APCR.INCLUSIVE,
+                new_user_rating=new_user_rating,
+                new_user_weight=new_user_weight,
+                old_user_rating=old_user_rating,
+                old_user_weight=old_user_weight, rating=rating)
 
     def update_aggregate_ratings(self, connection, user,
                                  new_user_rating, new_user_weight,
-                                 old_user_rating=None, old_user_weight=None):
+                                 old_user_rating=None, old_user_weight=None,
+                                 rating=None):
         """
         Update aggregate ratings
 
         Given a connection, a user, and new/old rating & weight values,
         update all affected aggregate ratings. Intended to be called in
         conjunction with or shortly after the rating has been updated.
+        May be called on a vardygr community, in which case only the
+        inclusive aggregate ratings of encompassing communities that
+        exist are updated.
         """
         # Update the strict aggregate rating for this community
-        apcr = APCR.query.filter_by(community=self, connection=connection,
-                                    aggregation='strict').first()
+        if type(self) is Community:
+            self.apply_aggregate_rating_change(
+                connection=connection, aggregation=APCR.STRICT,
+                new_user_rating=new_user_rating,
+                new_user_weight=new_user_weight,
+                old_user_rating=old_user_rating,
+                old_user_weight=old_user_weight, rating=rating)
+
+        # Update inclusive aggregate ratings in encompassing communities
+        self.update_inclusive_aggregate_ratings(
+            connection=connection, user=user,
+            new_user_rating=new_user_rating, new_user_weight=new_user_weight,
+            old_user_rating=old_user_rating, old_user_weight=old_user_weight,
+            rating=rating)
+
+    def apply_aggregate_rating_change(self, connection, aggregation,
+                                      new_user_rating, new_user_weight,
+                                      old_user_rating=None,
+                                      old_user_weight=None, rating=None):
+        """
+        Apply aggregate rating change
+
+        Apply a rating change to the community's aggregate rating for
+        the connection and aggregation. If the community's aggregate
+        ratings for the aggregation have been materialized but there is
+        none yet for the connection, it is created from the other
+        included ratings plus the change, so reads need not aggregate.
+        Otherwise, aggregation is left to the first read.
+
+        I/O:
+        connection: ProblemConnection instance
+        aggregation: 'strict' or 'inclusive'
+        new_user_rating/new_user_weight: new rating values
+        old_user_rating=None/old_user_weight=None: prior rating values
+        rating=None: changed ProblemConnectionRating instance, excluded
+            from other included ratings if an aggregate rating is created
+        """
+        apcrs = APCR.query.filter_by(community=self, aggregation=aggregation)
+        apcr = apcrs.filter_by(connection=connection).first()
         if apcr:
             apcr.update_values(new_user_rating=new_user_rating,
                                new_user_weight=new_user_weight,
                                old_user_rating=old_user_rating,
                                old_user_weight=old_user_weight)
-        # Update inclusive aggregate ratings in encompassing communities
-        self.update_inclusive_aggregate_ratings(
-            connection=connection, user=user,
-            new_user_rating=new_user_rating, old_user_rating=old_user_rating)
+            return apcr
+
+        if not apcrs.first():
+            return None
+
+        others = [r for r in APCR.query_ratings(connection, self, aggregation)
+                  if r is not rating]
+        agg_rating, agg_weight = APCR.calculate_values(others)
+        apcr = APCR(community=self, connection=connection,
+                    aggregation=aggregation, rating=agg_rating,
+                    weight=agg_weight)
+        apcr.update_values(new_user_rating=new_user_rating,
+                           new_user_weight=new_user_weight)
+        self.session().add(apcr)
+        return apcr
 
     def aggregate_connection_ratings(self, aggregation='strict'):
         """
@@ -243,11 +359,18 @@ class Community(BaseCommunityModel):
         community_key = self.derive_key()
         problem, org, geo = community_key
 
-        if aggregation not in ('strict'):
+        if aggregation not in APCR.AGGREGATIONS:
             raise InvalidAggregation(aggregation=aggregation)
 
-        pcrs = (PCR.query.filter_by(problem=problem, org=org, geo=geo)
+        pcrs = (PCR.query.filter_by(problem=problem, org=org)
                          .order_by(PCR.connection_category, PCR.connection_id))
+        if aggregation == APCR.STRICT:
+            pcrs = pcrs.filter_by(geo=geo)
+        elif geo is not None:
+            # Inclusive: ratings within the geo or any geo below it
+            pcrs = pcrs.filter(or_(
+                PCR.geo_id == geo.id,
+                PCR.geo_id.in_(GeoClosure.select_descendant_ids(geo.id))))
         pcrs = PeekableIterator(pcrs)
         # Create and persist a community only if necessary
         if not isinstance(self, Community) and pcrs.has_next():
@@ -317,21 +440,19 @@ class Community(BaseCommunityModel):
         else:
             connections = getattr(problem, category)
 
-        for connection in connections:
-            if connection not in rated_connections:
-                aggregate_rating = vardygrify(APCR,
-                                              community=self,
-                                              connection=connection,
-                                              connection_category=connection.derive_category(problem),
-                                              aggregation=aggregation,
-                                              rating=APCR.NO_RATING,
-                                              weight=APCR.NO_WEIGHT)
+        unrated_aggregate_ratings = vardygrify_many(
+            APCR,
+            ((self, connection, connection.derive_category(problem), aggregation,
+              APCR.NO_RATING, APCR.NO_WEIGHT)
+             for connection in connections if connection not in rated_connections),
+            fields=self.UNRATED_AGGREGATE_RATING_FIELDS)
 
-                key = aggregate_rating.json_key(**json_kwargs)
-                if depth > 1 and (nest or key not in _json):
-                    jsonified = aggregate_rating.jsonify(depth=depth - 1, **json_kwargs)
+        for aggregate_rating in unrated_aggregate_ratings:
+            key = aggregate_rating.json_key(**json_kwargs)
+            if depth > 1 and (nest or key not in _json):
+                jsonified = aggregate_rating.jsonify(depth=depth - 1, **json_kwargs)
 
-                yield jsonified if depth > 1 and nest else key
+            yield jsonified if depth > 1 and nest else key
 
     def jsonify_aggregate_ratings(self, aggregation='strict', depth=1,
                                   _path=None, **json_kwargs):
@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+from collections import OrderedDict, namedtuple
+
+from sqlalchemy import desc
+
+from intertwine.problems.models import (
+    AggregateProblemConnectionRating as APCR,
+    ProblemConnection as PC,
+    ProblemConnectionRating as PCR,
+    Problem)
+from intertwine.utils.analytics import symmetric_ratings
+from intertwine.utils.vardygr import vardygrify_many
+from .models import Community, community_stats_table
+
+
+class ProblemNetwork:
+    """
+    Problem Network
+
+    Assembles the problem network for a geo: every problem's community
+    in the geo, each with its aggregate ratings by connection category,
+    including symmetric ratings. The JSON has the same shape as
+    jsonifying each community with the problem network config, but is
+    assembled from a fixed number of queries rather than several per
+    community and per aggregate rating:
+
+    - communities in the geo (with significance from community stats)
+    - all problems
+    - all connections
+    - all aggregate ratings in the geo (indexed by community problem,
+      community org and connection)
+    - which problems/orgs in the geo have ratings (to detect
+      communities whose aggregate ratings have not been materialized)
+
+    Adjacent communities are derived from the in-memory index and
+    symmetric ratings are computed for the entire network in a single
+    vectorized pass once all aggregate ratings are jsonified.
+    Communities with ratings but no aggregate ratings are aggregated on
+    first render, as with jsonify.
+
+    I/O:
+    geo: Geo instance or None (global)
+    org=None: org for communities that do not yet exist
+    aggregation='strict': aggregation of the aggregate ratings
+    """
+    Rating = namedtuple('ProblemNetworkRating',
+                        'connection_id, category, rating')
+
+    def jsonify(self):
+        """Return problem network JSON, keyed by community with root"""
+        self.load()
+        self.pending_symmetric_ratings = []
+        rv = OrderedDict()
+        for community in self.communities:
+            rv[community.json_key()] = self.jsonify_community(community)
+        rv['root'] = list(rv)
+        self.derive_symmetric_ratings()
+        return rv
+
+    def load(self):
+        """Load communities, problems, connections and ratings"""
+        geo = self.geo
+        stats = community_stats_table.c
+        rows = (Community.query.filter_by(geo=geo)
+                               .outerjoin(community_stats_table,
+                                          stats.community_id == Community.id)
+                               .add_columns(stats.significance)
+                               .all())
+        communities = [community for community, significance in rows]
+        self.significances = {(c.problem_id, c.org): significance
+                              for c, significance in rows if significance is not None}
+        community_problem_ids = {c.problem_id for c in communities}
+        # In the future, consider filtering based on activity metrics
+        self.problems = OrderedDict((p.id, p) for p in Problem.query.all())
+        communities.extend(vardygrify_many(
+            Community,
+            ((p, self.org, geo, 0) for p in self.problems.values()
+             if p.id not in community_problem_ids),
+            fields=('problem', 'org', 'geo', 'num_followers')))
+        self.communities = communities
+        self.real_communities = {(c.problem_id, c.org): c for c in communities
+                                 if type(c) is Community}
+
+        self.connections = OrderedDict((c.id, c) for c in PC.query.order_by(PC.id))
+        self.categorized = {}  # (problem id, category): [connection]
+        for connection in self.connections.values():
+            for category in self.categories(connection):
+                # e.g. drivers of a problem are connections where it is the impact
+                problem_id = getattr(
+                    connection, PC.CATEGORY_MAP[category].inverse_component_id)
+                self.categorized.setdefault((problem_id, category), []).append(connection)
+
+        self.ratings = {}  # (problem id, org): [Rating], by category/rating
+        self.rating_index = {}  # (problem id, org, connection id): rating
+        geo_id = geo.id if geo else None
+        rows = (APCR.query.join(APCR.community)
+                          .filter(Community.geo_id == geo_id,
+                                  APCR.aggregation == self.aggregation)
+                          .with_entities(Community.problem_id, Community.org,
+                                         APCR.connection_id,
+                                         APCR.connection_category,
+                                         APCR.rating)
+                          .order_by(APCR.connection_category, desc(APCR.rating),
+                                    APCR.id))
+        for problem_id, org, connection_id, category, rating in rows:
+            self.add_rating(problem_id, org, connection_id, category, rating)
+
+        self.materialize()
+
+    def materialize(self):
+        """Aggregate ratings for communities not yet materialized"""
+        geo = self.geo
+        rated = set(PCR.query.filter_by(geo=geo)
+                             .with_entities(PCR.problem_id, PCR.org).distinct())
+        for community in self.communities:
+            key = (community.problem.id, community.org)
+            if key not in rated or key in self.ratings:
+                continue
+            apcrs = community.aggregate_connection_ratings(self.aggregation)
+            apcrs.sort(key=lambda apcr: (apcr.connection_category, -apcr.rating))
+            for apcr in apcrs:
+                self.add_rating(*key, apcr.connection_id, apcr.connection_category,
+                                apcr.rating)
+            if apcrs:
+                self.real_communities[key] = apcrs[0].community
+
+    def add_rating(self, problem_id, org, connection_id, category, rating):
+        self.ratings.setdefault((problem_id, org), []).append(
+            self.Rating(connection_id, category, rating))
+        self.rating_index[(problem_id, org, connection_id)] = rating
+
+    def jsonify_community(self, community):
+        """Jsonify community in the problem network"""
+        problem = community.problem
+        return OrderedDict((
+            ('name', community.name),
+            ('problem', OrderedDict((('name', problem.name),
+                                     ('uri', problem.uri)))),
+            ('num_followers', community.num_followers),
+            ('aggregate_ratings', self.jsonify_aggregate_ratings(community)),
+            ('significance', self.significance(problem.id, community.org)),
+        ))
+
+    def jsonify_aggregate_ratings(self, community):
+        """Jsonify aggregate ratings by connection category"""
+        problem_id, org = community.problem.id, community.org
+        rv = OrderedDict()
+        rated_connection_ids = set()
+        for rating in self.ratings.get((problem_id, org), ()):
+            rated_connection_ids.add(rating.connection_id)
+            rv.setdefault(rating.category, []).append(self.jsonify_rating(
+                community, rating.connection_id, rating.rating))
+
+        for category in PC.CATEGORY_MAP:
+            category_json = rv.setdefault(category, [])
+            for connection in self.categorized.get((problem_id, category), ()):
+                if connection.id not in rated_connection_ids:
+                    category_json.append(self.jsonify_rating(
+                        community, connection.id, APCR.NO_RATING))
+        return rv
+
+    def jsonify_rating(self, community, connection_id, rating):
+        """Jsonify aggregate rating, queueing its symmetric rating"""
+        connection = self.connections[connection_id]
+        problem_id, org = community.problem.id, community.org
+        adjacent_problem_id = (connection.problem_b_id
+                               if connection.problem_a_id == problem_id
+                               else connection.problem_a_id)
+        adjacent_problem = self.problems[adjacent_problem_id]
+        adjacent_community_url = Community.form_uri(Community.Key(
+            problem=adjacent_problem, org=org, geo=community.geo))
+
+        rv = OrderedDict((
+            ('rating', rating),
+            ('adjacent_community_url', adjacent_community_url),
+            ('adjacent_problem_name', adjacent_problem.name),
+            ('symmetric_rating', None),  # Derived in derive_symmetric_ratings
+        ))
+        reverse_rating = self.rating_index.get(
+            (adjacent_problem_id, org, connection_id), APCR.NO_RATING)
+        self.pending_symmetric_ratings.append((
+            rv,
+            (rating, self.significance(problem_id, org)),
+            (reverse_rating, self.significance(adjacent_problem_id, org))))
+        return rv
+
+    def derive_symmetric_ratings(self):
+        """
+        Derive symmetric ratings
+
+        Mirrors APCR.symmetric_rating for all queued aggregate ratings
+        at once: if the reverse aggregate rating is missing or unrated,
+        use the rating; if the rating is unrated, use the reverse;
+        otherwise, average them, weighted by their respective
+        community's significance (unweighted if both are 0).
+        """
+        pending = self.pending_symmetric_ratings
+        if not pending:
+            return
+        rating_jsons, forward, reverse = zip(*pending)
+        derived = symmetric_ratings(forward, reverse, no_rating=APCR.NO_RATING)
+        for rating_json, symmetric_rating in zip(rating_jsons, derived.tolist()):
+            rating_json['symmetric_rating'] = (
+                APCR.NO_RATING if symmetric_rating == APCR.NO_RATING
+                else symmetric_rating)
+        self.pending_symmetric_ratings = []
+
+    def significance(self, problem_id, org):
+        """Return significance of community, defaulting to 1.0 if not real"""
+        key = (problem_id, org)
+        significance = self.significances.get(key)
+        if significance is not None:
+            return significance
+        # Communities created since stats were read (or not yet refreshed)
+        community = self.real_communities.get(key)
+        return (community.significance if community
+                else Community.calculate_significance(0))
+
+    @staticmethod
+    def categories(connection):
+        """Yield categories in which connection appears"""
+        if connection.axis == PC.CAUSAL:
+            yield from (PC.DRIVERS, PC.IMPACTS)
+        else:
+            yield from (PC.BROADER, PC.NARROWER)
+
+    def __init__(self, geo, org=None, aggregation=APCR.STRICT):
+        self.geo = geo
+        self.org = org
+        self.aggregation = aggregation
+        self.significances = {}  # (problem id, org): significance
+        self.pending_symmetric_ratings = []
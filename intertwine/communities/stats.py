@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import datetime
+from itertools import islice
+
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session, attributes
+
+from intertwine.problems.models import (
+    AggregateProblemConnectionRating as APCR,
+    ProblemConnectionRating as PCR)
+from intertwine.utils.response_cache import response_cache
+from .models import Community, community_stats_table
+
+
+class CommunityStats:
+    """
+    Community Stats
+
+    Maintains the community stats table, which denormalizes per
+    community aggregates so they need not be computed on every read:
+    number of followers, significance (derived from followers), number
+    of ratings (within the community's problem, org and geo), number of
+    aggregate ratings and time of last activity (UTC).
+
+    Rows are maintained on flush. A community's row is refreshed when it
+    is created, when its followers change, when ratings within it are
+    added, changed or deleted, or when its aggregate ratings are created
+    or deleted. Follower and rating changes count as activity; creating
+    or deleting aggregate ratings does not, as they are materialized on
+    read.
+
+    Stats for many communities are read in a single query:
+
+        stats = CommunityStats.get_many(session, community_ids)
+
+    Bulk loads should defer maintenance and rebuild the table once:
+
+        with CommunityStats.deferred(session):
+            load_communities(...)
+        CommunityStats.rebuild(session)
+    """
+    CHUNK_SIZE = 500  # Max ids per IN clause
+
+    PENDING_TAG = 'community_stats_pending'
+    DEFERRED_TAG = 'community_stats_deferred'
+
+    Pending = namedtuple('CommunityStatsPending',
+                         'communities, active_communities, rating_keys, '
+                         'deleted_ids')
+
+    Stats = namedtuple('CommunityStatsRow',
+                       'community_id, num_followers, significance, num_ratings, '
+                       'num_aggregate_ratings, last_activity')
+
+    table = community_stats_table
+
+    @classmethod
+    def default(cls, community_id=None):
+        """Return stats for a community without followers or ratings"""
+        return cls.Stats(community_id=community_id, num_followers=0,
+                         significance=Community.calculate_significance(0),
+                         num_ratings=0, num_aggregate_ratings=0,
+                         last_activity=None)
+
+    @classmethod
+    def get_many(cls, session, community_ids):
+        """
+        Get many
+
+        I/O:
+        session: session on which to execute
+        community_ids: iterable of community ids
+        return: dict of community ids to Stats namedtuples; communities
+            without stats rows are omitted
+        """
+        c = cls.table.c
+        stats = {}
+        for chunk in cls._chunk(set(community_ids)):
+            rows = session.execute(
+                select([c.community_id, c.num_followers, c.significance,
+                        c.num_ratings, c.num_aggregate_ratings, c.last_activity])
+                .where(c.community_id.in_(chunk)))
+            stats.update((row[0], cls.Stats(*row)) for row in rows)
+        return stats
+
+    @classmethod
+    @contextmanager
+    def deferred(cls, session):
+        """Context manager deferring stats maintenance for session"""
+        prior_deferred = session.info.get(cls.DEFERRED_TAG, False)
+        session.info[cls.DEFERRED_TAG] = True
+        try:
+            yield
+        finally:
+            session.info[cls.DEFERRED_TAG] = prior_deferred
+            session.info.pop(cls.PENDING_TAG, None)
+
+    @classmethod
+    def rebuild(cls, session):
+        """Rebuild the entire stats table, retaining last activity"""
+        session.flush()
+        community_ids = [community_id for community_id,
+                         in session.execute(select([Community.id]))]
+        cls.refresh(session, community_ids)
+        c = cls.table.c
+        session.execute(cls.table.delete().where(
+            ~c.community_id.in_(select([Community.id]))))
+
+    @classmethod
+    def refresh(cls, session, community_ids=(), active_ids=(), deleted_ids=()):
+        """
+        Refresh stats rows
+
+        I/O:
+        session: session on which to execute
+        community_ids=(): ids of communities whose rows are refreshed
+        active_ids=(): ids of communities whose rows are refreshed and
+            whose last activity is set to now
+        deleted_ids=(): ids of deleted communities, whose rows are removed
+        """
+        active_ids = set(active_ids) - set(deleted_ids)
+        community_ids = (set(community_ids) | active_ids) - set(deleted_ids)
+        c = cls.table.c
+
+        last_activity = {}
+        for chunk in cls._chunk(community_ids - active_ids):
+            last_activity.update(tuple(row) for row in session.execute(
+                select([c.community_id, c.last_activity])
+                .where(c.community_id.in_(chunk))))
+        now = datetime.utcnow()
+        last_activity.update((community_id, now) for community_id in active_ids)
+
+        for chunk in cls._chunk(set(deleted_ids) | community_ids):
+            session.execute(cls.table.delete().where(c.community_id.in_(chunk)))
+
+        communities = {}  # id: (problem id, org, geo id, num followers)
+        for chunk in cls._chunk(community_ids):
+            for community_id, *values in session.execute(
+                    select([Community.id, Community.problem_id, Community._org,
+                            Community.geo_id, Community.num_followers])
+                    .where(Community.id.in_(chunk))):
+                communities[community_id] = values
+
+        num_ratings = {}  # (problem id, org, geo id): count
+        problem_ids = {problem_id for problem_id, org, geo_id, num_followers
+                       in communities.values()}
+        for chunk in cls._chunk(problem_ids):
+            for problem_id, org, geo_id, count in session.execute(
+                    select([PCR.problem_id, PCR.org, PCR.geo_id, func.count(PCR.id)])
+                    .where(PCR.problem_id.in_(chunk))
+                    .group_by(PCR.problem_id, PCR.org, PCR.geo_id)):
+                num_ratings[(problem_id, org, geo_id)] = count
+
+        num_aggregate_ratings = {}
+        for chunk in cls._chunk(communities):
+            num_aggregate_ratings.update(tuple(row) for row in session.execute(
+                select([APCR.community_id, func.count(APCR.id)])
+                .where(APCR.community_id.in_(chunk))
+                .group_by(APCR.community_id)))
+
+        rows = ({'community_id': community_id,
+                 'num_followers': num_followers or 0,
+                 'significance': Community.calculate_significance(num_followers),
+                 'num_ratings': num_ratings.get((problem_id, org, geo_id), 0),
+                 'num_aggregate_ratings': num_aggregate_ratings.get(community_id, 0),
+                 'last_activity': last_activity.get(community_id)}
+                for community_id, (problem_id, org, geo_id, num_followers)
+                in communities.items())
+
+        for chunk in cls._chunk(rows):
+            session.execute(cls.table.insert(), chunk)
+
+        # Written via Core, so register for response cache invalidation
+        response_cache.register_changes(session, cls.table.name)
+
+    @classmethod
+    def _find_community_ids(cls, session, rating_keys):
+        """Return set of ids of communities matching rating keys"""
+        rating_keys = set(rating_keys)
+        problem_ids = {problem_id for problem_id, org, geo_id in rating_keys}
+        community_ids = set()
+        for chunk in cls._chunk(problem_ids):
+            for community_id, *key in session.execute(
+                    select([Community.id, Community.problem_id, Community._org,
+                            Community.geo_id])
+                    .where(Community.problem_id.in_(chunk))):
+                if tuple(key) in rating_keys:
+                    community_ids.add(community_id)
+        return community_ids
+
+    @classmethod
+    def _chunk(cls, iterable):
+        iterator = iter(iterable)
+        chunk = list(islice(iterator, cls.CHUNK_SIZE))
+        while chunk:
+            yield chunk
+            chunk = list(islice(iterator, cls.CHUNK_SIZE))
+
+    @classmethod
+    def _collect_changes(cls, session, flush_context, instances):
+        """Collect communities requiring stats refresh (before flush)"""
+        if session.info.get(cls.DEFERRED_TAG):
+            return
+        pending = session.info.get(cls.PENDING_TAG)
+        if pending is None:
+            pending = cls.Pending(communities=set(), active_communities=set(),
+                                  rating_keys=set(), deleted_ids=set())
+
+        for inst in session.new | session.dirty:
+            if isinstance(inst, Community):
+                if inst in session.new:
+                    pending.communities.add(inst)
+                elif attributes.get_history(inst, 'num_followers').has_changes():
+                    pending.active_communities.add(inst)
+            elif isinstance(inst, PCR):
+                # Instances suffice, as ids may not be assigned until flush
+                pending.rating_keys.add((inst.problem, inst.org, inst.geo))
+            elif isinstance(inst, APCR) and inst in session.new:
+                pending.communities.add(inst.community)
+
+        deleted_ids = set()
+        for inst in session.deleted:
+            if isinstance(inst, Community):
+                deleted_ids.add(inst.id)
+            elif isinstance(inst, PCR):
+                pending.rating_keys.add((inst.problem, inst.org, inst.geo))
+            elif isinstance(inst, APCR):
+                pending.communities.add(inst.community)
+
+        if deleted_ids:
+            # Rows reference the communities, so precede their deletion
+            c = cls.table.c
+            connection = session.connection(mapper=Community.__mapper__)
+            for chunk in cls._chunk(deleted_ids):
+                connection.execute(cls.table.delete().where(
+                    c.community_id.in_(chunk)))
+            pending.deleted_ids.update(deleted_ids)
+
+        if (pending.communities or pending.active_communities or
+                pending.rating_keys or pending.deleted_ids):
+            session.info[cls.PENDING_TAG] = pending
+
+    @classmethod
+    def _apply_changes(cls, session, flush_context):
+        """Refresh stats rows for collected changes (after flush)"""
+        pending = session.info.pop(cls.PENDING_TAG, None)
+        if pending is None:
+            return
+        rating_keys = {(problem.id if problem else None, org,
+                        geo.id if geo else None)
+                       for problem, org, geo in pending.rating_keys}
+        active_ids = {community.id for community in pending.active_communities}
+        active_ids |= cls._find_community_ids(session, rating_keys)
+        cls.refresh(session,
+                    community_ids={community.id for community in pending.communities
+                                   if community is not None},
+                    active_ids=active_ids,
+                    deleted_ids=pending.deleted_ids)
+
+    @classmethod
+    def _discard_changes(cls, session):
+        session.info.pop(cls.PENDING_TAG, None)
+
+
+event.listen(Session, 'before_flush', CommunityStats._collect_changes)
+event.listen(Session, 'after_flush', CommunityStats._apply_changes)
+event.listen(Session, 'after_rollback', CommunityStats._discard_changes)
@@ -7,13 +7,16 @@ from intertwine.connectors.contextualize.community_content_connector import (
     CommunityContentConnector)
 from intertwine.exceptions import (
     InterfaceException, IntertwineException, ResourceDoesNotExist)
-from intertwine.geos.models import Geo
-from intertwine.problems.models import Problem, ProblemConnection
+from intertwine.geos.models import Geo, GeoData, GeoID, GeoLevel
+from intertwine.problems.models import (
+    AggregateProblemConnectionRating, Image, Problem, ProblemConnection,
+    ProblemConnectionRating)
 from intertwine.utils.flask_utils import json_requested
-from intertwine.utils.jsonable import Jsonable
+from intertwine.utils.response_cache import response_cache
 from intertwine.utils.structures import FieldPath
 from intertwine.utils.vardygr import vardygrify
-from .models import Community
+from .models import Community, community_stats_table
+from .network import ProblemNetwork
 
 
 @blueprint.errorhandler(InterfaceException)
@@ -40,6 +43,10 @@ def render():
 
 
 @blueprint.route('/problems/<path:geo_huid>', methods=['GET'])
+@response_cache.cached(Community, Problem, ProblemConnection,
+                       ProblemConnectionRating,
+                       AggregateProblemConnectionRating, Geo,
+                       community_stats_table.name)
 def get_problem_network(geo_huid):
     org_raw_huid = request.args.get('org')
     org_huid = None if org_raw_huid and org_raw_huid.capitalize() == 'None' else org_raw_huid
@@ -47,22 +54,8 @@ def get_problem_network(geo_huid):
     geo_huid = 'global' if not geo_huid else geo_huid.lower()
     geo_huid = geo_huid[:-1] if geo_huid and geo_huid[-1] == '/' else geo_huid
     geo = None if geo_huid == 'global' else Geo.query.filter_by(human_id=geo_huid).first()
-    communities = Community.query.filter_by(geo=geo).all()
 
-    community_problem_huids = {c.problem.human_id for c in communities}
-    # In the future, consider filtering based on activity metrics
-    problems = Problem.query.all()
-
-    vardygr_communities = [
-        vardygrify(Community, problem=p, org=org, geo=geo, num_followers=0)
-        for p in problems if p.human_id not in community_problem_huids]
-
-    communities.extend(vardygr_communities)
-
-    config = configure_problem_network_community_json()
-    kwarg_map = {Community: {'config': config, 'nest': False}}
-
-    return jsonify(Jsonable.jsonify_value(communities, kwarg_map, limit=-1))
+    return jsonify(ProblemNetwork(geo, org=org).jsonify())
 
 
 @blueprint.route('/problems/', methods=['GET'])
@@ -111,6 +104,9 @@ def get_community(problem_huid, geo_huid):
     return get_community_html(problem_huid, org_huid, geo_huid)
 
 
+@response_cache.cached(Community, Problem, ProblemConnection,
+                       AggregateProblemConnectionRating, ProblemConnectionRating,
+                       Image, Geo, GeoData, GeoID, GeoLevel, jsonable=Community)
 def get_community_json(problem_huid, org_huid, geo_huid):
     """
     Get Community JSON
@@ -155,9 +151,9 @@ def get_community_html(problem_huid, org_huid, geo_huid):
             geo_huid = geo_huid.rstrip('/')
             corrected_url = True
 
-        geo = Geo.query.filter_by(human_id=geo_huid).first()
+        resolution = Geo.resolve_human_id(geo_huid)
 
-        if geo is None:
+        if resolution is None:
             # TODO: Instead of aborting, reroute to geo_not_found page
             # Oops! 'X' is not a geo found in Intertwine.
             # Did you mean:
@@ -166,10 +162,11 @@ def get_community_html(problem_huid, org_huid, geo_huid):
             # <geo_3>
             abort(404)
 
-        alias_targets = geo.alias_targets
-        if alias_targets:
-            return redirect(Community.form_uri(
-                Community.Key(problem, org, alias_targets[0])), code=302)
+        if resolution.is_alias:
+            target = Geo.resolve_human_id(resolution.human_id)
+            return redirect(Community.form_uri(Community.Key(
+                problem, org, Geo.query.get(target.geo_id))), code=302)
+        geo = Geo.query.get(resolution.geo_id)
         if corrected_url:
             return redirect(Community.form_uri(
                 Community.Key(problem, org, geo)), code=302)
@@ -221,9 +221,11 @@ class Content(AutoTimestampMixin, BaseContentModel):
         geo=None: geo where the content was originally published
         """
 
-        # TODO: if geo and dt is naive, set timezone based on geo
+        # If dt is naive, use the timezone precomputed for the geo
+        geo_data = geo.data if geo is not None else None
+        tz = geo_data.timezone_name if geo_data is not None else None
 
-        flex_dt = FlexTime.cast(dt, granularity)
+        flex_dt = FlexTime.cast(dt, tz=tz, granularity=granularity)
         granularity, info = flex_dt.granularity, flex_dt.info
 
         now = pendulum.now(UTC)
@@ -4,6 +4,12 @@ from alchy import Manager
 from alchy.model import extend_declarative_base
 
 from . import models
+from . import closure  # noqa: F401 (maintains geo closure table on flush)
+from . import versions  # noqa: F401 (increments shared geo version on flush)
+from .resolver import geo_resolver
+from .search import geo_search_index
+from .snapshot import geo_snapshot_cache
+from .spatial import geo_spatial_index
 
 
 blueprint = Blueprint(models.Geo.blueprint_name(), __name__,
@@ -23,3 +29,13 @@ def on_load(state):
     # Set up database tables
     geo_db.config.update(state.app.config)
     geo_db.create_all()
+    geo_search_index.configure(
+        enabled=state.app.config.get('GEO_SEARCH_INDEX_ENABLED', False),
+        snapshot_path=state.app.config.get('GEO_SEARCH_INDEX_SNAPSHOT'))
+    geo_spatial_index.configure(
+        enabled=state.app.config.get('GEO_SPATIAL_INDEX_ENABLED', False))
+    geo_snapshot_cache.configure(
+        enabled=state.app.config.get('GEO_SNAPSHOT_ENABLED', False),
+        snapshot_path=state.app.config.get('GEO_SNAPSHOT_PATH'))
+    geo_resolver.configure(
+        enabled=state.app.config.get('GEO_RESOLVER_ENABLED', False))
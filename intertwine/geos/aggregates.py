@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+from itertools import islice
+
+import numpy as np
+from sqlalchemy import and_, bindparam, select
+
+from .closure import GeoClosure
+from .models import Geo, GeoData, GeoLevel, geo_parent_child_association_table
+from intertwine.utils.space import Area, Coordinate
+
+
+class GeoDataAggregates:
+    """
+    Geo Data Aggregates
+
+    Batch counterpart of GeoData.create_parent_data. The data of all
+    parents at a level is aggregated from their children in a single
+    query. Sums and area-weighted centroids are computed with NumPy on
+    the quantized integer columns, rather than child by child with
+    Decimals, and the results are written back in bulk:
+
+        GeoDataAggregates.refresh(session, CORE_AREA, SUBDIVISION2)
+
+    Centroids match those of create_parent_data up to rounding of the
+    last quantized digit.
+    """
+    CHUNK_SIZE = 500  # Max ids per IN clause
+
+    SUMMED_COLUMNS = ('total_pop', 'urban_pop', '_land_area', '_water_area')
+    COORDINATE_COLUMNS = ('_latitude', '_longitude')
+
+    association = geo_parent_child_association_table
+    data = GeoData.__table__
+    level = GeoLevel.__table__
+
+    @classmethod
+    def compute(cls, session, parent_level, child_level=None, parent_ids=None):
+        """
+        Compute aggregate data
+
+        I/O:
+        session: session on which to execute
+        parent_level: level of the parents whose data is aggregated
+        child_level=None: level of the children whose data is aggregated;
+            None includes all children data
+        parent_ids=None: ids of the parents to aggregate; None for all
+            parents at the level
+        return: dictionary keyed by parent id of dictionaries of
+            aggregate values keyed by GeoData column
+        """
+        columns = cls.SUMMED_COLUMNS + cls.COORDINATE_COLUMNS
+        a, d = cls.association.c, cls.data.c
+        parent_level_table = cls.level.alias('parent_level')
+        join = (cls.association
+                .join(cls.data, d.geo_id == a.child_id)
+                .join(parent_level_table,
+                      and_(parent_level_table.c.geo_id == a.parent_id,
+                           parent_level_table.c.level == parent_level)))
+        if child_level is not None:
+            child_level_table = cls.level.alias('child_level')
+            join = join.join(child_level_table,
+                             and_(child_level_table.c.geo_id == a.child_id,
+                                  child_level_table.c.level == child_level))
+        query = (select([a.parent_id] + [d[column] for column in columns])
+                 .select_from(join))
+
+        if parent_ids is None:
+            rows = session.execute(query).fetchall()
+        else:
+            rows = []
+            for chunk in cls._chunk(parent_ids):
+                rows.extend(session.execute(
+                    query.where(a.parent_id.in_(chunk))).fetchall())
+
+        # Skip children with incomplete data
+        rows = [row for row in rows if None not in row]
+        if not rows:
+            return {}
+
+        values = np.array(rows, dtype=np.int64)
+        values = values[np.argsort(values[:, 0], kind='stable')]
+        parents, starts = np.unique(values[:, 0], return_index=True)
+
+        summed = np.add.reduceat(values[:, 1:5], starts, axis=0)
+
+        # Weights overflow int64 when multiplied by coordinates
+        coordinates = values[:, 5:7].astype(np.float64)
+        weights = (values[:, 3] + values[:, 4]).astype(np.float64)
+        total_weights = np.add.reduceat(weights, starts)
+        weighted = np.add.reduceat(coordinates * weights[:, None], starts,
+                                   axis=0)
+        # Fall back to the mean if no child has any area
+        counts = np.diff(np.append(starts, len(values)))
+        means = np.add.reduceat(coordinates, starts, axis=0) / counts[:, None]
+        has_weight = total_weights > 0
+        centroids = np.where(
+            has_weight[:, None],
+            weighted / np.where(has_weight, total_weights, 1)[:, None],
+            means)
+        centroids = np.rint(centroids).astype(np.int64)
+
+        results = np.concatenate((summed, centroids), axis=1).tolist()
+        return {parent_id: dict(zip(columns, result))
+                for parent_id, result in zip(parents.tolist(), results)}
+
+    @classmethod
+    def refresh(cls, session, parent_level, child_level=None, parent_ids=None):
+        """
+        Refresh aggregate data
+
+        Compute aggregate data (see compute()) and write it back, with a
+        single executemany for parents with data. Data is created for
+        parents without any. Loaded instances of the data updated are
+        expired and unless deferred, the closure table is refreshed.
+        Returns the aggregate data computed.
+        """
+        session.flush()
+        aggregates = cls.compute(session, parent_level, child_level,
+                                 parent_ids)
+        if not aggregates:
+            return aggregates
+
+        d = cls.data.c
+        with_data = set()
+        for chunk in cls._chunk(aggregates):
+            with_data.update(geo_id for geo_id, in session.execute(
+                select([d.geo_id]).where(d.geo_id.in_(chunk))))
+
+        # Timezones are resolved anew for the updated locations
+        updates = [dict(values, parent_id=parent_id, timezone_name=None)
+                   for parent_id, values in aggregates.items()
+                   if parent_id in with_data]
+        if updates:
+            session.execute(
+                cls.data.update().where(d.geo_id == bindparam('parent_id')),
+                updates)
+            for inst in list(session.identity_map.values()):
+                if isinstance(inst, GeoData) and inst.geo_id in with_data:
+                    session.expire(inst)
+            if not session.info.get(GeoClosure.DEFERRED_TAG):
+                GeoClosure.refresh(session, geo_ids=with_data)
+
+        for parent_id, values in aggregates.items():
+            if parent_id in with_data:
+                continue
+            GeoData(geo=session.query(Geo).get(parent_id),
+                    total_pop=values['total_pop'],
+                    urban_pop=values['urban_pop'],
+                    latitude=Coordinate(values['_latitude'], requantize=True),
+                    longitude=Coordinate(values['_longitude'], requantize=True),
+                    land_area=Area(values['_land_area'], requantize=True),
+                    water_area=Area(values['_water_area'], requantize=True))
+
+        return aggregates
+
+    @classmethod
+    def _chunk(cls, ids):
+        iterator = iter(ids)
+        chunk = list(islice(iterator, cls.CHUNK_SIZE))
+        while chunk:
+            yield chunk
+            chunk = list(islice(iterator, cls.CHUNK_SIZE))
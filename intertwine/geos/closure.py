@@ -0,0 +1,344 @@
+# -*- coding: utf-8 -*-
+from collections import namedtuple
+from contextlib import contextmanager
+from itertools import chain, islice
+
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session, attributes
+
+from .models import (Geo, GeoData, GeoLevel, geo_closure_table,
+                     geo_parent_child_association_table)
+
+
+class GeoClosure:
+    """
+    Geo Closure
+
+    Maintains the geo closure table, which materializes the transitive
+    closure of the geo parent/child hierarchy. There is a row for each
+    (ancestor, descendant, descendant level), along with the shortest
+    distance between them and the descendant's total population.
+    Descendants without data or levels have a single row per ancestor
+    with neither level nor population. As such, a query like "the top N
+    children of Texas at the place level by population" is a single
+    range scan of the ancestor/distance/level/pop index, children at
+    all levels may be fetched in a single query, and all ancestors or
+    descendants of a geo are found in a single query.
+
+    The table is maintained incrementally on flush, based on changes to
+    geo parents/children, data (total_pop) and levels. When a geo's
+    parents/children change, rows for the geo and all its descendants
+    are recomputed; when its data or levels change, only its own rows
+    are recomputed.
+
+    Bulk loads should defer maintenance and rebuild the table once:
+
+        with GeoClosure.deferred(session):
+            load_geos(...)
+        GeoClosure.rebuild(session)
+
+    Batches of changes too small to warrant a rebuild may instead defer
+    maintenance to a single refresh of the rows affected, upon exit:
+
+        with GeoClosure.deferred(session, refresh=True):
+            refresh_geos(...)
+
+    Either way, rows of deleted geos are deleted on flush, ahead of the
+    geos they reference.
+
+    Databases loaded before the table existed are populated the same
+    way, via data/geos/closure.py.
+    """
+    CHUNK_SIZE = 500  # Max ids per IN clause
+
+    PENDING_TAG = 'geo_closure_pending'
+    DEFERRED_TAG = 'geo_closure_deferred'
+    REFRESH = 'refresh'  # Deferred value when refreshed on exit
+
+    Pending = namedtuple('GeoClosurePending',
+                         'geos, subtrees, subtree_ids, deleted_ids')
+
+    association = geo_parent_child_association_table
+    table = geo_closure_table
+
+    @classmethod
+    @contextmanager
+    def deferred(cls, session, refresh=False):
+        """
+        Context manager deferring closure maintenance for session
+
+        If refresh, changes are collected across flushes and the rows
+        they affect are refreshed upon exit without error. Otherwise,
+        the table must be rebuilt afterwards.
+        """
+        prior_deferred = session.info.get(cls.DEFERRED_TAG, False)
+        session.info[cls.DEFERRED_TAG] = cls.REFRESH if refresh else True
+        pending = None
+        try:
+            yield
+            if refresh:
+                session.flush()  # Collect changes still unflushed
+        finally:
+            session.info[cls.DEFERRED_TAG] = prior_deferred
+            if not prior_deferred:
+                pending = session.info.pop(cls.PENDING_TAG, None)
+        if refresh and pending is not None:
+            cls._refresh_pending(session, pending)
+
+    @classmethod
+    def rebuild(cls, session):
+        """Rebuild the entire closure table from the geo hierarchy"""
+        session.flush()
+        parent_map = {}
+        for parent_id, child_id in session.execute(
+                select([cls.association.c.parent_id, cls.association.c.child_id])):
+            parent_map.setdefault(child_id, set()).add(parent_id)
+
+        geo_ids = [geo_id for geo_id, in session.execute(select([Geo.id]))]
+        session.execute(cls.table.delete())
+
+        def get_parents(geo_ids):
+            return {geo_id: parent_map[geo_id]
+                    for geo_id in geo_ids if geo_id in parent_map}
+
+        cls._insert(session, geo_ids, get_parents)
+
+    @classmethod
+    def refresh(cls, session, geo_ids=(), subtree_ids=(), deleted_ids=()):
+        """
+        Refresh closure rows
+
+        I/O:
+        session: session on which to execute
+        geo_ids=(): ids of geos whose rows as descendants are refreshed
+        subtree_ids=(): ids of geos whose rows and those of all their
+            descendants are refreshed (i.e. geos with new/removed parents)
+        deleted_ids=(): ids of deleted geos, whose rows are removed
+        """
+        descendant_ids = set(geo_ids) | cls._expand_subtrees(session, subtree_ids)
+        descendant_ids -= set(deleted_ids)
+
+        cls._delete(session, deleted_ids)
+        c = cls.table.c
+        for chunk in cls._chunk(descendant_ids):
+            session.execute(cls.table.delete().where(c.descendant_id.in_(chunk)))
+
+        def get_parents(geo_ids):
+            return cls._query_related(session, geo_ids, parents=True)
+
+        cls._insert(session, descendant_ids, get_parents)
+
+    @classmethod
+    def is_authoritative(cls, session):
+        """
+        True iff the table may be read in lieu of the association table
+
+        Once populated, the table is authoritative, as it is maintained
+        on flush, except while maintenance is deferred for the session.
+        Databases loaded before the table existed are read via the
+        association table until populated via data/geos/closure.py.
+        """
+        if session.info.get(cls.DEFERRED_TAG):
+            return False
+        c = cls.table.c
+        return session.execute(
+            select([c.ancestor_id]).limit(1)).first() is not None
+
+    @classmethod
+    def select_ancestor_ids(cls, geo_id):
+        """Return select of ids of all geos above geo in the hierarchy"""
+        c = cls.table.c
+        return select([c.ancestor_id]).where(c.descendant_id == geo_id).distinct()
+
+    @classmethod
+    def select_descendant_ids(cls, geo_id):
+        """Return select of ids of all geos below geo in the hierarchy"""
+        c = cls.table.c
+        return select([c.descendant_id]).where(c.ancestor_id == geo_id).distinct()
+
+    @classmethod
+    def find_ancestor_ids(cls, session, geo_id):
+        """Return set of ids of all geos above geo in the hierarchy"""
+        return {ancestor_id for ancestor_id, in
+                session.execute(cls.select_ancestor_ids(geo_id))}
+
+    @classmethod
+    def find_descendant_ids(cls, session, geo_id):
+        """Return set of ids of all geos below geo in the hierarchy"""
+        return {descendant_id for descendant_id, in
+                session.execute(cls.select_descendant_ids(geo_id))}
+
+    @classmethod
+    def _delete(cls, session, geo_ids):
+        """Delete rows of the given geos as ancestors or descendants"""
+        c = cls.table.c
+        for chunk in cls._chunk(geo_ids):
+            session.execute(cls.table.delete().where(
+                c.ancestor_id.in_(chunk) | c.descendant_id.in_(chunk)))
+
+    @classmethod
+    def _insert(cls, session, descendant_ids, get_parents):
+        """Insert closure rows for the given descendants"""
+        descendant_ids = set(descendant_ids)
+        pops = {}
+        for chunk in cls._chunk(descendant_ids):
+            pops.update(tuple(row) for row in session.execute(
+                select([GeoData.geo_id, GeoData.total_pop])
+                .where(GeoData.geo_id.in_(chunk))))
+        levels = {}
+        for chunk in cls._chunk(pops):
+            for geo_id, level in session.execute(
+                    select([GeoLevel.geo_id, GeoLevel.level])
+                    .where(GeoLevel.geo_id.in_(chunk))):
+                levels.setdefault(geo_id, []).append(level)
+
+        ancestors = cls._find_ancestors(descendant_ids, get_parents)
+
+        # Geos without data or levels have a single row per ancestor
+        rows = ({'ancestor_id': ancestor_id,
+                 'descendant_id': descendant_id,
+                 'distance': distance,
+                 'descendant_level': level,
+                 'descendant_total_pop': pops.get(descendant_id)}
+                for descendant_id in descendant_ids
+                for ancestor_id, distance in ancestors[descendant_id].items()
+                for level in levels.get(descendant_id, (None,)))
+
+        for chunk in cls._chunk(rows):
+            session.execute(cls.table.insert(), chunk)
+
+    @classmethod
+    def _find_ancestors(cls, descendant_ids, get_parents):
+        """Map each descendant id to dict of ancestor ids to distance"""
+        ancestors = {geo_id: {} for geo_id in descendant_ids}
+        frontiers = {geo_id: {geo_id} for geo_id in descendant_ids}
+        distance = 0
+        while frontiers:
+            distance += 1
+            parent_map = get_parents(set().union(*frontiers.values()))
+            next_frontiers = {}
+            for geo_id, frontier in frontiers.items():
+                geo_ancestors = ancestors[geo_id]
+                next_frontier = set()
+                for node_id in frontier:
+                    for parent_id in parent_map.get(node_id, ()):
+                        if parent_id != geo_id and parent_id not in geo_ancestors:
+                            geo_ancestors[parent_id] = distance
+                            next_frontier.add(parent_id)
+                if next_frontier:
+                    next_frontiers[geo_id] = next_frontier
+            frontiers = next_frontiers
+        return ancestors
+
+    @classmethod
+    def _expand_subtrees(cls, session, geo_ids):
+        """Return set of given geo ids and all their descendant ids"""
+        expanded = set(geo_ids)
+        frontier = set(expanded)
+        while frontier:
+            child_map = cls._query_related(session, frontier, parents=False)
+            frontier = set().union(*child_map.values()) - expanded
+            expanded |= frontier
+        return expanded
+
+    @classmethod
+    def _query_related(cls, session, geo_ids, parents=True):
+        """Map geo ids to sets of parent (or child) ids"""
+        a = cls.association.c
+        from_column, to_column = (
+            (a.child_id, a.parent_id) if parents else (a.parent_id, a.child_id))
+        related = {}
+        for chunk in cls._chunk(geo_ids):
+            for from_id, to_id in session.execute(
+                    select([from_column, to_column]).where(from_column.in_(chunk))):
+                related.setdefault(from_id, set()).add(to_id)
+        return related
+
+    @classmethod
+    def _chunk(cls, iterable):
+        iterator = iter(iterable)
+        chunk = list(islice(iterator, cls.CHUNK_SIZE))
+        while chunk:
+            yield chunk
+            chunk = list(islice(iterator, cls.CHUNK_SIZE))
+
+    @classmethod
+    def _collect_changes(cls, session, flush_context, instances):
+        """Collect geos requiring closure refresh (before flush)"""
+        deferred = session.info.get(cls.DEFERRED_TAG)
+        if deferred and deferred != cls.REFRESH:
+            deleted_ids = {inst.id for inst in session.deleted
+                           if isinstance(inst, Geo)}
+            if deleted_ids:
+                # Rows reference the geos, so precede their deletion
+                cls._delete(session.connection(mapper=Geo.__mapper__),
+                            deleted_ids)
+            return
+        pending = session.info.get(cls.PENDING_TAG)
+        if pending is None:
+            pending = cls.Pending(geos=set(), subtrees=set(), subtree_ids=set(),
+                                  deleted_ids=set())
+
+        for inst in session.new | session.dirty:
+            if isinstance(inst, Geo):
+                if attributes.get_history(inst, Geo.PARENTS).has_changes():
+                    pending.subtrees.add(inst)
+                children_history = attributes.get_history(inst, Geo.CHILDREN)
+                pending.subtrees.update(children_history.added)
+                pending.subtrees.update(children_history.deleted)
+
+            elif isinstance(inst, (GeoData, GeoLevel)):
+                field = GeoData.TOTAL_POP if isinstance(inst, GeoData) else '_level'
+                geo_history = attributes.get_history(inst, '_geo')
+                pending.geos.update(geo_history.deleted)
+                if (inst in session.new or geo_history.has_changes() or
+                        attributes.get_history(inst, field).has_changes()):
+                    pending.geos.update(geo_history.sum())
+
+        deleted_ids = set()
+        for inst in session.deleted:
+            if isinstance(inst, Geo):
+                deleted_ids.add(inst.id)
+            elif isinstance(inst, (GeoData, GeoLevel)):
+                pending.geos.update(attributes.get_history(inst, '_geo').sum())
+
+        if deleted_ids:
+            # Query children via the connection, as loading the dynamic
+            # children relationship would flush re-entrantly
+            connection = session.connection(mapper=Geo.__mapper__)
+            child_map = cls._query_related(connection, deleted_ids,
+                                           parents=False)
+            pending.subtree_ids.update(chain.from_iterable(child_map.values()))
+            pending.deleted_ids.update(deleted_ids)
+            # Rows reference the geos, so precede their deletion
+            cls._delete(connection, deleted_ids)
+
+        if (pending.geos or pending.subtrees or pending.subtree_ids or
+                pending.deleted_ids):
+            session.info[cls.PENDING_TAG] = pending
+
+    @classmethod
+    def _apply_changes(cls, session, flush_context):
+        """Refresh closure rows for collected changes (after flush)"""
+        if session.info.get(cls.DEFERRED_TAG):
+            return  # Collected changes, if any, are refreshed on exit
+        pending = session.info.pop(cls.PENDING_TAG, None)
+        if pending is not None:
+            cls._refresh_pending(session, pending)
+
+    @classmethod
+    def _refresh_pending(cls, session, pending):
+        cls.refresh(session,
+                    geo_ids={geo.id for geo in pending.geos if geo is not None},
+                    subtree_ids=({geo.id for geo in pending.subtrees} |
+                                 pending.subtree_ids),
+                    deleted_ids=pending.deleted_ids)
+
+    @classmethod
+    def _discard_changes(cls, session):
+        session.info.pop(cls.PENDING_TAG, None)
+
+
+event.listen(Session, 'before_flush', GeoClosure._collect_changes)
+event.listen(Session, 'after_flush', GeoClosure._apply_changes)
+event.listen(Session, 'after_rollback', GeoClosure._discard_changes)
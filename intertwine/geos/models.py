@@ -1,9 +1,12 @@
 # -*- coding: utf-8 -*-
 from collections import OrderedDict, namedtuple
-from functools import reduce
+from functools import partial, reduce
 
-from sqlalchemy import Column, ForeignKey, Index, Table, desc, or_, orm, types
+import pendulum
+from sqlalchemy import (Column, ForeignKey, Index, Table, and_, bindparam, case,
+                        desc, func, or_, orm, select, types)
 from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import object_session
 from sqlalchemy.orm.collections import attribute_mapped_collection
 from sqlalchemy.orm.exc import DetachedInstanceError
 
@@ -11,7 +14,8 @@ from intertwine import IntertwineModel
 from intertwine.exceptions import (AttributeConflict, CircularReference)
 from intertwine.utils.enums import MatchType
 from intertwine.utils.jsonable import JsonProperty
-from intertwine.utils.space import Area, Coordinate, GeoLocation
+from intertwine.utils.space import (Area, Coordinate, GeoLocation,
+                                    timezone_resolver)
 from intertwine.utils.tools import (define_constants_at_module_scope,
                                     find_any_words)
 
@@ -350,6 +354,9 @@ class GeoData(BaseGeoModel):
     _land_area = Column(types.Integer)
     _water_area = Column(types.Integer)
 
+    # Precomputed from location; None if not (yet) resolved
+    timezone_name = Column(types.String(64))
+
     # future: demographics, geography, climate, etc.
 
     __table_args__ = (Index('ux_geo_data:geo_id',
@@ -389,6 +396,7 @@ class GeoData(BaseGeoModel):
     def latitude(self, value):
         self._latitude = (Coordinate.cast(value).dequantize()
                           if value is not None else None)
+        self.timezone_name = None  # Resolved anew for the location
 
     latitude = orm.synonym('_latitude', descriptor=latitude)
     jsonified_latitude = JsonProperty(name='latitude', hide=True)
@@ -407,6 +415,7 @@ class GeoData(BaseGeoModel):
     def longitude(self, value):
         self._longitude = (Coordinate.cast(value).dequantize()
                            if value is not None else None)
+        self.timezone_name = None  # Resolved anew for the location
 
     longitude = orm.synonym('_longitude', descriptor=longitude)
     jsonified_longitude = JsonProperty(name='longitude', hide=True)
@@ -436,6 +445,61 @@ class GeoData(BaseGeoModel):
 
     jsonified_location = JsonProperty(name='location', after='geo')
 
+    @property
+    def timezone(self):
+        """Return timezone, resolving it if not precomputed"""
+        tz_name = self.timezone_name
+        if tz_name is None:
+            if self._latitude is None or self._longitude is None:
+                return None
+            tz_name = timezone_resolver.resolve(self.latitude,
+                                                self.longitude)
+        return pendulum.timezone(tz_name) if tz_name is not None else None
+
+    @classmethod
+    def resolve_timezones(cls, session, geo_ids=None):
+        """
+        Resolve timezones
+
+        Precompute timezone names from locations in a single batch, so
+        timezones never need to be resolved on request. Writes back with
+        a single executemany and expires loaded instances updated.
+
+        I/O:
+        session: session on which to execute
+        geo_ids=None: ids of the geos whose data is resolved; None for
+            all data not yet resolved
+        return: number of geo data resolved
+        """
+        session.flush()
+        table = cls.__table__
+        c = table.c
+        query = (select([c.geo_id, c._latitude, c._longitude])
+                 .where(and_(c._latitude.isnot(None),
+                             c._longitude.isnot(None))))
+        if geo_ids is None:
+            query = query.where(c.timezone_name.is_(None))
+        else:
+            query = query.where(c.geo_id.in_(list(geo_ids)))
+        rows = session.execute(query).fetchall()
+        if not rows:
+            return 0
+
+        tz_names = timezone_resolver.resolve_many(
+            (Coordinate(latitude, requantize=True),
+             Coordinate(longitude, requantize=True))
+            for _, latitude, longitude in rows)
+        session.execute(
+            table.update().where(c.geo_id == bindparam('data_geo_id')),
+            [dict(data_geo_id=geo_id, timezone_name=tz_name)
+             for (geo_id, _, _), tz_name in zip(rows, tz_names)])
+
+        resolved = {geo_id for geo_id, _, _ in rows}
+        for inst in list(session.identity_map.values()):
+            if isinstance(inst, cls) and inst.geo_id in resolved:
+                session.expire(inst, ['timezone_name'])
+        return len(rows)
+
     @property
     def land_area(self):
         try:
@@ -525,12 +589,12 @@ class GeoData(BaseGeoModel):
         return True
 
     @classmethod
-    def create_parent_data(cls, parent_geo, child_level=None):
+    def aggregate_children_data(cls, parent_geo, child_level=None):
         """
-        Create parent data
+        Aggregate children data
 
-        Constructor for aggregating geo data for a parent geo from its
-        children geos at a given level.
+        Aggregate geo data for a parent geo from its children geos at a
+        given level.
 
         IO:
         parent_geo:
@@ -541,9 +605,9 @@ class GeoData(BaseGeoModel):
             Default of None includes all children data.
 
         returns:
-            A GeoData instance in which values are aggregated from the
-            parent_geo's children at the given level, if there are any.
-            Or None if there are no children.
+            A dictionary of values aggregated from the parent_geo's
+            children at the given level, keyed by field, if there are
+            any. Or None if there are no children.
         """
         children = (
             parent_geo.children.all() if child_level is None
@@ -563,7 +627,31 @@ class GeoData(BaseGeoModel):
 
         data['latitude'], data['longitude'] = geo_location.coordinates
 
-        return cls(parent_geo, **data)
+        return data
+
+    @classmethod
+    def create_parent_data(cls, parent_geo, child_level=None):
+        """
+        Create parent data
+
+        Constructor for aggregating geo data for a parent geo from its
+        children geos at a given level.
+
+        IO:
+        parent_geo:
+            The parent geo for which data is to be aggregated.
+
+        child_level=None:
+            The level of the children whose data is to be aggregated.
+            Default of None includes all children data.
+
+        returns:
+            A GeoData instance in which values are aggregated from the
+            parent_geo's children at the given level, if there are any.
+            Or None if there are no children.
+        """
+        data = cls.aggregate_children_data(parent_geo, child_level)
+        return cls(parent_geo, **data) if data is not None else None
 
     def __init__(self, geo, total_pop=None, urban_pop=None,
                  latitude=None, longitude=None,
@@ -592,6 +680,34 @@ geo_alias_association_table = Table(
 )
 
 
+# Closure of the parent/child hierarchy, with a row for each ancestor of
+# each descendant, per descendant level (None if the descendant lacks
+# data or levels). Maintained by intertwine.geos.closure.GeoClosure.
+geo_closure_table = Table(
+    'geo_closure', BaseGeoModel.metadata,
+    Column('ancestor_id', types.Integer, ForeignKey('geo.id'), nullable=False),
+    Column('descendant_id', types.Integer, ForeignKey('geo.id'), nullable=False),
+    Column('distance', types.Integer, nullable=False),
+    Column('descendant_level', types.String(30)),
+    Column('descendant_total_pop', types.Integer),
+    Index('ux_geo_closure',
+          # ux for unique index
+          'ancestor_id',
+          'descendant_id',
+          'descendant_level',
+          unique=True),
+    Index('ix_geo_closure:ancestor_id+distance+descendant_level+pop',
+          # ix for index
+          'ancestor_id',
+          'distance',
+          'descendant_level',
+          'descendant_total_pop'),
+    Index('ix_geo_closure:descendant_id',
+          # ix for index
+          'descendant_id'),
+)
+
+
 class Geo(BaseGeoModel):
     """
     Geo
@@ -1278,36 +1394,74 @@ class Geo(BaseGeoModel):
         return (c.strip() for c in reversed(geo_text.split(',')) if c.strip())
 
     @classmethod
-    def find_matches(cls, match_string, match_type=MatchType.BEST):
-        """Return matches given a qualified geo match string"""
+    def find_matches(cls, match_string, match_type=MatchType.BEST, limit=None):
+        """
+        Return matches given a qualified geo match string
+
+        I/O:
+        match_string: qualified geo match string, e.g. 'austin, tx'
+        match_type=MatchType.BEST: match type applied to each component
+        limit=None: if provided, max number of matches, which is pushed
+            into the search of the final component; only the top match
+            is retrieved for each preceding component
+        return: list of matching geos, largest/exact matches first
+        """
         path_components = list(cls.infer_path_component_names(match_string))
         if not path_components:
             return []
+
+        # Over-fetch, as redundant aliases are removed after the search,
+        # and fetch more until the limit is reached or matches run out
+        fetch_limit = limit * 2 if limit else limit
+        while True:
+            matches = cls._find_path_matches(path_components, match_type,
+                                             limit=fetch_limit)
+            num_fetched = len(matches)
+            cls.remove_redundant_aliases(matches)
+            if (not fetch_limit or num_fetched < fetch_limit or
+                    len(matches) >= limit):
+                break
+            fetch_limit *= 2
+
+        return matches[:limit] if limit is not None else matches
+
+    @classmethod
+    def _find_path_matches(cls, path_components, match_type, limit):
+        """Find matches of path components, including redundant aliases"""
         component_match_type = match_type
         prior_parent = parent = None
+        num_components = len(path_components)
 
         for i, component in enumerate(path_components, start=1):
             matches = cls.find_component_matches(
                 component, match_type=component_match_type, parent=parent,
-                elevate_exact_matches=len(component) > 1)
+                elevate_exact_matches=len(component) > 1,
+                limit=limit if i == num_components else 1)
             if not matches:
                 break
             prior_parent, parent = parent, matches[0]
 
-        if not matches and len(path_components) > 1:
+        if not matches and num_components > 1:
             matches = cls.find_component_matches(
                 ', '.join((path_components[-1], path_components[-2])),
-                match_type=match_type, parent=prior_parent)
+                match_type=match_type, parent=prior_parent, limit=limit)
 
-        cls.remove_redundant_aliases(matches)
         return matches
 
     @classmethod
     def find_component_matches(cls, match_string, match_type=MatchType.BEST,
-                               parent=None, elevate_exact_matches=True):
+                               parent=None, elevate_exact_matches=True,
+                               limit=None):
         """Find component matches given an unqualified geo match string"""
         alias_targets = parent.alias_targets if parent else None
         parent = alias_targets[0] if alias_targets else parent
+
+        matches = cls.search_component_matches(
+            match_string, match_type, parent, limit=limit,
+            elevate_exact_matches=elevate_exact_matches)
+        if matches is not None:
+            return matches
+
         base_query = parent.path_children if parent else cls.query
 
         if match_type is MatchType.BEST:
@@ -1333,13 +1487,130 @@ class Geo(BaseGeoModel):
         else:
             raise ValueError('Unsupported match type: {!r}'.format(match_type))
 
-        matches = (base_query.outerjoin(cls.data)
-                             .filter(filter_clause)
-                             .order_by(desc(GeoData.total_pop)).all())
+        query = base_query.outerjoin(cls.data).filter(filter_clause)
 
         if elevate_exact_matches:
-            cls.elevate_exact_matches(matches, match_string)
-        return matches
+            # Exact matches (ignoring case) first, as with is_exact_match
+            lower_string = match_string.lower()
+            exact_clause = or_(func.lower(cls.name) == lower_string,
+                               func.lower(cls.abbrev) == lower_string)
+            query = query.order_by(case([(exact_clause, 0)], else_=1))
+
+        query = query.order_by(desc(GeoData.total_pop))
+        return query.limit(limit).all() if limit is not None else query.all()
+
+    @classmethod
+    def search_component_matches(cls, match_string, match_type=MatchType.BEST,
+                                 parent=None, limit=None,
+                                 elevate_exact_matches=True):
+        """
+        Search component matches via the geo search index
+
+        I/O:
+        match_string: unqualified geo match string
+        match_type=MatchType.BEST: match type
+        parent=None: if provided, limit matches to its path children
+        limit=None: if provided, max number of matches
+        elevate_exact_matches=True: if True, exact matches come first
+        return: list of matching geos in descending order by total
+            population, or None if the index is disabled or does not
+            support the match type
+        """
+        from .search import geo_search_index
+        if not geo_search_index.enabled:
+            return None
+        geo_search_index.ensure_built(cls.query.session)
+        geo_ids = geo_search_index.search(
+            match_string, match_type, parent_id=parent.id if parent else None,
+            limit=limit, elevate_exact_matches=elevate_exact_matches)
+        if geo_ids is None:
+            return None
+        return cls.get_by_ids(geo_ids)
+
+    @classmethod
+    def find_nearest(cls, latitude, longitude, k=1, level=None, min_pop=None,
+                     distances=False):
+        """
+        Find nearest geos via the geo spatial index (SQL if disabled)
+
+        I/O:
+        latitude: latitude of the point in degrees
+        longitude: longitude of the point in degrees
+        k=1: max number of geos to return
+        level=None: if provided, only geos with the level are returned
+        min_pop=None: if provided, only geos with at least this total
+            population are returned
+        distances=False: if True, return (geo, distance in km) tuples
+        return: list of geos (with data), nearest first
+        """
+        from .spatial import GeoSpatialIndex, geo_spatial_index
+        session = cls.query.session
+        if geo_spatial_index.enabled:
+            geo_spatial_index.ensure_built(session)
+            nearest = geo_spatial_index.nearest(
+                latitude, longitude, k=k, level=level, min_pop=min_pop)
+        else:
+            nearest = GeoSpatialIndex.query_nearest(
+                session, latitude, longitude, k=k, level=level,
+                min_pop=min_pop)
+        geos = cls.get_by_ids([geo_id for geo_id, _ in nearest])
+        if not distances:
+            return geos
+        distances = dict(nearest)
+        return [(geo, distances[geo.id]) for geo in geos]
+
+    @classmethod
+    def find_within(cls, south, west, north, east, level=None, min_pop=None,
+                    limit=None):
+        """
+        Find geos within a box via the geo spatial index (SQL if disabled)
+
+        I/O:
+        south/west/north/east: bounds of the box in degrees, where west
+            may exceed east if the box spans the antimeridian
+        level=None: if provided, only geos with the level are returned
+        min_pop=None: if provided, only geos with at least this total
+            population are returned
+        limit=None: if provided, max number of geos
+        return: list of geos (with data) in descending order by total
+            population
+        """
+        from .spatial import GeoSpatialIndex, geo_spatial_index
+        session = cls.query.session
+        if geo_spatial_index.enabled:
+            geo_spatial_index.ensure_built(session)
+            within = geo_spatial_index.within
+        else:
+            within = partial(GeoSpatialIndex.query_within, session)
+        return cls.get_by_ids(within(south, west, north, east, level=level,
+                                     min_pop=min_pop, limit=limit))
+
+    @classmethod
+    def get_snapshot(cls):
+        """Return in-memory geo snapshot, or None if disabled"""
+        from .snapshot import geo_snapshot_cache
+        if not geo_snapshot_cache.enabled:
+            return None
+        return geo_snapshot_cache.get(cls.query.session)
+
+    @classmethod
+    def resolve_human_id(cls, human_id):
+        """Return GeoResolver.Resolution of human_id, or None if no geo"""
+        from .resolver import geo_resolver
+        return geo_resolver.resolve(cls.query.session, human_id)
+
+    @classmethod
+    def get_by_ids(cls, geo_ids, chunk_size=500):
+        """Return list of geos in the order of the given ids"""
+        return list(cls.iter_by_ids(geo_ids, chunk_size))
+
+    @classmethod
+    def iter_by_ids(cls, geo_ids, chunk_size=500):
+        """Yield geos in the order of the given ids, loading by chunk"""
+        for i in range(0, len(geo_ids), chunk_size):
+            chunk = geo_ids[i:i + chunk_size]
+            geos = {geo.id: geo for geo in cls.query.filter(cls.id.in_(chunk))}
+            yield from (geos[geo_id] for geo_id in chunk if geo_id in geos)
 
     @staticmethod
     def elevate_exact_matches(matches, match_string):
@@ -1370,13 +1641,9 @@ class Geo(BaseGeoModel):
     def remove_redundant_aliases(matches):
         """Remove redundant aliases given list of matches"""
         match_set = set(matches)
-        for geo in reversed(matches):
-            alias_targets = geo.alias_targets
-            if not alias_targets:
-                continue
-            redundent = [at in match_set for at in alias_targets]
-            if sum(redundent) == len(alias_targets):
-                del matches[-1]
+        matches[:] = [geo for geo in matches
+                      if not geo.alias_targets or
+                      not all(at in match_set for at in geo.alias_targets)]
 
     @staticmethod
     def get_largest_geo(*geos):
@@ -1405,6 +1672,24 @@ class Geo(BaseGeoModel):
             raise ValueError('{rel} is not an allowed value for relation'
                              .format(rel=relation))
 
+        from .closure import GeoClosure
+
+        # Children at a level by population are a closure table range scan
+        if (relation == self.CHILDREN and level and order_by is None and
+                not include_aliases and not outer_join_data and
+                self.id is not None and
+                GeoClosure.is_authoritative(object_session(self))):
+            c = geo_closure_table.c
+            return (
+                Geo.query.join(geo_closure_table, c.descendant_id == Geo.id)
+                         .filter(c.ancestor_id == self.id,
+                                 c.distance == 1,
+                                 c.descendant_level == level,
+                                 ~Geo.alias_targets.any())
+                         .order_by(desc(c.descendant_total_pop),
+                                   c.descendant_id)
+                         .all())
+
         query = getattr(self, relation)
 
         outer_join_data_required = outer_join_data or include_aliases
@@ -1469,6 +1754,9 @@ class Geo(BaseGeoModel):
                                 for g in base_q.all()]
 
         else:
+            if relation == self.CHILDREN and self.id is not None:
+                return self.jsonify_children_by_level(**json_kwargs)
+
             levels = (lvl for lvl in (
                 GeoLevel.UP if relation == self.PARENTS else GeoLevel.DOWN))
 
@@ -1498,6 +1786,92 @@ class Geo(BaseGeoModel):
 
         return rv
 
+    def get_children_by_level(self, limit=-1):
+        """
+        Get children by level
+
+        Fetch children at all levels with a single closure table query,
+        plus a query per chunk of geos shown. Children are limited to
+        those with data and levels.
+
+        I/O:
+        limit=-1: max number of children per level; no limit if < 0
+        return: ordered dictionary keyed by level (top to bottom) of
+            (children, total) tuples, where children are in descending
+            order by total population and total is the number of
+            children at the level before applying the limit
+        """
+        ids_by_level = self.get_child_ids_by_level()
+        shown_ids = {geo_id for ids in ids_by_level.values()
+                     for geo_id in (ids if limit < 0 else ids[:limit])}
+        geos = {geo.id: geo for geo in Geo.iter_by_ids(list(shown_ids))}
+
+        return OrderedDict(
+            (lvl, ([geos[geo_id] for geo_id in (ids if limit < 0 else ids[:limit])],
+                   len(ids)))
+            for lvl, ids in ids_by_level.items())
+
+    def get_child_ids_by_level(self):
+        """
+        Get child ids by level
+
+        Return ordered dictionary keyed by level (top to bottom) of ids
+        of children with data and levels, in descending order by total
+        population. Levels without children are omitted. Unless the
+        closure table is authoritative (e.g. not yet populated), the
+        children are queried via the parent/child association table.
+        """
+        from .closure import GeoClosure
+
+        session = object_session(self)
+        if GeoClosure.is_authoritative(session):
+            c = geo_closure_table.c
+            rows = session.execute(
+                select([c.descendant_id, c.descendant_level])
+                .where(and_(c.ancestor_id == self.id, c.distance == 1,
+                            c.descendant_level.isnot(None)))
+                .order_by(desc(c.descendant_total_pop), c.descendant_id)
+            ).fetchall()
+        else:
+            a = geo_parent_child_association_table.c
+            d, lv = GeoData.__table__.c, GeoLevel.__table__.c
+            rows = session.execute(
+                select([a.child_id, lv.level])
+                .select_from(geo_parent_child_association_table
+                             .join(GeoData.__table__, d.geo_id == a.child_id)
+                             .join(GeoLevel.__table__, lv.geo_id == a.child_id))
+                .where(a.parent_id == self.id)
+                .order_by(desc(d.total_pop), a.child_id)).fetchall()
+
+        ids_by_level = OrderedDict((lvl, []) for lvl in GeoLevel.DOWN)
+        for geo_id, level in rows:
+            ids_by_level[level].append(geo_id)
+        return OrderedDict((lvl, ids) for lvl, ids in ids_by_level.items()
+                           if ids)
+
+    def jsonify_children_by_level(self, **json_kwargs):
+        """Jsonify children by level via the closure table"""
+        limit = json_kwargs['limit']
+        rv = OrderedDict()
+        if limit < 0:
+            # Children are loaded and jsonified as they are iterated, so
+            # they are streamed by JsonStream
+            _json, _path = json_kwargs['_json'], json_kwargs['_path']
+            for lvl, geo_ids in self.get_child_ids_by_level().items():
+                rv[lvl] = _json.iterate(
+                    Geo.iter_by_ids(geo_ids), partial(
+                        self._jsonify_child, json_kwargs=json_kwargs), _path)
+            return rv
+
+        for lvl, (geos, total) in self.get_children_by_level(limit).items():
+            rv[lvl] = [self.jsonify_geo(g, **json_kwargs) for g in geos]
+            if len(geos) == limit and total > limit:
+                rv[lvl].append(self.paginate(len(geos), limit, total))
+        return rv
+
+    def _jsonify_child(self, geo, _path, json_kwargs):
+        return self.jsonify_geo(geo, **dict(json_kwargs, _path=_path))
+
     def jsonify_geo(self, geo, depth, **json_kwargs):
         """Jsonify geo"""
         _json = json_kwargs['_json']
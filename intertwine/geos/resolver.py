@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+from collections import namedtuple
+from itertools import chain
+from threading import RLock
+
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session, attributes
+
+from .models import Geo, GeoData, geo_alias_association_table
+from .versions import GeoVersion
+
+
+class GeoResolver:
+    """
+    Geo Resolver
+
+    Process-wide map of the human_id of every geo, including aliases,
+    to a Resolution consisting of the geo id, the canonical human_id
+    and whether the geo is an alias. The canonical human_id of an alias
+    is that of its most populous alias target, as with
+    Geo.alias_targets, and otherwise is the human_id itself. Human ids
+    are thus resolved and aliases redirected without a database round
+    trip:
+
+        resolution = geo_resolver.resolve(session, 'us/tx/atx')
+        if resolution.is_alias:
+            return redirect('/geos/{}'.format(resolution.human_id))
+
+    The map is built lazily from the database on first resolution and
+    is updated in place as geo human_ids, aliases or populations are
+    changed via the ORM and the changes committed. Once geos are changed
+    by another process, per the shared geo version, the map is cleared
+    and so rebuilt on the next resolution. Human ids missing from the
+    map, such as those of geos added by another process within the
+    shared versions interval, are resolved via the database, as is each
+    human_id while disabled.
+    """
+    Resolution = namedtuple('GeoResolution', 'geo_id, human_id, is_alias')
+
+    PENDING_TAG = 'geo_resolver_pending'
+    ORPHANS_TAG = 'geo_resolver_orphans'
+
+    @property
+    def built(self):
+        return self._resolutions is not None
+
+    def configure(self, enabled=None):
+        """Configure resolver"""
+        with self._lock:
+            if enabled is not None:
+                self.enabled = enabled
+            if not self.enabled:
+                self.clear()
+
+    def clear(self):
+        """Clear map, such that it is rebuilt on next resolution"""
+        with self._lock:
+            self._resolutions = None
+            self._version = None
+
+    def build(self, session):
+        """Build map from the database"""
+        version = GeoVersion.read(session)
+        g = Geo.__table__.c
+        human_ids = dict(session.execute(select([g.id, g.human_id])).fetchall())
+        targets = self._canonical_targets(session)
+        resolutions = self._form_resolutions(human_ids, human_ids, targets)
+        with self._lock:
+            self._resolutions = resolutions
+            self._version = version
+
+    def ensure_built(self, session):
+        """Build map if not yet built or geos changed by another process"""
+        with self._lock:
+            built, version = self.built, self._version
+        if built and GeoVersion.read(session) != version:
+            self.clear()
+        if self._resolutions is None:
+            with self._lock:
+                if self._resolutions is None:
+                    self.build(session)
+
+    def resolve(self, session, human_id):
+        """
+        Resolve human_id
+
+        I/O:
+        session: session on which to build the map or query if the
+            human_id is missing from it or disabled
+        human_id: human_id of a geo, which may be an alias
+        return: Resolution of the geo, or None if there is no such geo
+        """
+        if not self.enabled:
+            return self._query(session, human_id)
+        self.ensure_built(session)
+        with self._lock:
+            resolutions = self._resolutions  # None if since cleared
+            resolution = resolutions.get(human_id) if resolutions else None
+        return (resolution if resolution is not None
+                else self._query(session, human_id))
+
+    def _query(self, session, human_id):
+        """Resolve human_id via the database"""
+        geo_id = (session.query(Geo.id).filter(Geo._human_id == human_id)
+                  .scalar())
+        if geo_id is None:
+            return None
+        target_id = self._canonical_targets(session, alias_ids=[geo_id]).get(
+            geo_id)
+        if target_id is None:
+            return self.Resolution(geo_id, human_id, False)
+        g = Geo.__table__.c
+        target_human_id = session.execute(
+            select([g.human_id]).where(g.id == target_id)).scalar()
+        return self.Resolution(geo_id, target_human_id, True)
+
+    def _form_resolutions(self, geo_ids, human_ids, targets):
+        """Return dictionary of resolutions of geo ids by human_id"""
+        resolutions = {}
+        for geo_id in geo_ids:
+            human_id, target_id = human_ids[geo_id], targets.get(geo_id)
+            resolutions[human_id] = (
+                self.Resolution(geo_id, human_id, False) if target_id is None
+                else self.Resolution(geo_id, human_ids[target_id], True))
+        return resolutions
+
+    def _query_resolutions(self, session, geo_ids, target_ids):
+        """Return resolutions of geos and aliases of targets by human_id"""
+        a, g = geo_alias_association_table.c, Geo.__table__.c
+        if target_ids:
+            geo_ids = geo_ids | {alias_id for alias_id, in session.execute(
+                select([a.alias_id]).where(a.alias_target_id.in_(target_ids)))}
+        if not geo_ids:
+            return {}
+        targets = self._canonical_targets(session, alias_ids=geo_ids)
+        human_ids = dict(session.execute(
+            select([g.id, g.human_id])
+            .where(g.id.in_(geo_ids | set(targets.values())))).fetchall())
+        # Deleted geos have no rows
+        return self._form_resolutions(geo_ids & human_ids.keys(), human_ids,
+                                      targets)
+
+    @staticmethod
+    def _canonical_targets(session, alias_ids=None):
+        """Return dictionary of most populous alias target id by alias id"""
+        a, d = geo_alias_association_table.c, GeoData.__table__.c
+        query = (select([a.alias_id, a.alias_target_id, d.total_pop])
+                 .select_from(geo_alias_association_table.outerjoin(
+                     GeoData.__table__, d.geo_id == a.alias_target_id)))
+        if alias_ids is not None:
+            query = query.where(a.alias_id.in_(alias_ids))
+
+        # Targets lacking population rank last; ties go to the lowest id
+        ranks = {}
+        for alias_id, target_id, total_pop in session.execute(query):
+            rank = (-1 if total_pop is None else total_pop, -target_id)
+            if alias_id not in ranks or rank > ranks[alias_id]:
+                ranks[alias_id] = rank
+        return {alias_id: -rank[1] for alias_id, rank in ranks.items()}
+
+    def _on_before_flush(self, session, flush_context, instances):
+        # Aliases of deleted geos are collected before their association
+        # rows are deleted by the flush
+        if not self.enabled:
+            return
+        deleted_ids = {inst.id for inst in session.deleted
+                       if isinstance(inst, Geo) and inst.id is not None}
+        if deleted_ids:
+            a = geo_alias_association_table.c
+            session.info.setdefault(self.ORPHANS_TAG, set()).update(
+                alias_id for alias_id, in session.execute(
+                    select([a.alias_id])
+                    .where(a.alias_target_id.in_(deleted_ids))))
+
+    def _on_flush(self, session, flush_context):
+        # Session still holds pre-flush new/dirty/deleted collections.
+        # Resolutions are queried as of the flush and collected even if
+        # not yet built, in case the map is built (from prior data)
+        # before commit
+        if not self.enabled:
+            return
+        geo_ids = session.info.pop(self.ORPHANS_TAG, set())
+        target_ids, removed = set(), set()
+        for inst in chain(session.new, session.dirty, session.deleted):
+            if isinstance(inst, Geo):
+                human_id_history = attributes.get_history(inst, '_human_id')
+                if inst in session.deleted:
+                    removed.update(human_id_history.sum())
+                elif inst in session.new:
+                    geo_ids.add(inst.id)
+                elif human_id_history.has_changes():
+                    # Aliases take on the human_id of their target
+                    removed.update(human_id_history.deleted)
+                    geo_ids.add(inst.id)
+                    target_ids.add(inst.id)
+                elif attributes.get_history(
+                        inst, '_alias_targets').has_changes():
+                    geo_ids.add(inst.id)
+            elif isinstance(inst, GeoData):
+                geo_history = attributes.get_history(inst, '_geo')
+                if (inst in session.new or inst in session.deleted or
+                        geo_history.has_changes() or
+                        attributes.get_history(inst, 'total_pop').has_changes()):
+                    target_ids.update(geo.id for geo in geo_history.sum()
+                                      if geo is not None)
+
+        resolutions = self._query_resolutions(session, geo_ids, target_ids)
+        if removed or resolutions:
+            pending = session.info.setdefault(self.PENDING_TAG, {})
+            pending.update(dict.fromkeys(removed))  # Removed unless re-added
+            pending.update(resolutions)
+
+    def _on_commit(self, session):
+        pending = session.info.pop(self.PENDING_TAG, None) or {}
+        with self._lock:
+            if not self.built:
+                return
+            for human_id, resolution in pending.items():
+                if resolution is None:
+                    self._resolutions.pop(human_id, None)
+                else:
+                    self._resolutions[human_id] = resolution
+            # Own changes are applied, so advance past their increments
+            self._version = GeoVersion.committed(session, self._version)
+
+    def _on_rollback(self, session):
+        session.info.pop(self.PENDING_TAG, None)
+        session.info.pop(self.ORPHANS_TAG, None)
+
+    def __len__(self):
+        return len(self._resolutions) if self._resolutions is not None else 0
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._lock = RLock()
+        self.clear()
+
+
+geo_resolver = GeoResolver(enabled=False)  # Enabled via configure
+
+event.listen(Session, 'before_flush', geo_resolver._on_before_flush)
+event.listen(Session, 'after_flush', geo_resolver._on_flush)
+event.listen(Session, 'after_commit', geo_resolver._on_commit)
+event.listen(Session, 'after_rollback', geo_resolver._on_rollback)
@@ -0,0 +1,379 @@
+# -*- coding: utf-8 -*-
+import heapq
+import json
+import os
+import tempfile
+from bisect import bisect_left, insort
+from collections import namedtuple
+from itertools import chain
+from threading import RLock
+
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session, attributes
+
+from intertwine.utils.enums import MatchType
+from .models import Geo, GeoData, geo_alias_association_table
+from .versions import GeoVersion
+
+
+class GeoSearchIndex:
+    """
+    Geo Search Index
+
+    Process-wide index of geo names and abbreviations consulted by
+    Geo.find_component_matches in lieu of LIKE queries, since the
+    word-start pattern ('% x%') cannot use an index and is repeated on
+    every keystroke of the geo autocomplete endpoint.
+
+    Tokens are held in a sorted array of (token, kind, geo id) tuples,
+    so a prefix search is a bisected range. Each geo contributes its
+    lowercased name, each word start within its name (the remainder of
+    the name following each space) and its lowercased abbreviation.
+    Results are ranked by total population, descending, with geos
+    lacking data (i.e. aliases) last, followed by id. Aliases are
+    indexed under their own names and searches scoped by path parent
+    consider only path children of the given parent, as with SQL.
+
+    The index is built lazily from the database on first search, or
+    loaded from a snapshot file when one exists whose geo fingerprint
+    matches the database, and is updated incrementally as geos are
+    added, renamed, reparented, repopulated or deleted and the changes
+    committed. Builds save the snapshot file, if configured. Once geos
+    are changed by another process, per the shared geo version, the
+    index is cleared and so rebuilt (or reloaded) on next search.
+
+    Contains/ends-with searches are not supported by the index, in
+    which case search returns None so callers may fall back to SQL.
+    """
+    SNAPSHOT_VERSION = 2
+
+    NAME, WORD, ABBREV = range(3)  # Token kinds
+
+    # Token kinds searched per match type
+    MATCH_KINDS = {
+        MatchType.BEST: {NAME, WORD, ABBREV},
+        MatchType.STARTS_WITH: {NAME, ABBREV},
+        MatchType.EXACT: {NAME, ABBREV},
+    }
+
+    # Unqualified BEST searches shorter than this only match abbrevs
+    MIN_NAME_MATCH_LENGTH = 3
+
+    Entry = namedtuple('GeoSearchEntry',
+                       'id, name, abbrev, path_parent_id, alias_target_ids, '
+                       'total_pop')
+
+    PENDING_TAG = 'geo_search_index_pending'
+
+    @property
+    def built(self):
+        return self._entries is not None
+
+    def configure(self, enabled=None, snapshot_path=None):
+        """Configure index, which loads snapshot at path when built"""
+        with self._lock:
+            if enabled is not None:
+                self.enabled = enabled
+            if snapshot_path is not None:
+                self.snapshot_path = snapshot_path
+            self.clear()
+
+    def clear(self):
+        """Clear index, such that it is rebuilt on next search"""
+        with self._lock:
+            self._entries = None
+            self._tokens = []
+            self._path_children = {}
+            self._fingerprint = None
+
+    def build(self, session):
+        """Build index from the database, saving snapshot if configured"""
+        fingerprint = GeoVersion.fingerprint(session)
+        alias_target_ids = {}
+        a = geo_alias_association_table.c
+        for alias_id, alias_target_id in session.execute(
+                select([a.alias_id, a.alias_target_id])):
+            alias_target_ids.setdefault(alias_id, []).append(alias_target_id)
+
+        rows = session.execute(
+            select([Geo.id, Geo._name, Geo._abbrev, Geo.path_parent_id,
+                    GeoData.total_pop])
+            .select_from(Geo.__table__.outerjoin(GeoData.__table__)))
+
+        entries = (self.Entry(id=geo_id, name=name, abbrev=abbrev,
+                              path_parent_id=path_parent_id,
+                              alias_target_ids=tuple(alias_target_ids.get(geo_id, ())),
+                              total_pop=total_pop)
+                   for geo_id, name, abbrev, path_parent_id, total_pop in rows)
+        self._populate(entries, fingerprint)
+
+        if self.snapshot_path:
+            self.save(self.snapshot_path)
+
+    def ensure_built(self, session):
+        """
+        Ensure index is built and current
+
+        Clear the index if geos have been changed by another process
+        since it was built. Then, if not built, load the snapshot if it
+        matches the database, or else build the index.
+        """
+        fingerprint = self._fingerprint  # None once cleared
+        if (fingerprint is not None and
+                GeoVersion.read(session) != fingerprint[0]):
+            self.clear()
+        if self._entries is None:
+            with self._lock:
+                if self._entries is None and not self._load_current(session):
+                    self.build(session)
+
+    def _load_current(self, session):
+        """Load snapshot if it matches the database; return True if so"""
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return False
+        try:
+            self.load(self.snapshot_path,
+                      fingerprint=GeoVersion.fingerprint(session))
+        except ValueError:
+            return False
+        return True
+
+    def search(self, match_string, match_type=MatchType.BEST, parent_id=None,
+               limit=None, elevate_exact_matches=False):
+        """
+        Search
+
+        I/O:
+        match_string: unqualified geo match string
+        match_type=MatchType.BEST: BEST, STARTS_WITH and EXACT supported
+        parent_id=None: if provided, limit matches to its path children
+        limit=None: if provided, return only the top matches
+        elevate_exact_matches=False: if True, rank exact matches (ignoring
+            case) of name or abbrev first
+        return: list of matching geo ids in rank order, or None if the
+            match type is not supported by the index
+        """
+        kinds = self.MATCH_KINDS.get(match_type)
+        if kinds is None:
+            return None
+        match_string = match_string.lower()
+        exact = match_type is MatchType.EXACT
+        if (match_type is MatchType.BEST and parent_id is None and
+                len(match_string) < self.MIN_NAME_MATCH_LENGTH):
+            kinds = {self.ABBREV}
+
+        with self._lock:
+            lo, hi = self._token_range(match_string, exact)
+            scope = self._path_children.get(parent_id, ()) if parent_id else None
+
+            if scope is not None and len(scope) < hi - lo:
+                geo_ids = {geo_id for geo_id in scope
+                           if self._matches(self._entries[geo_id], match_string,
+                                            kinds, exact)}
+            else:
+                geo_ids = {geo_id for token, kind, geo_id in self._tokens[lo:hi]
+                           if kind in kinds}
+                if scope is not None:
+                    geo_ids &= scope
+
+            rank_key = self._rank_key
+            if elevate_exact_matches:
+                def rank_key(geo_id, rank_key=rank_key):
+                    return (not self._is_exact(self._entries[geo_id], match_string),
+                            *rank_key(geo_id))
+
+            if limit is not None and 0 <= limit < len(geo_ids):
+                return heapq.nsmallest(limit, geo_ids, key=rank_key)
+            return sorted(geo_ids, key=rank_key)
+
+    def update(self, *entries):
+        """Add or replace entries"""
+        with self._lock:
+            for entry in entries:
+                self._remove(entry.id)
+                self._add(entry, insert=True)
+
+    def remove(self, *geo_ids):
+        """Remove entries for the given geo ids"""
+        with self._lock:
+            for geo_id in geo_ids:
+                self._remove(geo_id)
+
+    def save(self, path):
+        """Save index entries and geo fingerprint to snapshot at path"""
+        with self._lock:
+            snapshot = {'version': self.SNAPSHOT_VERSION,
+                        'fingerprint': self._fingerprint,
+                        'entries': list(self._entries.values())}
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.')
+        try:
+            with os.fdopen(fd, 'w') as file:
+                json.dump(snapshot, file, separators=(',', ':'))
+            os.replace(temp_path, path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+    def load(self, path, fingerprint=None):
+        """
+        Load index from snapshot file at path
+
+        I/O:
+        path: path of snapshot file
+        fingerprint=None: if provided, geo fingerprint of the database,
+            which the snapshot must match
+        raise: ValueError if the snapshot is unsupported or mismatched
+        """
+        with open(path) as file:
+            snapshot = json.load(file)
+        version = snapshot.get('version')
+        if version != self.SNAPSHOT_VERSION:
+            raise ValueError('Unsupported geo search index snapshot version: '
+                             '{!r}'.format(version))
+        if fingerprint is not None and snapshot['fingerprint'] != fingerprint:
+            raise ValueError('Geo search index snapshot does not match '
+                             'database: {!r}'.format(snapshot['fingerprint']))
+        self._populate((self.Entry(*values[:4], tuple(values[4]), values[5])
+                        for values in snapshot['entries']),
+                       snapshot['fingerprint'])
+
+    @classmethod
+    def form_entry(cls, geo):
+        """Form index entry from geo instance"""
+        data = geo._data
+        return cls.Entry(id=geo.id, name=geo._name, abbrev=geo._abbrev,
+                         path_parent_id=geo.path_parent_id,
+                         alias_target_ids=tuple(at.id for at in geo._alias_targets),
+                         total_pop=data.total_pop if data else None)
+
+    @classmethod
+    def tokenize(cls, entry):
+        """Return list of (token, kind) tuples for entry"""
+        tokens = []
+        if entry.name:
+            name = entry.name.lower()
+            tokens.append((name, cls.NAME))
+            tokens.extend((name[i + 1:], cls.WORD)
+                          for i, c in enumerate(name) if c == ' ')
+        if entry.abbrev:
+            tokens.append((entry.abbrev.lower(), cls.ABBREV))
+        return tokens
+
+    def _populate(self, entries, fingerprint):
+        with self._lock:
+            self._entries = {}
+            self._tokens = []
+            self._path_children = {}
+            self._fingerprint = fingerprint
+            for entry in entries:
+                self._add(entry, insert=False)
+            self._tokens.sort()
+
+    def _add(self, entry, insert):
+        self._entries[entry.id] = entry
+        self._path_children.setdefault(entry.path_parent_id, set()).add(entry.id)
+        for token, kind in self.tokenize(entry):
+            if insert:
+                insort(self._tokens, (token, kind, entry.id))
+            else:
+                self._tokens.append((token, kind, entry.id))
+
+    def _remove(self, geo_id):
+        entry = self._entries.pop(geo_id, None)
+        if entry is None:
+            return
+        self._path_children[entry.path_parent_id].discard(geo_id)
+        for token, kind in self.tokenize(entry):
+            i = bisect_left(self._tokens, (token, kind, geo_id))
+            if i < len(self._tokens) and self._tokens[i] == (token, kind, geo_id):
+                del self._tokens[i]
+
+    def _token_range(self, match_string, exact):
+        lo = bisect_left(self._tokens, (match_string,))
+        upper = (match_string, self.ABBREV + 1) if exact else (match_string + '\U0010ffff',)
+        return lo, bisect_left(self._tokens, upper, lo)
+
+    @classmethod
+    def _matches(cls, entry, match_string, kinds, exact):
+        for token, kind in cls.tokenize(entry):
+            if kind in kinds and (token == match_string if exact
+                                  else token.startswith(match_string)):
+                return True
+        return False
+
+    @staticmethod
+    def _is_exact(entry, match_string):
+        return ((entry.name and entry.name.lower() == match_string) or
+                (entry.abbrev and entry.abbrev.lower() == match_string))
+
+    def _rank_key(self, geo_id):
+        total_pop = self._entries[geo_id].total_pop
+        return (total_pop is None, -(total_pop or 0), geo_id)
+
+    def _on_flush(self, session, flush_context):
+        # Session still holds pre-flush new/dirty/deleted collections.
+        # Changes are collected even if not yet built, in case the index
+        # is built (from prior data) before commit
+        if not self.enabled:
+            return
+        pending = session.info.setdefault(self.PENDING_TAG, {})
+        geos = set()
+        for inst in chain(session.new, session.dirty):
+            if isinstance(inst, Geo):
+                if inst in session.new or any(
+                        attributes.get_history(inst, field).has_changes()
+                        for field in ('_name', '_abbrev', '_path_parent',
+                                      '_alias_targets', '_data')):
+                    geos.add(inst)
+            elif isinstance(inst, GeoData):
+                geo_history = attributes.get_history(inst, '_geo')
+                if (inst in session.new or geo_history.has_changes() or
+                        attributes.get_history(inst, 'total_pop').has_changes()):
+                    geos.update(geo for geo in geo_history.sum() if geo is not None)
+
+        for inst in session.deleted:
+            if isinstance(inst, Geo):
+                geos.discard(inst)
+                pending[inst.id] = None
+            elif isinstance(inst, GeoData):
+                geos.update(geo for geo in attributes.get_history(inst, '_geo').sum()
+                            if geo is not None and geo not in session.deleted)
+
+        for geo in geos:
+            pending[geo.id] = self.form_entry(geo)
+
+    def _on_commit(self, session):
+        pending = session.info.pop(self.PENDING_TAG, None) or {}
+        with self._lock:
+            if not self.built:
+                return
+            for geo_id, entry in pending.items():
+                self._remove(geo_id)
+                if entry is not None:
+                    self._add(entry, insert=True)
+            # Own changes are applied, so advance past their increments
+            self._fingerprint = [
+                GeoVersion.committed(session, self._fingerprint[0]),
+                len(self._entries), max(self._entries, default=None)]
+
+    def _on_rollback(self, session):
+        session.info.pop(self.PENDING_TAG, None)
+
+    def __len__(self):
+        return len(self._entries) if self._entries is not None else 0
+
+    def __contains__(self, geo_id):
+        return self._entries is not None and geo_id in self._entries
+
+    def __init__(self, enabled=True, snapshot_path=None):
+        self.enabled = enabled
+        self.snapshot_path = snapshot_path
+        self._lock = RLock()
+        self.clear()
+
+
+geo_search_index = GeoSearchIndex(enabled=False)  # Enabled via configure
+
+event.listen(Session, 'after_flush', geo_search_index._on_flush)
+event.listen(Session, 'after_commit', geo_search_index._on_commit)
+event.listen(Session, 'after_rollback', geo_search_index._on_rollback)
@@ -0,0 +1,636 @@
+# -*- coding: utf-8 -*-
+import mmap
+import os
+import struct
+import tempfile
+from itertools import chain
+from threading import RLock
+
+import numpy as np
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from intertwine.utils.space import Area, Coordinate
+from .models import (Geo, GeoData, GeoLevel, geo_alias_association_table,
+                     geo_parent_child_association_table)
+from .versions import GeoVersion
+
+
+class StringColumn:
+    """
+    String Column
+
+    Read-only sequence of strings (or None) by index, decoded upon
+    access from a string table: a UTF-8 blob of concatenated strings
+    and an array of offsets into it, where refs[i] is the position of
+    the ith string in the table, or -1 for None.
+    """
+    def __getitem__(self, i):
+        ref = self.refs[i]
+        if ref < 0:
+            return None
+        start, end = self.offsets[ref], self.offsets[ref + 1]
+        return bytes(self.blob[start:end]).decode('utf-8')
+
+    def __len__(self):
+        return len(self.refs)
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def __init__(self, blob, offsets, refs):
+        self.blob = blob
+        self.offsets = offsets
+        self.refs = refs
+
+
+class GeoSnapshot:
+    """
+    Geo Snapshot
+
+    Immutable, compact in-memory snapshot of the whole geo graph, such
+    that read paths are pure in-memory lookups. Geos are held in order
+    by id and referenced by index. A snapshot consists of sections,
+    each a flat array:
+
+    - ids, path parents and level bitmasks are arrays by index
+    - data values are fixed-width records of DATA_FIELDS by index, with
+      MISSING in lieu of None and has_data flagging geos with data
+    - each relation (parents, children, path_children, aliases and
+      alias_targets) is an adjacency list in CSR form, an array of
+      offsets by index into an array of related indices
+    - human_ids, names and abbrevs are refs by index into a string
+      table shared by all three, along with the indices in order by
+      human_id, by which a human_id is found via binary search
+    - the geo fingerprint of the database from which the snapshot was
+      built (see GeoVersion.fingerprint), with MISSING in lieu of None
+
+    The API mirrors that of Geo, keyed by human_id:
+
+        snapshot = GeoSnapshot.build(session)
+        snapshot.get_related_geos('us/tx', Geo.CHILDREN, level=PLACE)
+        snapshot.top_level_key('us/tx/travis_county')
+
+    Snapshots are built from the database or loaded from a snapshot
+    file written via save(). The file consists of a header (MAGIC,
+    VERSION and section count), a table of sections (name, offset and
+    size) and the sections themselves, as little-endian arrays aligned
+    to ALIGNMENT bytes. Loading memory-maps the file and the sections
+    are read-only views of the map, so loading takes no copies and all
+    processes loading the file share a single page cache copy. Files
+    whose header or section table is invalid, or whose fingerprint
+    does not match the one given, are rejected with ValueError. Use
+    validate() to check a snapshot against the database in full.
+
+    The snapshot of the current process is held by geo_snapshot_cache.
+    """
+    MAGIC = b'GEOSNAP\x00'
+    VERSION = 3
+    HEADER = struct.Struct('<8sII')  # magic, version, section count
+    SECTION = struct.Struct('<32sQQ')  # name, offset, size in bytes
+    ALIGNMENT = 8
+
+    LEVELS = tuple(GeoLevel.DOWN)
+    LEVEL_BITS = {level: 1 << i for i, level in enumerate(LEVELS)}
+
+    RELATIONS = (Geo.PARENTS, Geo.CHILDREN, Geo.PATH_CHILDREN, Geo.ALIASES,
+                 Geo.ALIAS_TARGETS)
+
+    DATA_FIELDS = ('total_pop', 'urban_pop', '_latitude', '_longitude',
+                   '_land_area', '_water_area')
+    MISSING = np.iinfo(np.int64).min
+
+    NONE = -1  # Index of missing path parent or string
+
+    FINGERPRINT_LENGTH = 3  # Geo version, geo count and max geo id
+
+    STRING_FIELDS = ('human_ids', 'names', 'abbrevs')
+
+    # Sections in file order, with their dtypes
+    SECTIONS = tuple(chain(
+        (('ids', '<i8'),
+         ('path_parents', '<i8'),
+         ('level_masks', '<i8'),
+         ('data', '<i8'),
+         ('has_data', '|b1'),
+         ('strings', '|u1'),
+         ('string_offsets', '<i8'),
+         ('human_id_refs', '<i8'),
+         ('name_refs', '<i8'),
+         ('abbrev_refs', '<i8'),
+         ('human_id_order', '<i8'),
+         ('fingerprint', '<i8')),
+        *((('{}_offsets'.format(relation), '<i8'),
+           ('{}_targets'.format(relation), '<i8'))
+          for relation in RELATIONS)))
+
+    # Sections by index of geo, with their number of values per geo
+    INDEX_SECTIONS = dict(chain(
+        ((name, 1) for name in ('ids', 'path_parents', 'level_masks',
+                                'has_data', 'human_id_refs', 'name_refs',
+                                'abbrev_refs', 'human_id_order')),
+        (('data', len(DATA_FIELDS)),)))
+
+    @property
+    def fingerprint(self):
+        """Geo fingerprint of the database the snapshot was built from"""
+        return [None if value == self.MISSING else value
+                for value in self.sections['fingerprint'].tolist()]
+
+    @classmethod
+    def build(cls, session):
+        """Build snapshot from the database"""
+        fingerprint = np.array(
+            [cls.MISSING if value is None else value
+             for value in GeoVersion.fingerprint(session)], np.int64)
+        g = Geo.__table__.c
+        geo_rows = session.execute(
+            select([g.id, g.human_id, g.name, g.abbrev, g.path_parent_id])
+            .order_by(g.id)).fetchall()
+        count = len(geo_rows)
+        ids = np.fromiter((row[0] for row in geo_rows), np.int64, count)
+
+        def index(geo_ids):
+            return np.searchsorted(ids, np.asarray(geo_ids, np.int64))
+
+        path_parents = np.full(count, cls.NONE, np.int64)
+        with_path_parent = [(i, row[4]) for i, row in enumerate(geo_rows)
+                            if row[4] is not None]
+        if with_path_parent:
+            children, parent_ids = zip(*with_path_parent)
+            path_parents[list(children)] = index(parent_ids)
+
+        d = GeoData.__table__.c
+        data = np.full((count, len(cls.DATA_FIELDS)), cls.MISSING, np.int64)
+        has_data = np.zeros(count, np.bool_)
+        data_rows = session.execute(
+            select([d.geo_id] + [d[field] for field in cls.DATA_FIELDS])
+        ).fetchall()
+        if data_rows:
+            indices = index([row[0] for row in data_rows])
+            data[indices] = [[cls.MISSING if value is None else value
+                              for value in row[1:]] for row in data_rows]
+            has_data[indices] = True
+
+        lvl = GeoLevel.__table__.c
+        level_masks = np.zeros(count, np.int64)
+        level_rows = session.execute(
+            select([lvl.geo_id, lvl.level])
+            .where(lvl.geo_id.isnot(None))).fetchall()
+        if level_rows:
+            np.bitwise_or.at(
+                level_masks, index([row[0] for row in level_rows]),
+                [cls.LEVEL_BITS.get(row[1], 0) for row in level_rows])
+
+        pc = geo_parent_child_association_table.c
+        pairs = session.execute(select([pc.parent_id, pc.child_id])).fetchall()
+        parents, children = (index([pair[i] for pair in pairs])
+                             for i in range(2))
+        a = geo_alias_association_table.c
+        pairs = session.execute(
+            select([a.alias_target_id, a.alias_id])).fetchall()
+        alias_targets, aliases = (index([pair[i] for pair in pairs])
+                                  for i in range(2))
+        path_children = np.flatnonzero(path_parents != cls.NONE)
+
+        adjacency = {
+            Geo.PARENTS: cls._csr(children, parents, count),
+            Geo.CHILDREN: cls._csr(parents, children, count),
+            Geo.PATH_CHILDREN: cls._csr(path_parents[path_children],
+                                        path_children, count),
+            Geo.ALIASES: cls._csr(alias_targets, aliases, count),
+            Geo.ALIAS_TARGETS: cls._csr(aliases, alias_targets, count),
+        }
+
+        human_ids = [row[1] for row in geo_rows]
+        strings, string_offsets, (human_id_refs, name_refs, abbrev_refs) = (
+            cls._string_table(human_ids, (row[2] for row in geo_rows),
+                              (row[3] for row in geo_rows)))
+        human_id_order = np.array(
+            sorted(range(count), key=human_ids.__getitem__), np.int64)
+
+        sections = dict(ids=ids,
+                        path_parents=path_parents,
+                        level_masks=level_masks,
+                        data=data,
+                        has_data=has_data,
+                        strings=strings,
+                        string_offsets=string_offsets,
+                        human_id_refs=human_id_refs,
+                        name_refs=name_refs,
+                        abbrev_refs=abbrev_refs,
+                        human_id_order=human_id_order,
+                        fingerprint=fingerprint)
+        for relation, (offsets, targets) in adjacency.items():
+            sections['{}_offsets'.format(relation)] = offsets
+            sections['{}_targets'.format(relation)] = targets
+        return cls(sections)
+
+    @staticmethod
+    def _csr(sources, targets, count):
+        """Return (offsets, targets) adjacency lists in CSR form"""
+        sources = np.asarray(sources, np.int64)
+        targets = np.asarray(targets, np.int64)
+        order = np.lexsort((targets, sources))
+        offsets = np.zeros(count + 1, np.int64)
+        np.cumsum(np.bincount(sources, minlength=count), out=offsets[1:])
+        return offsets, targets[order]
+
+    @classmethod
+    def _string_table(cls, *columns):
+        """Return blob, offsets and refs by column of shared string table"""
+        refs_by_string = {}
+        encoded = []
+        offsets = [0]
+        column_refs = []
+        for column in columns:
+            refs = []
+            for string in column:
+                if string is None:
+                    refs.append(cls.NONE)
+                    continue
+                ref = refs_by_string.get(string)
+                if ref is None:
+                    ref = refs_by_string[string] = len(encoded)
+                    encoded.append(string.encode('utf-8'))
+                    offsets.append(offsets[-1] + len(encoded[-1]))
+                refs.append(ref)
+            column_refs.append(np.array(refs, np.int64))
+        blob = b''.join(encoded)
+        blob = (np.frombuffer(blob, np.uint8) if blob
+                else np.zeros(0, np.uint8))
+        return blob, np.array(offsets, np.int64), column_refs
+
+    def save(self, path):
+        """Save snapshot to file at path"""
+        alignment = self.ALIGNMENT
+        offset = self.HEADER.size + self.SECTION.size * len(self.SECTIONS)
+        table = []
+        arrays = []
+        for name, dtype in self.SECTIONS:
+            array = np.ascontiguousarray(self.sections[name], dtype)
+            offset += -offset % alignment
+            table.append(self.SECTION.pack(name.encode('ascii'), offset,
+                                           array.nbytes))
+            arrays.append((offset, array))
+            offset += array.nbytes
+
+        # Write to a unique temp file, so concurrent saves do not collide
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.')
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                file.write(self.HEADER.pack(self.MAGIC, self.VERSION,
+                                            len(self.SECTIONS)))
+                file.writelines(table)
+                for offset, array in arrays:
+                    file.write(b'\x00' * (offset - file.tell()))
+                    file.write(array.tobytes())
+            os.replace(temp_path, path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+    @classmethod
+    def load(cls, path, fingerprint=None):
+        """
+        Load snapshot from file at path via memory map (zero-copy)
+
+        I/O:
+        path: path of snapshot file
+        fingerprint=None: if provided, geo fingerprint of the database,
+            which the snapshot must match
+        raise: ValueError if the file is not a valid snapshot of this
+            version or does not match the fingerprint
+        """
+        with open(path, 'rb') as file:
+            if os.fstat(file.fileno()).st_size < cls.HEADER.size:
+                raise ValueError('Truncated geo snapshot: {}'.format(path))
+            buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        snapshot = cls(cls._read_sections(buffer, path), buffer=buffer)
+        if fingerprint is not None and snapshot.fingerprint != fingerprint:
+            raise ValueError('Geo snapshot does not match database: '
+                             '{!r}'.format(snapshot.fingerprint))
+        return snapshot
+
+    @classmethod
+    def _read_sections(cls, buffer, path):
+        """Return sections read from buffer, validating the table"""
+        magic, version, count = cls.HEADER.unpack_from(buffer, 0)
+        if magic != cls.MAGIC:
+            raise ValueError('Not a geo snapshot: {}'.format(path))
+        if version != cls.VERSION:
+            raise ValueError('Unsupported geo snapshot version: '
+                             '{!r}'.format(version))
+        if cls.HEADER.size + cls.SECTION.size * count > len(buffer):
+            raise ValueError('Truncated geo snapshot: {}'.format(path))
+
+        dtypes = dict(cls.SECTIONS)
+        sections = {}
+        for i in range(count):
+            name, offset, size = cls.SECTION.unpack_from(
+                buffer, cls.HEADER.size + cls.SECTION.size * i)
+            name = name.rstrip(b'\x00').decode('ascii', 'replace')
+            if name not in dtypes or name in sections:
+                raise ValueError('Unknown or repeated geo snapshot section: '
+                                 '{!r}'.format(name))
+            dtype = np.dtype(dtypes[name])
+            if offset + size > len(buffer):
+                raise ValueError('Truncated geo snapshot: {}'.format(path))
+            if size % dtype.itemsize:
+                raise ValueError('Invalid size of geo snapshot section: '
+                                 '{!r}'.format(name))
+            sections[name] = (
+                np.frombuffer(buffer, dtype, size // dtype.itemsize, offset)
+                if size else np.zeros(0, dtype))
+
+        missing = dtypes.keys() - sections.keys()
+        if missing:
+            raise ValueError('Missing geo snapshot sections: {}'.format(
+                ', '.join(sorted(missing))))
+        # Per-geo sections must agree on the number of geos
+        count = len(sections['ids'])
+        lengths = dict(
+            ((name, count * width)
+             for name, width in cls.INDEX_SECTIONS.items()),
+            fingerprint=cls.FINGERPRINT_LENGTH,
+            **{'{}_offsets'.format(relation): count + 1
+               for relation in cls.RELATIONS})
+        for name, length in lengths.items():
+            if len(sections[name]) != length:
+                raise ValueError('Invalid length of geo snapshot section: '
+                                 '{!r}'.format(name))
+        if not len(sections['string_offsets']):
+            raise ValueError("Invalid length of geo snapshot section: "
+                             "'string_offsets'")
+        return sections
+
+    def validate(self, session):
+        """
+        Validate snapshot against the database
+
+        I/O:
+        session: session of the database
+        return: list of descriptions of discrepancies; empty if valid
+        """
+        expected = self.build(session)
+        errors = []
+        if len(self) != len(expected):
+            errors.append('{:,} geos in snapshot but {:,} in database'
+                          .format(len(self), len(expected)))
+
+        string_sections = {'strings', 'string_offsets', 'human_id_refs',
+                           'name_refs', 'abbrev_refs'}
+        for name, _ in self.SECTIONS:
+            if name in string_sections:
+                continue  # Compared as strings below
+            # Loaded sections are flat, so compare irrespective of shape
+            if not np.array_equal(np.ravel(self.sections[name]),
+                                  np.ravel(expected.sections[name])):
+                errors.append('Section {} differs from database'.format(name))
+
+        for field in self.STRING_FIELDS:
+            if list(getattr(self, field)) != list(getattr(expected, field)):
+                errors.append('{} differ from database'.format(field))
+        return errors
+
+    def find(self, human_id):
+        """Return index of geo with human_id, or None if none"""
+        order, human_ids = self.human_id_order, self.human_ids
+        lo, hi = 0, len(order)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if human_ids[order[mid]] < human_id:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(order) and human_ids[order[lo]] == human_id:
+            return int(order[lo])
+        return None
+
+    def index(self, human_id):
+        """Return index of geo with human_id, raising KeyError if none"""
+        index = self.find(human_id)
+        if index is None:
+            raise KeyError(human_id)
+        return index
+
+    def geo_id(self, human_id):
+        """Return id of geo with human_id"""
+        return int(self.ids[self.index(human_id)])
+
+    def path_parent(self, human_id):
+        """Return human_id of path parent, or None if none"""
+        path_parent = self.path_parents[self.index(human_id)]
+        return self.human_ids[path_parent] if path_parent != self.NONE else None
+
+    def data(self, human_id):
+        """Return GeoData.Record of geo data, or None if none"""
+        i = self.index(human_id)
+        if not self.has_data[i]:
+            return None
+        values = dict(zip(self.DATA_FIELDS, (
+            None if value == self.MISSING else value
+            for value in self.records[i].tolist())))
+        return GeoData.Record(
+            total_pop=values['total_pop'],
+            urban_pop=values['urban_pop'],
+            latitude=self._requantize(Coordinate, values['_latitude']),
+            longitude=self._requantize(Coordinate, values['_longitude']),
+            land_area=self._requantize(Area, values['_land_area']),
+            water_area=self._requantize(Area, values['_water_area']))
+
+    @staticmethod
+    def _requantize(cls, value):
+        return cls(value, requantize=True) if value is not None else None
+
+    def levels(self, human_id):
+        """Return set of levels of geo"""
+        mask = self.level_masks[self.index(human_id)]
+        return {level for level in self.LEVELS if mask & self.LEVEL_BITS[level]}
+
+    def level_down_keys(self, human_id):
+        """Return levels of geo, top down"""
+        levels = self.levels(human_id)
+        return (lvl for lvl in GeoLevel.DOWN if lvl in levels)
+
+    def level_up_keys(self, human_id):
+        """Return levels of geo, bottom up"""
+        levels = self.levels(human_id)
+        return (lvl for lvl in GeoLevel.UP if lvl in levels)
+
+    def top_level_key(self, human_id):
+        """Return top level of geo, or None if no levels"""
+        return next(self.level_down_keys(human_id), None)
+
+    def bottom_level_key(self, human_id):
+        """Return bottom level of geo, or None if no levels"""
+        return next(self.level_up_keys(human_id), None)
+
+    def related_indices(self, index, relation):
+        """Return array of indices of geos related to geo at index"""
+        offsets, targets = self.adjacency[relation]
+        return targets[offsets[index]:offsets[index + 1]]
+
+    def get_related_geos(self, human_id, relation, level=None,
+                         include_aliases=False):
+        """
+        Get related geos (e.g. parents/children)
+
+        Given a relation, returns a list of human_ids of related geos at
+        the given level (if specified), as with Geo.get_related_geos.
+
+        I/O:
+        human_id: human_id of the geo
+        relation: parents, children, path_children, etc.
+        level=None: filter results by level, if provided
+        include_aliases=False: if True, include aliases and geos
+            without data
+        return: list of human_ids in descending order by total
+            population, with geos lacking population last, followed by id
+        """
+        if relation not in self.adjacency:
+            raise ValueError('{rel} is not an allowed value for relation'
+                             .format(rel=relation))
+
+        indices = self.related_indices(self.index(human_id), relation)
+        if level:
+            level_bit = self.LEVEL_BITS.get(level, 0)
+            indices = indices[(self.level_masks[indices] & level_bit) != 0]
+        if not include_aliases:
+            offsets = self.adjacency[Geo.ALIAS_TARGETS][0]
+            is_alias = offsets[indices + 1] > offsets[indices]
+            indices = indices[self.has_data[indices] & ~is_alias]
+
+        total_pops = self.records[indices, 0]
+        total_pops = np.where(total_pops == self.MISSING, -1, total_pops)
+        ranked = indices[np.lexsort((indices, -total_pops))]
+        return [self.human_ids[i] for i in ranked.tolist()]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, human_id):
+        return self.find(human_id) is not None
+
+    def __init__(self, sections, buffer=None):
+        self.sections = sections
+        self._buffer = buffer  # Memory map backing the sections, if any
+        for array in sections.values():
+            array.flags.writeable = False  # Immutable
+
+        self.ids = sections['ids']
+        self.path_parents = sections['path_parents']
+        self.level_masks = sections['level_masks']
+        self.records = sections['data'].reshape(-1, len(self.DATA_FIELDS))
+        self.has_data = sections['has_data']
+        self.adjacency = {
+            relation: (sections['{}_offsets'.format(relation)],
+                       sections['{}_targets'.format(relation)])
+            for relation in self.RELATIONS}
+
+        strings, offsets = sections['strings'], sections['string_offsets']
+        self.human_ids = StringColumn(strings, offsets,
+                                      sections['human_id_refs'])
+        self.names = StringColumn(strings, offsets, sections['name_refs'])
+        self.abbrevs = StringColumn(strings, offsets, sections['abbrev_refs'])
+        self.human_id_order = sections['human_id_order']
+
+
+class GeoSnapshotCache:
+    """
+    Geo Snapshot Cache
+
+    Holds the geo snapshot of the current process. On first use, the
+    snapshot is loaded from the snapshot file when one exists whose geo
+    fingerprint matches the database, and otherwise built from the
+    database (and saved, if a path is configured). Upon commit of any
+    ORM change to geos, their data or levels, or once geos are changed
+    by another process, per the shared geo version, the snapshot is
+    discarded, such that it is reloaded or rebuilt on next use.
+    """
+    PENDING_TAG = 'geo_snapshot_pending'
+
+    @property
+    def built(self):
+        return self._snapshot is not None
+
+    def configure(self, enabled=None, snapshot_path=None):
+        """Configure cache, which loads snapshot at path on first use"""
+        with self._lock:
+            if enabled is not None:
+                self.enabled = enabled
+            if snapshot_path is not None:
+                self.snapshot_path = snapshot_path
+            self.clear()
+
+    def clear(self):
+        """Clear snapshot, such that it is rebuilt on next use"""
+        with self._lock:
+            self._snapshot = None
+
+    def get(self, session):
+        """
+        Return current snapshot
+
+        Discard the snapshot if geos have been changed by another
+        process since it was built. Then, if none, load the snapshot
+        file if it matches the database, or else build the snapshot.
+        """
+        snapshot = self._snapshot
+        if (snapshot is not None and
+                GeoVersion.read(session) != snapshot.fingerprint[0]):
+            self.clear()
+            snapshot = None
+        if snapshot is None:
+            with self._lock:
+                snapshot = self._snapshot
+                if snapshot is None:
+                    snapshot = self._snapshot = (
+                        self._load_current(session) or
+                        self._build_and_save(session))
+        return snapshot
+
+    def _load_current(self, session):
+        """Load snapshot file if it matches the database, or None"""
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return None
+        try:
+            return GeoSnapshot.load(
+                self.snapshot_path,
+                fingerprint=GeoVersion.fingerprint(session))
+        except ValueError:
+            return None
+
+    def _build_and_save(self, session):
+        """Build snapshot, saving it if a path is configured"""
+        snapshot = GeoSnapshot.build(session)
+        if self.snapshot_path:
+            snapshot.save(self.snapshot_path)
+        return snapshot
+
+    def _on_flush(self, session, flush_context):
+        if not self.enabled or not self.built:
+            return
+        if any(isinstance(inst, (Geo, GeoData, GeoLevel))
+               for inst in chain(session.new, session.dirty, session.deleted)):
+            session.info[self.PENDING_TAG] = True
+
+    def _on_commit(self, session):
+        if session.info.pop(self.PENDING_TAG, None):
+            self.clear()
+
+    def _on_rollback(self, session):
+        session.info.pop(self.PENDING_TAG, None)
+
+    def __init__(self, enabled=True, snapshot_path=None):
+        self.enabled = enabled
+        self.snapshot_path = snapshot_path
+        self._lock = RLock()
+        self.clear()
+
+
+geo_snapshot_cache = GeoSnapshotCache(enabled=False)  # Enabled via configure
+
+event.listen(Session, 'after_flush', geo_snapshot_cache._on_flush)
+event.listen(Session, 'after_commit', geo_snapshot_cache._on_commit)
+event.listen(Session, 'after_rollback', geo_snapshot_cache._on_rollback)
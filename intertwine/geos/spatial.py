@@ -0,0 +1,411 @@
+# -*- coding: utf-8 -*-
+from itertools import chain
+from threading import RLock
+
+import numpy as np
+from sqlalchemy import and_, event, false, or_, select
+from sqlalchemy.orm import Session, attributes
+
+from intertwine.utils.space import Coordinate
+from .models import Geo, GeoData, GeoLevel
+from .versions import GeoVersion
+
+
+class GeoSpatialIndex:
+    """
+    Geo Spatial Index
+
+    Process-wide index of geo data locations consulted by
+    Geo.find_nearest and Geo.find_within, so reverse geocoding of user
+    locations needs no table scan.
+
+    Locations are held in NumPy arrays sorted by cell of a grid of
+    CELL_DEGREES squares, such that the locations in each row of cells
+    are contiguous and a box is searched via a bisected range per row.
+    Nearest geos are found by growing a box around the point until it
+    holds k candidates and then searching the box bounding the kth
+    nearest great-circle distance. Each location is held along with the
+    total population and a bitmask of the levels of its geo, by which
+    searches may be filtered.
+
+    The index is built lazily from the database on first search and is
+    cleared upon commit of any ORM change to geo data locations or
+    populations or to geo levels, such that it is rebuilt on the next
+    search. Once geos are changed by another process, per the shared
+    geo version, the index is likewise cleared.
+
+    While the index is disabled, query_nearest and query_within answer
+    the same searches via SQL queries bounded by a box around the point
+    or by the box itself, rather than building an index of all geos.
+    """
+    CELL_DEGREES = 1
+    ROWS = 180 // CELL_DEGREES
+    COLUMNS = 360 // CELL_DEGREES
+
+    EARTH_RADIUS = 6371.0088  # Mean radius in km
+
+    LEVEL_BITS = {level: 1 << i for i, level in enumerate(GeoLevel.DOWN)}
+
+    PENDING_TAG = 'geo_spatial_index_pending'
+
+    @property
+    def built(self):
+        return self._ids is not None
+
+    def configure(self, enabled=None):
+        """Configure index"""
+        with self._lock:
+            if enabled is not None:
+                self.enabled = enabled
+            if not self.enabled:
+                self.clear()
+
+    def clear(self):
+        """Clear index, such that it is rebuilt on next search"""
+        with self._lock:
+            self._ids = self._cells = None
+            self._latitudes = self._longitudes = None
+            self._total_pops = self._level_masks = None
+            self._version = None
+
+    def build(self, session, bounds=None, level=None, min_pop=None):
+        """
+        Build index from the database
+
+        I/O:
+        session: session on which to query
+        bounds=None: if provided, (south, west, north, east) box to
+            which the index is limited, as with within
+        level=None: if provided, only geos with the level are indexed
+        min_pop=None: if provided, only geos with at least this total
+            population are indexed
+        """
+        version = GeoVersion.read(session)
+        d = GeoData.__table__.c
+        criterion = (d._latitude.isnot(None) & d._longitude.isnot(None)
+                     if bounds is None and level is None and min_pop is None
+                     else self._box_criterion(
+                         *(bounds or (-90, -180, 90, 180)), level=level,
+                         min_pop=min_pop))
+        rows = session.execute(
+            select([d.geo_id, d._latitude, d._longitude, d.total_pop])
+            .where(criterion).order_by(d.geo_id)).fetchall()
+
+        level_masks = {}
+        lvl = GeoLevel.__table__.c
+        level_query = select([lvl.geo_id, lvl.level])
+        if bounds is not None or level is not None or min_pop is not None:
+            level_query = level_query.where(
+                lvl.geo_id.in_(select([d.geo_id]).where(criterion)))
+        for geo_id, geo_level in session.execute(level_query):
+            level_masks[geo_id] = (level_masks.get(geo_id, 0) |
+                                   self.LEVEL_BITS.get(geo_level, 0))
+
+        count = len(rows)
+        multiplier = 10 ** Coordinate.DEFAULT_PRECISION
+        ids = np.fromiter((row[0] for row in rows), np.int64, count)
+        latitudes = np.fromiter((row[1] for row in rows), np.float64,
+                                count) / multiplier
+        longitudes = np.fromiter((row[2] for row in rows), np.float64,
+                                 count) / multiplier
+        total_pops = np.fromiter((-1 if row[3] is None else row[3]
+                                  for row in rows), np.int64, count)
+        masks = np.fromiter((level_masks.get(row[0], 0) for row in rows),
+                            np.int64, count)
+
+        cells = self._cell(latitudes, longitudes)
+        order = np.argsort(cells, kind='stable')  # Ids ascend within cells
+        with self._lock:
+            self._ids, self._cells = ids[order], cells[order]
+            self._latitudes = latitudes[order]
+            self._longitudes = longitudes[order]
+            self._total_pops = total_pops[order]
+            self._level_masks = masks[order]
+            self._version = version
+
+    def ensure_built(self, session):
+        """
+        Ensure index is built and current
+
+        Clear the index if geos have been changed by another process
+        since it was built and then build it if not built.
+        """
+        if (self._ids is not None and
+                GeoVersion.read(session) != self._version):
+            self.clear()
+        if self._ids is None:
+            with self._lock:
+                if self._ids is None:
+                    self.build(session)
+
+    def nearest(self, latitude, longitude, k=1, level=None, min_pop=None):
+        """
+        Nearest
+
+        I/O:
+        latitude: latitude of the point in degrees
+        longitude: longitude of the point in degrees
+        k=1: max number of geos to return
+        level=None: if provided, only geos with the level are returned
+        min_pop=None: if provided, only geos with at least this total
+            population are returned
+        return: list of (geo id, distance in km) tuples, nearest first,
+            with ties in order of geo id
+        """
+        latitude, longitude = float(latitude), float(longitude)
+        with self._lock:
+            if k < 1 or not len(self._ids):
+                return []
+            radius = self.CELL_DEGREES
+            while True:
+                indices = self._box_indices(
+                    latitude - radius, longitude - radius,
+                    latitude + radius, longitude + radius, level, min_pop)
+                if len(indices) >= k or radius >= 180:
+                    break
+                radius *= 2
+            if not len(indices):
+                return []
+
+            distances = self._distances(latitude, longitude, indices)
+            if len(indices) >= k:
+                # Any of the k nearest lie within the kth distance
+                kth_distance = np.partition(distances, k - 1)[k - 1]
+                indices = self._circle_indices(
+                    latitude, longitude, kth_distance, level, min_pop)
+                distances = self._distances(latitude, longitude, indices)
+
+            ids = self._ids[indices]
+            nearest = np.lexsort((ids, distances))[:k]
+            return list(zip(ids[nearest].tolist(),
+                            distances[nearest].tolist()))
+
+    def within(self, south, west, north, east, level=None, min_pop=None,
+               limit=None):
+        """
+        Within
+
+        I/O:
+        south/west/north/east: bounds of the box in degrees, where west
+            may exceed east if the box spans the antimeridian
+        level=None: if provided, only geos with the level are returned
+        min_pop=None: if provided, only geos with at least this total
+            population are returned
+        limit=None: if provided, return only the most populous geos
+        return: list of geo ids in descending order by total population,
+            with geos lacking population last, followed by id
+        """
+        if west > east:
+            east += 360
+        with self._lock:
+            indices = self._box_indices(south, west, north, east, level,
+                                        min_pop)
+            ids = self._ids[indices]
+            ranked = np.lexsort((ids, -self._total_pops[indices]))
+            if limit is not None and limit >= 0:
+                ranked = ranked[:limit]
+            return ids[ranked].tolist()
+
+    def _cell(self, latitudes, longitudes):
+        rows = np.clip((latitudes + 90) // self.CELL_DEGREES,
+                       0, self.ROWS - 1).astype(np.int64)
+        columns = np.clip((longitudes + 180) // self.CELL_DEGREES,
+                          0, self.COLUMNS - 1).astype(np.int64)
+        return rows * self.COLUMNS + columns
+
+    def _row(self, latitude):
+        return min(max(int((latitude + 90) // self.CELL_DEGREES), 0),
+                   self.ROWS - 1)
+
+    def _column(self, longitude):
+        return min(max(int((longitude + 180) // self.CELL_DEGREES), 0),
+                   self.COLUMNS - 1)
+
+    @staticmethod
+    def _longitude_ranges(west, east):
+        """Return list of (west, east) ranges within -180..180"""
+        width = east - west
+        if width >= 360:
+            return [(-180, 180)]
+        west = (west + 180) % 360 - 180
+        east = west + width
+        if east <= 180:
+            return [(west, east)]
+        return [(west, 180), (-180, east - 360)]
+
+    def _box_indices(self, south, west, north, east, level, min_pop):
+        south, north = max(south, -90), min(north, 90)
+        selected = []
+        rows = np.arange(self._row(south), self._row(north) + 1)
+        for range_west, range_east in (self._longitude_ranges(west, east)
+                                       if south <= north else ()):
+            starts = np.searchsorted(
+                self._cells, rows * self.COLUMNS + self._column(range_west))
+            ends = np.searchsorted(
+                self._cells, rows * self.COLUMNS + self._column(range_east) + 1)
+            ranges = [np.arange(start, end)
+                      for start, end in zip(starts, ends) if end > start]
+            if not ranges:
+                continue
+            indices = np.concatenate(ranges)
+            latitudes = self._latitudes[indices]
+            longitudes = self._longitudes[indices]
+            selected.append(indices[
+                (latitudes >= south) & (latitudes <= north) &
+                (longitudes >= range_west) & (longitudes <= range_east)])
+
+        indices = (np.concatenate(selected) if selected
+                   else np.empty(0, np.int64))
+        if level is not None:
+            level_bit = self.LEVEL_BITS.get(level, 0)
+            indices = indices[(self._level_masks[indices] & level_bit) != 0]
+        if min_pop is not None:
+            indices = indices[self._total_pops[indices] >= min_pop]
+        return indices
+
+    def _circle_indices(self, latitude, longitude, distance, level, min_pop):
+        """Return indices within the box bounding the circle"""
+        return self._box_indices(
+            *self._circle_bounds(latitude, longitude, distance),
+            level=level, min_pop=min_pop)
+
+    @classmethod
+    def _circle_bounds(cls, latitude, longitude, distance):
+        """Return (south, west, north, east) box bounding the circle"""
+        distance = distance * (1 + 1e-9) + 1e-9  # Allow for rounding
+        delta = distance / cls.EARTH_RADIUS  # Angular radius
+        south = latitude - np.degrees(delta)
+        north = latitude + np.degrees(delta)
+        if south <= -90 or north >= 90 or delta >= np.pi / 2:
+            west, east = -180, 180  # Circle includes a pole
+        else:
+            longitude_delta = np.degrees(np.arcsin(
+                min(np.sin(delta) / np.cos(np.radians(latitude)), 1)))
+            west, east = longitude - longitude_delta, longitude + longitude_delta
+        return south, west, north, east
+
+    @classmethod
+    def query_nearest(cls, session, latitude, longitude, k=1, level=None,
+                      min_pop=None):
+        """
+        Query nearest
+
+        As nearest, but via the database rather than the index. A box
+        around the point is grown until it holds k geos and the box
+        bounding the kth nearest distance is then searched, each via a
+        transient index of the geos in the box.
+        """
+        latitude, longitude = float(latitude), float(longitude)
+        if k < 1:
+            return []
+        radius = cls.CELL_DEGREES
+        while True:
+            index = cls(enabled=False)
+            index.build(session, bounds=(
+                latitude - radius, longitude - radius,
+                latitude + radius, longitude + radius),
+                level=level, min_pop=min_pop)
+            if len(index) >= k or radius >= 180:
+                break
+            radius *= 2
+
+        nearest = index.nearest(latitude, longitude, k=k)
+        if len(nearest) == k and radius < 180:
+            # Any of the k nearest lie within the kth distance
+            index.build(session, bounds=cls._circle_bounds(
+                latitude, longitude, nearest[-1][1]),
+                level=level, min_pop=min_pop)
+            nearest = index.nearest(latitude, longitude, k=k)
+        return nearest
+
+    @classmethod
+    def query_within(cls, session, south, west, north, east, level=None,
+                     min_pop=None, limit=None):
+        """Query within, as within, but via the database, not the index"""
+        if west > east:
+            east += 360
+        d = GeoData.__table__.c
+        query = (select([d.geo_id])
+                 .where(cls._box_criterion(south, west, north, east,
+                                           level=level, min_pop=min_pop))
+                 .order_by(d.total_pop.is_(None), d.total_pop.desc(),
+                           d.geo_id))
+        if limit is not None and limit >= 0:
+            query = query.limit(limit)
+        return [geo_id for geo_id, in session.execute(query)]
+
+    @classmethod
+    def _box_criterion(cls, south, west, north, east, level=None,
+                       min_pop=None):
+        """Return SQL criterion selecting geo data within the box"""
+        south, north = max(south, -90), min(north, 90)
+        if south > north:
+            return false()
+        d = GeoData.__table__.c
+        multiplier = 10 ** Coordinate.DEFAULT_PRECISION
+        criteria = [
+            d._latitude >= south * multiplier,
+            d._latitude <= north * multiplier,
+            or_(*(and_(d._longitude >= range_west * multiplier,
+                       d._longitude <= range_east * multiplier)
+                  for range_west, range_east
+                  in cls._longitude_ranges(west, east)))]
+        if level is not None:
+            lvl = GeoLevel.__table__.c
+            criteria.append(d.geo_id.in_(
+                select([lvl.geo_id]).where(lvl.level == level)))
+        if min_pop is not None:
+            criteria.append(d.total_pop >= min_pop)
+        return and_(*criteria)
+
+    def _distances(self, latitude, longitude, indices):
+        """Return great-circle (haversine) distances in km"""
+        latitude1 = np.radians(latitude)
+        latitudes2 = np.radians(self._latitudes[indices])
+        half_dlat = (latitudes2 - latitude1) / 2
+        half_dlon = np.radians(self._longitudes[indices] - longitude) / 2
+        a = (np.sin(half_dlat) ** 2 +
+             np.cos(latitude1) * np.cos(latitudes2) * np.sin(half_dlon) ** 2)
+        return 2 * self.EARTH_RADIUS * np.arcsin(np.sqrt(np.minimum(a, 1)))
+
+    def _on_flush(self, session, flush_context):
+        if not self.enabled or not self.built:
+            return
+        for inst in chain(session.new, session.deleted):
+            if isinstance(inst, (GeoData, GeoLevel)) or (
+                    isinstance(inst, Geo) and inst in session.deleted):
+                session.info[self.PENDING_TAG] = True
+                return
+        for inst in session.dirty:
+            if isinstance(inst, GeoData):
+                fields = ('_latitude', '_longitude', 'total_pop', '_geo')
+            elif isinstance(inst, GeoLevel):
+                fields = ('_level', 'geo_id')
+            else:
+                continue
+            if any(attributes.get_history(inst, field).has_changes()
+                   for field in fields):
+                session.info[self.PENDING_TAG] = True
+                return
+
+    def _on_commit(self, session):
+        if session.info.pop(self.PENDING_TAG, None):
+            self.clear()
+
+    def _on_rollback(self, session):
+        session.info.pop(self.PENDING_TAG, None)
+
+    def __len__(self):
+        return len(self._ids) if self._ids is not None else 0
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._lock = RLock()
+        self.clear()
+
+
+geo_spatial_index = GeoSpatialIndex(enabled=False)  # Enabled via configure
+
+event.listen(Session, 'after_flush', geo_spatial_index._on_flush)
+event.listen(Session, 'after_commit', geo_spatial_index._on_commit)
+event.listen(Session, 'after_rollback', geo_spatial_index._on_rollback)
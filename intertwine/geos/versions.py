@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+from itertools import chain
+
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session, attributes
+
+from intertwine.utils.versions import shared_versions
+from .models import Geo, GeoData, GeoLevel
+
+
+class GeoVersion:
+    """
+    Geo Version
+
+    Shared version of geos (including their data and levels), which is
+    incremented upon flush of any change to them. Each process holding
+    in-memory geo structures (e.g. search and spatial indexes) records
+    the version from which a structure was built and discards the
+    structure once the version differs, such that changes committed by
+    other processes are seen within the shared versions interval:
+
+        if GeoVersion.read(session) != index_version:
+            index.clear()
+
+    Structures applying changes committed by their own process in place
+    advance their version past the increments of the commit, so they
+    are not discarded for changes already applied:
+
+        index_version = GeoVersion.committed(session, index_version)
+
+    The version is None while shared versions are disabled.
+    """
+    NAME = 'geo'
+
+    SPAN_TAG = 'geo_version_span'
+
+    # Geo relationships that change geo structures, beyond geo columns
+    COLLECTIONS = (Geo.PARENTS, Geo.CHILDREN, '_alias_targets', '_aliases',
+                   '_levels')
+
+    @classmethod
+    def read(cls, session):
+        """Return shared geo version, read at most once per interval"""
+        return shared_versions.read(session).get(cls.NAME)
+
+    @classmethod
+    def fingerprint(cls, session):
+        """
+        Return fingerprint of geos in the database
+
+        The fingerprint is a list of the shared geo version, the number
+        of geos and the max geo id, by which files derived from geos
+        (e.g. snapshots) may be validated against the database.
+        """
+        g = Geo.__table__.c
+        count, max_id = session.execute(
+            select([func.count(g.id), func.max(g.id)])).first()
+        return [cls.read(session), count, max_id]
+
+    @classmethod
+    def committed(cls, session, version):
+        """
+        Return version of a structure upon commit of session's changes
+
+        Increments hold the version row locked until commit, so if the
+        structure was current as of the first increment by the session's
+        transaction, it is current as of the last once the transaction's
+        changes are applied. Otherwise, the version is returned as is,
+        so the structure is discarded upon the next read.
+
+        I/O:
+        session: session being committed (i.e. within after_commit)
+        version: version of the structure, prior to applying changes
+        return: version of the structure, after applying changes
+        """
+        span = session.info.get(cls.SPAN_TAG)
+        if span is not None and span[0] == (version or 0):  # None if no row
+            return span[1]
+        return version
+
+    @classmethod
+    def has_changes(cls, session):
+        """Return True if session has pending changes to geos"""
+        if any(isinstance(inst, (Geo, GeoData, GeoLevel))
+               for inst in chain(session.new, session.deleted)):
+            return True
+        for inst in session.dirty:
+            if isinstance(inst, (GeoData, GeoLevel)):
+                if session.is_modified(inst):
+                    return True
+            elif isinstance(inst, Geo):
+                if session.is_modified(inst, include_collections=False):
+                    return True
+                # Avoid loading dynamic collections to compute history
+                if any(attributes.get_history(
+                        inst, field, passive=attributes.PASSIVE_NO_INITIALIZE)
+                       .has_changes() for field in cls.COLLECTIONS):
+                    return True
+        return False
+
+    @classmethod
+    def _on_flush(cls, session, flush_context):
+        # Session still holds pre-flush new/dirty/deleted collections
+        if shared_versions.enabled and cls.has_changes(session):
+            version = shared_versions.increment(session, {cls.NAME})[cls.NAME]
+            first, _ = session.info.get(cls.SPAN_TAG, (version - 1, None))
+            session.info[cls.SPAN_TAG] = (first, version)
+
+    @classmethod
+    def _on_commit(cls, session):
+        if cls.SPAN_TAG in session.info:
+            shared_versions.expire()  # Read own increments on next read
+
+    @classmethod
+    def _on_transaction_end(cls, session, transaction):
+        # Retained through after_commit, for use by structures
+        if transaction.parent is None:
+            session.info.pop(cls.SPAN_TAG, None)
+
+
+event.listen(Session, 'after_flush', GeoVersion._on_flush)
+event.listen(Session, 'after_commit', GeoVersion._on_commit)
+event.listen(Session, 'after_transaction_end', GeoVersion._on_transaction_end)
@@ -1,12 +1,21 @@
 # -*- coding: utf-8 -*-
+from collections import OrderedDict
+from operator import attrgetter
+from time import perf_counter
+
 import flask
 from flask import abort, jsonify, make_response, redirect, render_template, request
 
 from . import blueprint
-from .models import Geo, GeoLevel
+from .models import Geo, GeoData, GeoID, GeoLevel
 from intertwine.utils.jsonable import Jsonable
 from ..exceptions import InterfaceException, ResourceDoesNotExist
-from ..utils.flask_utils import crossdomain, json_requested
+from ..utils.flask_utils import (add_server_timing, crossdomain, json_encoder,
+                                 json_requested, stream_json)
+from ..utils.response_cache import response_cache
+
+TYPEAHEAD_MATCH_LIMIT = 10  # default number of typeahead matches
+TYPEAHEAD_MAX_MATCH_LIMIT = 50
 
 
 @blueprint.errorhandler(InterfaceException)
@@ -25,7 +34,11 @@ def handle_interface_exception(error):
 def render():
     """Base endpoint serving both pages and the API"""
     if json_requested():
+        if 'latitude' in request.args and 'longitude' in request.args:
+            return find_nearest_geos()
         match_string = request.args.get('match_string')
+        if request.args.get('typeahead', '').lower() in {'1', 'true'}:
+            return find_geo_typeahead_matches(match_string)
         return find_geo_matches(match_string)
 
     return render_index()
@@ -39,11 +52,21 @@ def render_index():
     # geos = [glvl.geo for glvl in glvls]
     if len(geos) == 1:
         geo = geos[0]
-        glvl = next(iter(geo.levels))
-        dlvl = GeoLevel.DOWN[glvl][0]
-
-        by_name = geo.get_related_geos(Geo.PATH_CHILDREN, level=dlvl,
-                                       order_by=Geo.name)
+        snapshot = Geo.get_snapshot()
+        if snapshot is not None and geo.human_id in snapshot:
+            glvl = snapshot.top_level_key(geo.human_id)
+            dlvl = GeoLevel.DOWN[glvl][0]
+            child_ids = [
+                snapshot.geo_id(human_id) for human_id in
+                snapshot.get_related_geos(geo.human_id, Geo.PATH_CHILDREN,
+                                          level=dlvl)]
+            by_name = sorted(Geo.get_by_ids(child_ids),
+                             key=attrgetter('name'))
+        else:
+            glvl = next(iter(geo.levels))
+            dlvl = GeoLevel.DOWN[glvl][0]
+            by_name = geo.get_related_geos(Geo.PATH_CHILDREN, level=dlvl,
+                                           order_by=Geo.name)
         by_designation = sorted(by_name,
                                 key=lambda g: g.levels[dlvl].designation)
         geos += by_designation
@@ -57,6 +80,36 @@ def render_index():
     return template
 
 
+def get_levels_by_geo_id(geos):
+    """
+    Get levels by geo id
+
+    Return dictionary of lists of levels (top down) by geo id, looked
+    up in the geo snapshot if enabled. Geos not in the snapshot, such
+    as those added since it was built, are looked up in a single query.
+    """
+    snapshot = Geo.get_snapshot() if geos else None
+    levels_by_geo_id = {}
+    missing_ids = []
+    for geo in geos:
+        if snapshot is not None and geo.human_id in snapshot:
+            levels_by_geo_id[geo.id] = list(
+                snapshot.level_down_keys(geo.human_id))
+        else:
+            missing_ids.append(geo.id)
+
+    if missing_ids:
+        levels = {}
+        rows = GeoLevel.query.with_entities(GeoLevel.geo_id, GeoLevel.level).filter(
+            GeoLevel.geo_id.in_(missing_ids))
+        for geo_id, level in rows:
+            levels.setdefault(geo_id, set()).add(level)
+        for geo_id in missing_ids:
+            levels_by_geo_id[geo_id] = [lvl for lvl in GeoLevel.DOWN
+                                        if lvl in levels.get(geo_id, ())]
+    return levels_by_geo_id
+
+
 def find_geo_matches(match_string, match_limit=None):
     """
     Find geo matches endpoint
@@ -83,6 +136,91 @@ def find_geo_matches(match_string, match_limit=None):
     return jsonify(Jsonable.jsonify_value(geo_matches, kwarg_map, **json_kwargs))
 
 
+def find_geo_typeahead_matches(match_string, match_limit=None):
+    """
+    Find geo typeahead matches endpoint
+
+    Keystroke-level variant of find geo matches. Only the top matches
+    (by population, with exact matches first) are retrieved, as the
+    limit is pushed into the search, and each is projected to just its
+    human_id, display and levels. Server-side timing is reported via
+    the Server-Timing header.
+
+    Usage:
+    curl -H 'accept:application/json' -X GET \
+    'http://localhost:5000/geos/?match_string=austin,%20tx&typeahead=1&match_limit=5'
+    """
+    start = perf_counter()
+    match_string = (match_string or '').strip('"\'')
+    match_limit = match_limit or int(request.args.get('match_limit', 0))
+    match_limit = min(match_limit if match_limit > 0 else TYPEAHEAD_MATCH_LIMIT,
+                      TYPEAHEAD_MAX_MATCH_LIMIT)
+
+    geo_matches = Geo.find_matches(match_string, limit=match_limit) if match_string else []
+    search_time = perf_counter() - start
+
+    levels_by_geo_id = get_levels_by_geo_id(geo_matches)
+
+    display_kwargs = Geo.jsonified_display.kwargs
+    matches_json = [
+        OrderedDict((
+            (Geo.HUMAN_ID, geo.human_id),
+            ('display', geo.display(**display_kwargs)),
+            (Geo.LEVELS, levels_by_geo_id[geo.id])))
+        for geo in geo_matches]
+
+    response = jsonify(matches_json)
+    return add_server_timing(response, ('search', search_time),
+                             ('total', perf_counter() - start))
+
+
+def find_nearest_geos(match_limit=None):
+    """
+    Find nearest geos endpoint
+
+    Reverse geocodes a location via the geo spatial index, optionally
+    limited to geos with the given level and a minimum population. Each
+    geo is projected to its human_id, display, levels and distance (in
+    km), nearest first. Server-side timing is reported via the
+    Server-Timing header.
+
+    Usage:
+    curl -H 'accept:application/json' -X GET \
+    'http://localhost:5000/geos/?latitude=30.27&longitude=-97.74&level=place&match_limit=5'
+    """
+    start = perf_counter()
+    try:
+        latitude = float(request.args['latitude'])
+        longitude = float(request.args['longitude'])
+        min_pop = request.args.get('min_pop')
+        min_pop = int(min_pop) if min_pop else None
+    except ValueError:
+        abort(400)
+    match_limit = match_limit or int(request.args.get('match_limit', 0))
+    match_limit = min(match_limit if match_limit > 0 else TYPEAHEAD_MATCH_LIMIT,
+                      TYPEAHEAD_MAX_MATCH_LIMIT)
+
+    nearest = Geo.find_nearest(latitude, longitude, k=match_limit,
+                               level=request.args.get('level') or None,
+                               min_pop=min_pop, distances=True)
+    search_time = perf_counter() - start
+
+    levels_by_geo_id = get_levels_by_geo_id([geo for geo, _ in nearest])
+
+    display_kwargs = Geo.jsonified_display.kwargs
+    nearest_json = [
+        OrderedDict((
+            (Geo.HUMAN_ID, geo.human_id),
+            ('display', geo.display(**display_kwargs)),
+            (Geo.LEVELS, levels_by_geo_id[geo.id]),
+            ('distance', round(distance, 3))))
+        for geo, distance in nearest]
+
+    response = jsonify(nearest_json)
+    return add_server_timing(response, ('search', search_time),
+                             ('total', perf_counter() - start))
+
+
 @blueprint.route(Geo.form_uri(Geo.Key('<path:geo_huid>'), sub_only=True), methods=['GET'])
 def get_geo(geo_huid):
     """Get geo endpoint"""
@@ -92,20 +230,27 @@ def get_geo(geo_huid):
     return get_geo_html(geo_huid)
 
 
+@response_cache.cached(Geo, GeoData, GeoID, GeoLevel, jsonable=Geo)
 def get_geo_json(geo_huid):
     """
     Get geo JSON
 
+    Unlimited requests (limit < 0) are streamed, as they may include
+    many thousands of related geos. Streamed responses are not cached.
+
     Usage:
     curl -H 'accept:application/json' -X GET \
     'http://localhost:5000/geos/us/tx/austin'
     """
     json_kwargs = dict(Geo.objectify_json_kwargs(request.args))
 
-    try:
-        geo = Geo.reconstruct(Geo.Key(geo_huid))
-    except KeyError as e:
-        raise ResourceDoesNotExist(str(e))
+    resolution = Geo.resolve_human_id(geo_huid)
+    if resolution is None:
+        raise ResourceDoesNotExist(cls=Geo.__name__, key=geo_huid)
+    geo = Geo.query.get(resolution.geo_id)
+
+    if json_kwargs.get('limit', 0) < 0:
+        return stream_json(Geo.iter_json(geo, encoder=json_encoder(), **json_kwargs))
 
     return jsonify(geo.jsonify(**json_kwargs))
 
@@ -113,11 +258,9 @@ def get_geo_json(geo_huid):
 def get_geo_html(geo_huid):
     """Geo Page"""
     geo_huid = geo_huid.lower()
-    geo_key = Geo.Key(geo_huid)
 
-    try:
-        geo = Geo.reconstruct(geo_key)
-    except KeyError:
+    resolution = Geo.resolve_human_id(geo_huid)
+    if resolution is None:
         # TODO: Instead of aborting, reroute to geo_not_found page
         # Oops! 'X' is not a geo found in Intertwine.
         # Did you mean:
@@ -126,10 +269,9 @@ def get_geo_html(geo_huid):
         # <geo_3>
         abort(404)
 
-    alias_targets = geo.alias_targets
-    if alias_targets:
-        target = alias_targets[0].human_id
-        return redirect('/geos/{}'.format(target), code=302)
+    if resolution.is_alias:
+        return redirect('/geos/{}'.format(resolution.human_id), code=302)
+    geo = Geo.query.get(resolution.geo_id)
     # Austin, Texas, United States
     title = geo.display()
 
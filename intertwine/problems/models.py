@@ -10,10 +10,12 @@ from titlecase import titlecase
 from url_normalize import url_normalize
 
 from intertwine import IntertwineModel
+from intertwine.geos.closure import GeoClosure
 from intertwine.geos.models import Geo
 from intertwine.trackable.exceptions import KeyMissingFromRegistryAndDatabase
 from intertwine.utils.analytics import average
 from intertwine.utils.enums import UriType
+from intertwine.utils.vardygr import vardygrify
 
 from .exceptions import (CircularConnection,
                          InconsistentArguments,
@@ -96,11 +98,12 @@ class AggregateProblemConnectionRating(BaseProblemModel):
     recalculated on each request. Ratings are aggregated across users
     within a community context of problem, org, and geo.
 
-    Currently, aggregations are only created when the problem network is
-    first rendered within a given community. The cumulative weight
-    across all the ratings aggregated is also stored, allowing the
-    aggregate rating to be updated without having to recalculate the
-    aggregation across all the included ratings.
+    Aggregations are created when the problem network is first rendered
+    within a given community. The cumulative weight across all the
+    ratings aggregated is also stored, allowing the aggregate rating to
+    be updated without having to recalculate the aggregation across all
+    the included ratings. Thereafter, aggregate ratings are maintained
+    as ratings are written (see Community.update_aggregate_ratings).
 
     I/O:
     community: Community context for the aggregate rating
@@ -119,7 +122,8 @@ class AggregateProblemConnectionRating(BaseProblemModel):
     """
     SUB_BLUEPRINT = 'rated_connections'
     STRICT = 'strict'
-    AGGREGATIONS = {STRICT}
+    INCLUSIVE = 'inclusive'
+    AGGREGATIONS = {STRICT, INCLUSIVE}
 
     NO_RATING = -1
     NO_WEIGHT = 0
@@ -255,6 +259,35 @@ class AggregateProblemConnectionRating(BaseProblemModel):
 
         return (aggregate_rating, aggregate_weight)
 
+    @classmethod
+    def query_ratings(cls, connection, community, aggregation=STRICT):
+        """
+        Query ratings
+
+        Return the ratings of the connection included by the aggregation
+        within the community:
+        - 'strict': ratings in the community's problem, org and geo
+        - 'inclusive': ratings in the community's problem and org within
+          the community's geo or any geo below it in the geo hierarchy;
+          a community without a geo (the world) includes all geos
+        """
+        problem, org, geo = community.derive_key()
+        if aggregation == cls.STRICT:
+            return ProblemConnectionRating.query.filter_by(
+                connection=connection, problem=problem, org=org, geo=geo).all()
+
+        if aggregation != cls.INCLUSIVE:
+            raise InvalidAggregation(aggregation=aggregation)
+
+        ratings = ProblemConnectionRating.query.filter_by(
+            connection=connection, problem=problem, org=org)
+        if geo is None:
+            return ratings.all()
+        return ratings.filter(or_(
+            ProblemConnectionRating.geo_id == geo.id,
+            ProblemConnectionRating.geo_id.in_(
+                GeoClosure.select_descendant_ids(geo.id)))).all()
+
     def update_values(self, new_user_rating, new_user_weight,
                       old_user_rating=None, old_user_weight=None):
         """Update aggregate rating/weight given rating/weight change"""
@@ -265,6 +298,10 @@ class AggregateProblemConnectionRating(BaseProblemModel):
         decrease = old_user_rating * old_user_weight
 
         new_aggregate_weight = self.weight + new_user_weight - old_user_weight
+        if new_aggregate_weight <= self.NO_WEIGHT:
+            self.rating, self.weight = self.NO_RATING, self.NO_WEIGHT
+            return
+
         new_aggregate_rating = (
             (self.rating * self.weight + increase - decrease) / new_aggregate_weight)
 
@@ -274,7 +311,6 @@ class AggregateProblemConnectionRating(BaseProblemModel):
                  rating=None, weight=None, ratings=None):
         problem, org, geo = community.derive_key()
         self.connection_category = connection.derive_category(problem)
-        # TODO: add 'inclusive' to include all ratings within sub-orgs/geos
         # TODO: add 'inherited' to point to a different context for ratings
         if aggregation not in self.AGGREGATIONS:
             raise InvalidAggregation(aggregation=aggregation)
@@ -293,16 +329,8 @@ class AggregateProblemConnectionRating(BaseProblemModel):
                 AggregateProblemConnectionRating.calculate_values(ratings))
 
         elif rating is None:
-            if aggregation == self.STRICT:
-                rq = ProblemConnectionRating.query.filter_by(
-                    connection=connection, problem=problem, org=org, geo=geo)
-                # TODO: implement inclusive aggregation
-                # Removed since it is not strict:
-                # rq = rq.filter_by(org=org) if org else rq
-                # rq = rq.filter_by(geo=geo) if geo else rq
-                # ratings = rq.all()
-                rating, weight = (
-                    AggregateProblemConnectionRating.calculate_values(rq))
+            rating, weight = AggregateProblemConnectionRating.calculate_values(
+                self.query_ratings(connection, community, aggregation))
 
         for field, value in (('Rating', rating), ('Weight', weight)):
             if not isinstance(value, Real):
@@ -528,13 +556,18 @@ class ProblemConnectionRating(BaseProblemModel):
             community = Community.query.filter_by(problem=self.problem,
                                                   org=self.org,
                                                   geo=self.geo).first()
-            if community:
-                community.update_aggregate_ratings(connection=self.connection,
-                                                   user=self.user,
-                                                   new_user_rating=rating,
-                                                   new_user_weight=weight,
-                                                   old_user_rating=old_rating,
-                                                   old_user_weight=old_weight)
+            # Encompassing communities may exist even if this one does not
+            if not community:
+                community = vardygrify(Community, problem=self.problem,
+                                       org=self.org, geo=self.geo,
+                                       num_followers=0)
+            community.update_aggregate_ratings(connection=self.connection,
+                                               user=self.user,
+                                               new_user_rating=rating,
+                                               new_user_weight=weight,
+                                               old_user_rating=old_rating,
+                                               old_user_weight=old_weight,
+                                               rating=self)
         return has_updated
 
     def __init__(self, rating, connection, problem, org, geo,
@@ -2,10 +2,11 @@
 from flask import abort, current_app, jsonify, make_response, redirect, render_template, request
 
 from . import blueprint
-from .models import Problem, ProblemConnection
+from .models import Image, Problem, ProblemConnection
 from .models import AggregateProblemConnectionRating as APCR
 from intertwine.exceptions import InterfaceException, IntertwineException, ResourceDoesNotExist
 from intertwine.utils.flask_utils import json_requested
+from intertwine.utils.response_cache import response_cache
 from intertwine.utils.vardygr import vardygrify
 
 
@@ -41,6 +42,7 @@ def get_problem(problem_huid):
     return get_problem_html(problem_huid)
 
 
+@response_cache.cached(Problem, ProblemConnection, Image, jsonable=Problem)
 def get_problem_json(problem_huid):
     """
     Get problem JSON
@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+import weakref
+from collections import OrderedDict, namedtuple
+from collections.abc import MutableMapping
+from itertools import islice
+
+
+class Registry(MutableMapping):
+    """
+    Registry
+
+    Mapping of keys to instances that backs each Trackable class. By
+    default, a registry is unbounded and holds strong references, just
+    like a dict. Optionally, it may be bounded and/or weak:
+
+    capacity: When set, the registry evicts entries once the number of
+        entries exceeds capacity, per the eviction policy:
+        - LRU (least recently used): evict the entry accessed longest ago
+        - LFU (least frequently used): evict the entry accessed least
+          often, breaking ties by least recently used
+    weak: When True, instances are held by weak reference, so entries
+        only persist while instances are referenced elsewhere (e.g. by a
+        session with pending changes). Entries for collected instances
+        are removed automatically.
+    pinned: Optional predicate called with an instance, returning True
+        if the instance must not be evicted (e.g. it has changes not yet
+        committed). Pinned candidates are skipped, so a registry may
+        temporarily exceed capacity if too many entries are pinned.
+
+    Lookups by subscript are counted as hits or misses; membership
+    checks and iteration are not counted and do not affect eviction
+    order. Evictions are also counted.
+    """
+    LRU = 'lru'
+    LFU = 'lfu'
+    POLICIES = {LRU, LFU}
+
+    # Max eviction candidates examined per eviction (skipping pinned)
+    EVICTION_SCAN_LIMIT = 8
+
+    Stats = namedtuple('RegistryStats', 'size, capacity, hits, misses, evictions')
+
+    @property
+    def bounded(self):
+        return self.capacity is not None
+
+    def stats(self):
+        """Return registry statistics namedtuple"""
+        self._purge()
+        return self.Stats(size=len(self._entries), capacity=self.capacity,
+                          hits=self.hits, misses=self.misses,
+                          evictions=self.evictions)
+
+    def reset_stats(self):
+        """Reset hit/miss/eviction counters"""
+        self.hits = self.misses = self.evictions = 0
+
+    def values(self):
+        """Return list of registered instances (uncounted)"""
+        self._purge()
+        instances = (self._deref(value) for value in list(self._entries.values()))
+        return [inst for inst in instances if inst is not None]
+
+    def items(self):
+        """Return list of (key, instance) tuples (uncounted)"""
+        self._purge()
+        items = ((key, self._deref(value))
+                 for key, value in list(self._entries.items()))
+        return [(key, inst) for key, inst in items if inst is not None]
+
+    def clear(self):
+        """Clear all entries, retaining configuration and counters"""
+        self._entries.clear()
+        self._frequencies.clear()
+        self._buckets.clear()
+        self._pending_removals.clear()
+
+    def _touch(self, key):
+        if self.policy == self.LRU:
+            self._entries.move_to_end(key)
+            return
+        frequency = self._frequencies[key]
+        bucket = self._buckets[frequency]
+        del bucket[key]
+        if not bucket:
+            del self._buckets[frequency]
+        self._frequencies[key] = frequency + 1
+        self._buckets.setdefault(frequency + 1, OrderedDict())[key] = None
+
+    def _rotate(self, key):
+        # Move to back of eviction order without counting a hit
+        if self.policy == self.LRU:
+            self._entries.move_to_end(key)
+        else:
+            self._buckets[self._frequencies[key]].move_to_end(key)
+
+    def _eviction_candidates(self):
+        if self.policy == self.LRU:
+            return iter(self._entries)
+        return (key for frequency in sorted(self._buckets)
+                for key in self._buckets[frequency])
+
+    def _evict(self, inserted):
+        overage = len(self._entries) - self.capacity
+        if overage <= 0:
+            return
+        candidates = list(islice(self._eviction_candidates(),
+                                 overage + self.EVICTION_SCAN_LIMIT))
+        for key in candidates:
+            if overage <= 0:
+                break
+            if key == inserted:
+                continue
+            inst = self._deref(self._entries[key])
+            if inst is not None and self.pinned and self.pinned(inst):
+                self._rotate(key)  # So scans make progress
+                continue
+            self._remove(key)
+            if inst is not None:
+                self.evictions += 1
+            overage -= 1
+
+    def _remove(self, key):
+        del self._entries[key]
+        if self.policy == self.LFU:
+            frequency = self._frequencies.pop(key)
+            bucket = self._buckets[frequency]
+            del bucket[key]
+            if not bucket:
+                del self._buckets[frequency]
+
+    def _ref(self, key, inst):
+        if not self.weak:
+            return inst
+        pending_removals = self._pending_removals
+
+        def callback(ref, key=key):
+            pending_removals.append((key, ref))
+
+        return weakref.ref(inst, callback)
+
+    def _deref(self, value):
+        return value() if self.weak else value
+
+    def _purge(self):
+        while self._pending_removals:
+            key, ref = self._pending_removals.pop()
+            if self._entries.get(key) is ref:
+                self._remove(key)
+
+    def __getitem__(self, key):
+        self._purge()
+        try:
+            inst = self._deref(self._entries[key])
+            if inst is None:
+                raise KeyError(key)
+        except KeyError:
+            self.misses += 1
+            raise
+        self.hits += 1
+        if self.bounded:
+            self._touch(key)
+        return inst
+
+    def __setitem__(self, key, inst):
+        self._purge()
+        if key in self._entries:
+            self._entries[key] = self._ref(key, inst)
+            self._touch(key)
+            return
+        self._entries[key] = self._ref(key, inst)
+        if self.policy == self.LFU:
+            self._frequencies[key] = 1
+            self._buckets.setdefault(1, OrderedDict())[key] = None
+        if self.bounded:
+            self._evict(inserted=key)
+
+    def __delitem__(self, key):
+        self._purge()
+        self._remove(key)
+
+    def __contains__(self, key):
+        self._purge()
+        try:
+            return self._deref(self._entries[key]) is not None
+        except KeyError:
+            return False
+
+    def __iter__(self):
+        self._purge()
+        return iter(list(self._entries))
+
+    def __len__(self):
+        self._purge()
+        return len(self._entries)
+
+    def __repr__(self):
+        return '<{cls}: {stats}>'.format(
+            cls=self.__class__.__name__, stats=self.stats())
+
+    def __init__(self, capacity=None, policy=LRU, weak=False, pinned=None,
+                 entries=()):
+        if policy not in self.POLICIES:
+            raise ValueError('Invalid registry policy: {!r}'.format(policy))
+        if capacity is not None and capacity < 0:
+            raise ValueError('Registry capacity must be non-negative')
+        self.capacity = capacity
+        self.policy = policy
+        self.weak = weak
+        self.pinned = pinned
+        self.hits = self.misses = self.evictions = 0
+        self._entries = OrderedDict()
+        self._frequencies = {}
+        self._buckets = {}
+        self._pending_removals = []
+        for key, inst in (entries.items() if hasattr(entries, 'items') else entries):
+            self[key] = inst
@@ -2,17 +2,24 @@
 import inspect
 from collections import namedtuple, OrderedDict
 from contextlib import contextmanager
+from itertools import islice
 
 from alchy.model import ModelMeta
-from sqlalchemy.exc import IntegrityError, InvalidRequestError
+from sqlalchemy import and_, inspect as sqlalchemy_inspect, or_
+from sqlalchemy.exc import IntegrityError, InvalidRequestError, NoInspectionAvailable
 from sqlalchemy.orm import aliased, class_mapper
 from sqlalchemy.orm.attributes import InstrumentedAttribute
+from sqlalchemy.orm.descriptor_props import SynonymProperty
 from sqlalchemy.orm.exc import NoResultFound
+from sqlalchemy.orm.interfaces import MANYTOONE
+from sqlalchemy.orm.properties import ColumnProperty
+from sqlalchemy.orm.relationships import RelationshipProperty
 
 from .exceptions import (
     InvalidRegistryKey, KeyConflictError, KeyInconsistencyError,
     KeyMissingFromRegistry, KeyMissingFromRegistryAndDatabase,
     KeyRegisteredAndNoModify)
+from .registry import Registry
 from .utils import (
     TEXT_TYPES, build_table_model_map, dehumpify, get_class, isiterator,
     isnamedtuple, isnonstringsequence, merge_args)
@@ -135,7 +142,8 @@ def register_update(self, key, _prefix='_', _suffix=''):
 
     Also validate that the newly registered key matches the self-derived
     key. If not, attempt to correct the registry to use the derived key
-    before raising KeyInconsistencyError.
+    before raising KeyInconsistencyError. Update listeners are notified
+    of any field updates (via _update_).
 
     I/O:
     key: new registry key, a namedtuple
@@ -160,7 +168,8 @@ def _update_(self, _prefix='_', _suffix='', **fields):
     Private method to update fields without invoking setter properties.
     An "affix" (prefix/suffix) convention is applied to find underlying
     fields. An affixed field update is attempted first and fails over to
-    the field as given.
+    the field as given. If any fields are updated, the instance is
+    tracked and update listeners are notified.
 
     I/O:
     _prefix='_': string prepended to field to identify affixed fields
@@ -186,7 +195,9 @@ def _update_(self, _prefix='_', _suffix='', **fields):
         updated = True
 
     if updated:
-        get_class(self)._updates.add(self)
+        cls = get_class(self)
+        cls._updates.add(self)
+        cls._notify_update_(self)
     return updated
 
 
@@ -281,6 +292,17 @@ class Trackable(ModelMeta):
     instances are tracked automatically. Modifications of instances may
     be tracked using the '_modified' field on the instance, which is the
     set of modified instances of the same type.
+
+    Update listeners may be added to be notified of tracked updates to
+    existing instances (e.g. to invalidate derived caches). Each
+    listener is called with the Trackable class and updated instance.
+
+    Each class's registry is a Registry, which is unbounded by default.
+    To bound memory in long-running processes, a class may set any of
+    REGISTRY_CAPACITY, REGISTRY_POLICY (LRU/LFU) and REGISTRY_WEAK, or
+    call configure_registry(). Instances with tracked updates or pending
+    session changes are never evicted. Registry hit/miss/eviction
+    counters are available via registry_stats().
     """
 
     # Max width used for Trackable's default repr
@@ -289,16 +311,25 @@ class Trackable(ModelMeta):
     ID_TAG = 'id'
     _ID_TAG = '_id'
 
+    # Max bind parameters per tget_many query
+    TGET_MANY_CHUNK_SIZE = 900
+
     caching_enabled = False
 
     # Keep track of all classes that are Trackable
     _classes = {}
 
+    # Callables notified of tracked updates: listener(cls, inst)
+    _update_listeners = []
+
+    # Registry defaults, which Trackable classes may override
+    REGISTRY_CAPACITY = None  # unbounded
+    REGISTRY_POLICY = Registry.LRU
+    REGISTRY_WEAK = False
+
     QualifiedKey = namedtuple('QualifiedKey', 'model, key')
 
     def __new__(meta, name, bases, attr):
-        # Track instances for each class of type Trackable
-        attr['_instances'] = {}
         # Track any new or modified instances
         attr['_updates'] = set()
         # Provide default __repr__()
@@ -313,6 +344,8 @@ class Trackable(ModelMeta):
         attr['_validate_'] = _validate_
         attr['deconstruct'] = deconstruct
         new_cls = super(Trackable, meta).__new__(meta, name, bases, attr)
+        # Track instances for each class of type Trackable
+        new_cls._instances = new_cls._create_registry_()
         if new_cls.__name__ != 'Base':
             meta._classes[name] = new_cls
         return new_cls
@@ -337,6 +370,8 @@ class Trackable(ModelMeta):
             cls.modify(inst, **all_kwds)
         if hasattr(inst, '_modified'):
             cls._updates.update(inst._modified)
+            for modified in inst._modified:
+                get_class(modified)._notify_update_(modified)
             del inst._modified
         return inst
 
@@ -768,12 +803,157 @@ class Trackable(ModelMeta):
             cls._instances[key] = instance
         return instance
 
-    def _retrieve_from_cache(cls, key):
+    def tget_many(cls, keys, default=None, query_on_miss=True):
+        """
+        Trackable get many (tget_many)
+
+        Given keys, gets the corresponding instances from the registry.
+        Any keys that are unregistered are resolved in bulk via chunked
+        database queries if query_on_miss is True (default), rather than
+        one query per key as with tget. Instances found in the database
+        are registered if caching is enabled.
+
+        I/O:
+        keys:
+            Iterable of natural key tuples as defined by the create_key/
+            derive_key methods on the Trackable class. As with tget, the
+            key of a 1-tuple may be the unpacked value.
+
+        default=None:
+            The value returned for each key for which no instance is found.
+
+        query_on_miss=True:
+            When True, the database is queried for keys not found in the
+            registry.
+
+        return: list of instances (or default) in the order of the keys
+        """
+        keys = list(keys)
+        results = [default] * len(keys)
+        misses = OrderedDict()  # repaired key: positions
+        for i, key in enumerate(keys):
+            if cls.caching_enabled:
+                try:
+                    results[i] = cls._retrieve_from_cache(key)
+                    continue
+                except KeyError:
+                    if not query_on_miss:
+                        continue
+            if not hasattr(key, '_asdict'):
+                key = cls._repair_key(key)
+            misses.setdefault(key, []).append(i)
+
+        if not misses:
+            return results
+
+        for key, instance in cls._retrieve_many_from_database(misses):
+            if cls.caching_enabled:
+                cls._instances[key] = instance
+            for i in misses[key]:
+                results[i] = instance
+        return results
+
+    def _retrieve_many_from_database(cls, keys):
+        """Emit (key, instance) tuples for keys found in the database"""
+        mapper = class_mapper(cls)
         try:
-            return cls._instances[key]
-        except KeyError:
+            accessors = [cls._key_field_accessor_(mapper, field)
+                         for field in cls.Key._fields]
+        except (AttributeError, InvalidRequestError):
+            # Fields not resolvable to columns, so query one key at a time
+            for key in keys:
+                instance = cls._retrieve_from_database(key)
+                if instance is not None:
+                    yield key, instance
+            return
+
+        columns = [column for column, _, _ in accessors]
+        keys_by_values = {}
+        for key in keys:
+            try:
+                values = tuple(transform(value) for (_, transform, _), value
+                               in zip(accessors, key))
+            except ValueError:  # Unpersisted component, so not in database
+                continue
+            keys_by_values.setdefault(values, []).append(key)
+
+        chunk_size = max(cls.TGET_MANY_CHUNK_SIZE // len(columns), 1)
+        all_values = iter(keys_by_values)
+        chunk = list(islice(all_values, chunk_size))
+        while chunk:
+            if len(columns) == 1:
+                column = columns[0]
+                values = [v for v, in chunk if v is not None]
+                criterion = column.in_(values)
+                if len(values) < len(chunk):
+                    criterion = or_(criterion, column.is_(None))
+            else:
+                criterion = or_(*(and_(*(column == v for column, v
+                                         in zip(columns, values)))
+                                  for values in chunk))
+
+            for instance in cls.query.filter(criterion):
+                values = tuple(getattr(instance, attr)
+                               for _, _, attr in accessors)
+                for key in keys_by_values.get(values, ()):
+                    yield key, instance
+
+            chunk = list(islice(all_values, chunk_size))
+
+    def _key_field_accessor_(cls, mapper, field):
+        """
+        Key field accessor
+
+        Resolve a key field to a column for bulk queries. As with
+        _retrieve_from_database, fields that are not properties fail
+        over to the field with the ID tag suffix (e.g. problem_a_id),
+        where the key value is a Trackable instance with an id.
+
+        I/O:
+        mapper: SQLAlchemy mapper for the class
+        field: name of a key field
+        return: (column, key value transform, instance attribute) tuple
+        raise: InvalidRequestError/AttributeError if unresolvable
+        """
+        def identity(value):
+            return value
+
+        def to_attribute(attr):
+            def transform(value):
+                if value is None:
+                    return None
+                attr_value = getattr(value, attr)
+                if attr_value is None:
+                    raise ValueError('Unpersisted key component: {!r}'.format(value))
+                return attr_value
+            return transform
+
+        if not mapper.has_property(field):
+            id_field = field + cls._ID_TAG
+            prop = mapper.get_property(id_field)
+            return prop.columns[0], to_attribute(cls.ID_TAG), id_field
+
+        prop = mapper.get_property(field)
+        if isinstance(prop, SynonymProperty):
+            prop = mapper.get_property(prop.name)
+
+        if isinstance(prop, ColumnProperty):
+            return prop.columns[0], identity, prop.key
+
+        if (isinstance(prop, RelationshipProperty) and
+                prop.direction is MANYTOONE and len(prop.local_remote_pairs) == 1):
+            (local, remote), = prop.local_remote_pairs
+            remote_attr = prop.mapper.get_property_by_column(remote).key
+            local_attr = mapper.get_property_by_column(local).key
+            return local, to_attribute(remote_attr), local_attr
+
+        raise InvalidRequestError('Key field {!r} not resolvable to a column'
+                                  .format(field))
+
+    def _retrieve_from_cache(cls, key):
+        if key not in cls._instances:
             key = cls._repair_key(key)
-            return cls._instances[key]
+        return cls._instances[key]
 
     def _retrieve_from_database(cls, key):
         try:
@@ -846,6 +1026,69 @@ class Trackable(ModelMeta):
         cls._instances.pop(key, None)
         cls._updates.discard(inst)
 
+    def _create_registry_(cls, capacity=None, policy=None, weak=None,
+                          entries=()):
+        return Registry(
+            capacity=capacity if capacity is not None else cls.REGISTRY_CAPACITY,
+            policy=policy or cls.REGISTRY_POLICY,
+            weak=weak if weak is not None else cls.REGISTRY_WEAK,
+            pinned=cls._is_pinned_, entries=entries)
+
+    def _is_pinned_(cls, inst):
+        """True iff instance has tracked updates or pending changes"""
+        if inst in cls._updates:
+            return True
+        try:
+            state = sqlalchemy_inspect(inst)
+        except NoInspectionAvailable:
+            return False
+        return state.pending or state.modified
+
+    def configure_registry(cls, capacity=None, policy=None, weak=None):
+        """
+        Configure registry
+
+        Replace the class registry with one configured as specified,
+        retaining registered instances (subject to the new capacity).
+        Unspecified settings default to the class settings.
+
+        I/O:
+        capacity=None: max number of registered instances (None: class
+            REGISTRY_CAPACITY)
+        policy=None: eviction policy, Registry.LRU or Registry.LFU
+        weak=None: if True, hold instances by weak reference
+        return: new registry
+        """
+        cls._instances = cls._create_registry_(
+            capacity=capacity, policy=policy, weak=weak,
+            entries=cls._instances.items())
+        return cls._instances
+
+    def _notify_update_(cls, inst):
+        for listener in tuple(Trackable._update_listeners):
+            listener(cls, inst)
+
+    @classmethod
+    def add_update_listener(meta, listener):
+        """
+        Add update listener
+
+        Register a callable to be notified of tracked updates to
+        existing instances of Trackable classes. The listener is called
+        with the Trackable class and the updated instance. Adding the
+        same listener more than once has no effect.
+        """
+        if listener not in meta._update_listeners:
+            meta._update_listeners.append(listener)
+
+    @classmethod
+    def remove_update_listener(meta, listener):
+        """Remove update listener with silent failure"""
+        try:
+            meta._update_listeners.remove(listener)
+        except ValueError:
+            pass
+
     @classmethod
     def register_existing(meta, session, *args):
         """
@@ -879,7 +1122,7 @@ class Trackable(ModelMeta):
         for cls in classes:
             if cls.__name__ not in meta._classes:
                 raise TypeError('{} not Trackable.'.format(cls.__name__))
-            cls._instances = {}
+            cls._instances.clear()
 
     @classmethod
     def clear_updates(meta, *args):
@@ -910,6 +1153,28 @@ class Trackable(ModelMeta):
         meta.clear_instances(*args)
         meta.clear_updates(*args)
 
+    @classmethod
+    def registry_stats(meta, *args):
+        """
+        Registry stats of Trackable classes
+
+        Returns a dictionary keyed by class name, where the values are
+        registry stats namedtuples (size, capacity, hits, misses and
+        evictions).
+
+        If no arguments are provided, stats for all Trackable classes
+        are included. If one or more classes are passed as input, only
+        stats for these classes are included. If a class is not
+        Trackable, a TypeError is raised.
+        """
+        classes = meta._classes.values() if len(args) == 0 else args
+        stats = {}
+        for cls in classes:
+            if cls.__name__ not in meta._classes:
+                raise TypeError('{} not Trackable.'.format(cls.__name__))
+            stats[cls.__name__] = cls._instances.stats()
+        return stats
+
     @classmethod
     def catalog_updates(meta, *args):
         """
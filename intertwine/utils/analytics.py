@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 from itertools import zip_longest
 
+import numpy as np
+
 
 def average(values, weights=None):
     """
@@ -30,3 +32,49 @@ def average(values, weights=None):
             raise ValueError('There must be the same number of values and weights') from e
         raise
     return numerator / denominator
+
+
+def symmetric_ratings(forward, reverse, no_rating=-1):
+    """
+    Symmetric ratings
+
+    Vectorized computation of symmetric ratings across a network, each
+    derived from the ratings in the forward and reverse directions:
+    - If both are no_rating, the symmetric rating is no_rating.
+    - If one is no_rating, use the other direction's rating.
+    - If both are rated, they are averaged and weighted by their
+      respective community's significance, or unweighted if both
+      significances are 0.
+
+    I/O:
+    forward:        array-like of shape (n, 2) with columns of rating
+                    and significance in the forward direction
+    reverse:        array-like of shape (n, 2), as forward, but in the
+                    reverse direction
+    no_rating=-1:   rating value signifying no rating
+    return:         numpy array of n symmetric ratings (float)
+    raise:          ValueError if forward and reverse shapes differ
+    """
+    forward = np.asarray(forward, dtype=float).reshape(-1, 2)
+    reverse = np.asarray(reverse, dtype=float).reshape(-1, 2)
+    if forward.shape != reverse.shape:
+        raise ValueError('There must be the same number of forward and reverse ratings')
+
+    rating, significance = forward.T
+    reverse_rating, reverse_significance = reverse.T
+
+    rated = rating != no_rating
+    reverse_rated = reverse_rating != no_rating
+    both_rated = rated & reverse_rated
+
+    total_significance = significance + reverse_significance
+    weighted = both_rated & (total_significance != 0)
+    averaged = np.where(
+        weighted,
+        (rating * significance + reverse_rating * reverse_significance) /
+        np.where(weighted, total_significance, 1),
+        (rating + reverse_rating) / 2)
+
+    return np.select([both_rated, rated, reverse_rated],
+                     [averaged, rating, reverse_rating],
+                     default=no_rating)
@@ -2,7 +2,7 @@
 from datetime import timedelta
 from functools import update_wrapper
 
-from flask import make_response, request, current_app
+from flask import Response, current_app, make_response, request, stream_with_context
 
 from intertwine.utils.tools import TEXT_TYPES
 
@@ -107,3 +107,47 @@ def json_requested():
 
     best = accept_mimetypes.best_match(['application/json', 'text/html'])
     return (best == 'application/json' and accept_mimetypes[best] > accept_mimetypes['text/html'])
+
+
+def json_encoder():
+    """JSON encoder configured like Flask's jsonify for the current app"""
+    config = current_app.config
+    return current_app.json_encoder(ensure_ascii=config['JSON_AS_ASCII'],
+                                    sort_keys=config['JSON_SORT_KEYS'])
+
+
+def stream_json(chunks, status=200, headers=None):
+    """
+    Stream JSON
+
+    Return a response that streams JSON text chunks as they are
+    generated (e.g. by Jsonable.iter_json), rather than encoding a
+    complete payload before sending the first byte. The request context
+    is retained until the generator is exhausted.
+
+    I/O:
+    chunks: iterable of JSON text chunks
+    status=200: HTTP status code
+    headers=None: dict of additional response headers
+    return: streaming Flask response with JSON mimetype
+    """
+    return Response(stream_with_context(chunks), status=status, headers=headers,
+                    mimetype=current_app.config['JSONIFY_MIMETYPE'])
+
+
+def add_server_timing(response, *metrics):
+    """
+    Add Server-Timing
+
+    Report server-side timing to clients via the Server-Timing header,
+    which browser developer tools display alongside network timing.
+
+    I/O:
+    response: Flask response to which the header is added
+    *metrics: (name, seconds) tuples, e.g. ('search', 0.0012)
+    return: response
+    """
+    response.headers['Server-Timing'] = ', '.join(
+        '{name};dur={ms:.2f}'.format(name=name, ms=seconds * 1000)
+        for name, seconds in metrics)
+    return response
@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 import inspect
 import json
-from collections import OrderedDict, namedtuple
+from collections import OrderedDict, deque, namedtuple
 from datetime import datetime
 from enum import Enum, EnumMeta
 from functools import partial
@@ -15,10 +15,14 @@ from sqlalchemy import orm
 from sqlalchemy.orm.descriptor_props import SynonymProperty as SP
 from sqlalchemy.orm.properties import ColumnProperty as CP
 from sqlalchemy.orm.relationships import RelationshipProperty as RP
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.expression import BinaryExpression
+from sqlalchemy.sql.util import ClauseAdapter
 
 from .duck_typing import isiterable, isiterator
-from .structures import FieldPath, InsertableOrderedDict, PeekableIterator
-from .tools import TEXT_TYPES, derive_defaults, derive_arg_types, enumify, get_class, stringify
+from .structures import FieldPath, InsertableOrderedDict, PeekableIterator, Sentinel
+from .tools import (
+    TEXT_TYPES, derive_defaults, derive_arg_types, enumify, freeze, get_class, stringify)
 
 JSON_NUMBER_TYPES = (bool, int, float)
 
@@ -60,6 +64,156 @@ class JsonProperty:
         return f'<JsonProperty {self.index}: {self.name}>'
 
 
+class JsonDict(OrderedDict):
+    """
+    JSON dict
+
+    Top-level JSON dict for a jsonify call. In addition to the JSON
+    content, it carries relationship values prefetched for the call,
+    keyed by (id(instance), field), so they are scoped to the call.
+    """
+    def __init__(self, *args, **kwds):
+        super().__init__(*args, **kwds)
+        self.prefetched = {}
+
+    def complete(self, key):
+        """Complete: called by jsonify once the item at key is final"""
+
+    def iterate(self, items, jsonify_item, _path):
+        """
+        Iterate: called by jsonify to jsonify a collection of items
+
+        I/O:
+        items: iterable of items to be jsonified
+        jsonify_item: callable taking an item and a field path that
+            returns the jsonified item
+        _path: FieldPath object at the collection
+        return: list of jsonified items
+        """
+        return [jsonify_item(item, _path) for item in items]
+
+
+class JsonIterable(list):
+    """
+    JSON iterable
+
+    List whose items are jsonified upon iteration rather than upon
+    construction, so a JsonStream may encode a large collection item by
+    item. Only the pure Python encoder (JSONEncoder.iterencode) iterates
+    lists, so a JsonIterable must not be passed to JSONEncoder.encode.
+    """
+    def __bool__(self):
+        return self._peekable().has_next()
+
+    def __iter__(self):
+        return iter(self._peekable())
+
+    def _peekable(self):
+        if self._iterator is None:
+            self._iterator = PeekableIterator(self._items)
+        return self._iterator
+
+    def __init__(self, items):
+        super().__init__()
+        self._items = items
+        self._iterator = None
+
+
+class JsonStream(JsonDict):
+    """
+    JSON stream
+
+    Top-level JSON dict that encodes each item as soon as it is complete
+    and releases it, retaining only the key so references can still be
+    resolved. Encoded chunks accumulate until drained, so top-level keys
+    are emitted in order of completion rather than insertion.
+
+    Collections jsonified via iterate() are JsonIterables, so an item
+    containing a large collection is encoded incrementally upon drain,
+    jsonifying the collection item by item as it is encoded. Related
+    items completed meanwhile are emitted after it.
+
+    I/O:
+    encoder=None: JSONEncoder instance used to encode keys and values
+    """
+    EMITTED = Sentinel('JsonStream')
+    BUFFER_SIZE = 8192  # Min characters per chunk of incremental encoding
+
+    Deferred = namedtuple('Deferred', 'prefix, key')
+
+    def __init__(self, encoder=None):
+        super().__init__()
+        self.encoder = encoder or json.JSONEncoder()
+        self.chunks = deque()
+        self.num_emitted = 0
+
+    def complete(self, key):
+        """Encode the completed item at key and release its value"""
+        self._emit(key, self[key])
+
+    def iterate(self, items, jsonify_item, _path):
+        """Return JsonIterable that jsonifies items upon encoding"""
+        path = _path.copy()  # Traversed after the collection is complete
+        return JsonIterable(jsonify_item(item, path) for item in items)
+
+    def drain(self):
+        """Yield encoded chunks accumulated since the last drain"""
+        chunks = self.chunks
+        while chunks:
+            chunk = chunks.popleft()
+            if isinstance(chunk, str):
+                yield chunk
+                continue
+            # Items completed while encoding are appended to chunks
+            yield from self.iterencode(self[chunk.key], prefix=chunk.prefix)
+            self[chunk.key] = self.EMITTED
+
+    def close(self):
+        """Encode all remaining items, close the object, and drain"""
+        yield from self.drain()
+        for key, value in list(self.items()):
+            if value is not self.EMITTED:
+                self._emit(key, value)
+        yield from self.drain()
+        yield '}' if self.num_emitted else '{}'
+
+    def iterencode(self, value, prefix=''):
+        """Yield value encoded in chunks, incrementally if deferred"""
+        if not self.is_deferred(value):
+            yield prefix + self.encoder.encode(value)
+            return
+        buffer, size = [prefix], len(prefix)
+        for part in self.encoder.iterencode(value):
+            buffer.append(part)
+            size += len(part)
+            if size >= self.BUFFER_SIZE:
+                yield ''.join(buffer)
+                buffer, size = [], 0
+        if buffer:
+            yield ''.join(buffer)
+
+    @classmethod
+    def is_deferred(cls, value):
+        """Return True if value contains a JsonIterable"""
+        if isinstance(value, JsonIterable):
+            return True
+        if isinstance(value, dict):
+            return any(cls.is_deferred(v) for v in value.values())
+        if isinstance(value, (list, tuple)):
+            return any(cls.is_deferred(v) for v in value)
+        return False
+
+    def _emit(self, key, value):
+        prefix = ''.join((',' if self.num_emitted else '{',
+                          self.encoder.encode(str(key)), ':'))
+        self.num_emitted += 1
+        if self.is_deferred(value):
+            self.chunks.append(self.Deferred(prefix, key))
+            return
+        self.chunks.append(prefix + self.encoder.encode(value))
+        self[key] = self.EMITTED
+
+
 class Jsonable:
 
     JSONIFY = 'jsonify'  # Must match the method name
@@ -67,13 +221,20 @@ class Jsonable:
     JSON_PAGINATION = 'pagination'
     JSON_PROPERTY_EXCLUSIONS = {'descriptor_dict', 'object_session'}
     ID_FIELDS = {'id', 'pk', 'qualified_pk', 'json_key'}
+    JSONIFY_PLAN_CACHE_SIZE = 1024
+    JSONIFY_PREFETCH = True
+    PREFETCH_CHUNK_SIZE = 500
     _fields = {}
+    _jsonify_plans = OrderedDict()
 
     JsonKeyType = Enum('JsonKeyType', 'PRIMARY, NATURAL, URI',
                        module=__name__)
 
     QualifiedPrimaryKey = namedtuple('QualifiedPrimaryKey', 'model, pk')
 
+    JsonifyPlan = namedtuple('JsonifyPlan', 'settings, depth, steps')
+    JsonifyStep = namedtuple('JsonifyStep', 'field, prop, is_method, depth, settings')
+
     @property
     def PrimaryKey(self):
         """PrimaryKey is a namedtuple for the primary key fields"""
@@ -333,8 +494,11 @@ class Jsonable:
             _path = FieldPath(None, (k for k, v in kwarg_map.items() if 'config' in v))
 
         if _json is None:
-            _json = OrderedDict()
+            _json = JsonDict()
+            if cls.JSONIFY_PREFETCH:
+                cls.prefetch(value, _json.prefetched, kwarg_map, **json_kwargs)
             _json[cls.JSON_ROOT] = cls.jsonify_value(value, kwarg_map, _path, _json, **json_kwargs)
+            _json.prefetched.clear()
             return _json
 
         class_kwargs = kwarg_map.get(get_class(value))
@@ -373,16 +537,20 @@ class Jsonable:
                  cls.jsonify_value(value[k], kwarg_map, _path, _json, **json_kwargs))
                 for k in item_iterator)
 
-        else:  # tuple/list
-            try:
-                constructor = value._make  # namedtuple
-                item_iterator = all_item_iterator  # all fields required
-            except AttributeError:
-                constructor = list
-
-            items = constructor(
+        elif hasattr(value, '_make'):  # namedtuple
+            items = value._make(  # all fields required
                 cls.jsonify_value(item, kwarg_map, _path, _json, **json_kwargs)
-                for item in item_iterator)
+                for item in all_item_iterator)
+
+        elif limit <= 0:  # unlimited, so may be jsonified upon encoding
+            items = _json.iterate(item_iterator, partial(
+                cls._jsonify_item, kwarg_map=kwarg_map, _json=_json,
+                json_kwargs=json_kwargs), _path)
+            return items
+
+        else:  # tuple/list
+            items = [cls.jsonify_value(item, kwarg_map, _path, _json, **json_kwargs)
+                     for item in item_iterator]
 
         if all_item_iterator.has_next():  # paginate
             try:
@@ -398,6 +566,10 @@ class Jsonable:
 
         return items
 
+    @classmethod
+    def _jsonify_item(cls, item, _path, kwarg_map, _json, json_kwargs):
+        return cls.jsonify_value(item, kwarg_map, _path, _json, **json_kwargs)
+
     def jsonify(self,
                 config=None,     # type: Dict[Text, Union[int, float, Dict[Any, Any]]]
                 depth=1,         # type: int
@@ -500,7 +672,8 @@ class Jsonable:
         _json=None:
             Private top-level JSON dict for recursion
         """
-        _json = OrderedDict() if _json is None else _json
+        is_top_level = _json is None
+        _json = JsonDict() if is_top_level else _json
         config = {} if config is None else config
         hide = set() if hide is None else hide
         default = default or self.ensure_json_safe
@@ -517,19 +690,12 @@ class Jsonable:
             limit=limit, key_type=key_type, raw=raw, tight=tight, nest=nest,
             root=False, default=default)  # exclude: kwarg_map, _path, _json
 
-        dot_config = (config if len(_path) == 1 else kwarg_map[model]['config']
-                      if (model in kwarg_map and 'config' in kwarg_map[model]) else None)
-
-        if dot_config and '.' in dot_config:
-            dot_settings = self.extract_settings('.', dot_config, use_floor=True)
-            if dot_settings:
-                base_kwargs.update(dot_settings)
-
-        depth = base_kwargs.pop('depth')
-        if depth < 1:
-            raise ValueError(f'Jsonify depth must be >= 1; value: {depth}')
+        if is_top_level and self.JSONIFY_PREFETCH:
+            self.prefetch(self, _json.prefetched, kwarg_map, **base_kwargs)
 
-        hide_all = base_kwargs['hide_all']
+        plan = self.jsonify_plan(model, config, depth, hide, hide_all, kwarg_map, _path)
+        base_kwargs.update(plan.settings)
+        del base_kwargs['depth']
         nest = base_kwargs['nest']
 
         # TODO: check if item already exists and needs to be enhanced?
@@ -540,59 +706,438 @@ class Jsonable:
                                      tight=base_kwargs['tight'])
             _json[self_key] = self_json
 
-        fields = self.fields()
-
-        for field, prop in fields.items():
-            with _path.component(field) as field_paths:
-
-                is_json_property = isinstance(prop, JsonProperty)
-                hide_field = hide_all or field in hide or (is_json_property and prop.hide)
+        prefetched = getattr(_json, 'prefetched', None)
+        self_id = id(self)
 
-                field_settings = depth_setting = None
-
-                for i, (anchor_model, field_path) in enumerate(field_paths):
-                    field_config = config if i == 0 else kwarg_map[anchor_model]['config']
-                    if field_path in field_config:
-                        field_settings = self.extract_settings(field_path, field_config)
-                        break
-
-                if field_settings and 'depth' in field_settings:
-                    depth_setting = field_settings['depth']
-                    hide_field = depth_setting == 0  # override hide setting
-                    field_settings['depth'] = int(floor(depth_setting))  # is floor necessary?
-
-                if hide_field:
-                    continue
-
-                field_kwargs = dict(depth=depth - 1, **base_kwargs)
+        for field, prop, is_method, field_depth, field_settings in plan.steps:
+            with _path.component(field):
+                field_kwargs = dict(depth=field_depth, **base_kwargs)
 
                 if field_settings:
                     field_kwargs.update(field_settings)
 
-                if is_json_property and prop.method:
-                    if depth_setting is None:
-                        field_kwargs['depth'] = depth  # defer depth decrement to property
+                if is_method:
                     self_json[field] = prop(
                         obj=self, kwarg_map=kwarg_map, _json=_json, _path=_path, **field_kwargs)
                     continue
 
-                value = getattr(self, field)
+                prefetched_key = (self_id, field)
+                if prefetched and prefetched_key in prefetched:
+                    value = prefetched[prefetched_key]
+                else:
+                    value = getattr(self, field)
 
                 # jsonify_value returns jsonified item if nest
                 self_json[field] = self.jsonify_value(
                     value, kwarg_map, _path, _json, **field_kwargs)
 
+        complete = getattr(_json, 'complete', None)
+        if complete and not nest:
+            complete(self_key)
+
         if root and not nest and self.JSON_ROOT not in _json:
             _json[self.JSON_ROOT] = self_key
 
+        if is_top_level:
+            _json.prefetched.clear()
+
         return self_json if nest else _json
 
-    def extract_settings(self, path, config, use_floor=False):
+    @classmethod
+    def iter_json(cls, value, encoder=None, kwarg_map=None, **json_kwargs):
+        """
+        Iterate JSON
+
+        Return generator that yields the JSON text for the value in
+        chunks. The JSON is equivalent to that of value.jsonify() if the
+        value supports the jsonify protocol; otherwise, it is that of
+        jsonify_value(). Rather than building the full dict and encoding
+        it afterward, each item is encoded once complete and released,
+        and chunks are yielded after each item in a collection, so a
+        large collection is never held in memory in full. Unlimited
+        collections within an item (limit <= 0) are jsonified as the
+        item is encoded (see JsonStream), so a single item with many
+        related items is also streamed.
+
+        Top-level keys are emitted in order of completion, so related
+        items precede the items that reference them.
+
+        I/O:
+        value: jsonable instance, collection, or other value
+        encoder=None: JSONEncoder instance; default is json.JSONEncoder
+        kwarg_map=None, **json_kwargs: see jsonify/jsonify_value
+        return: generator yielding JSON text chunks
+        """
+        kwarg_map = {} if kwarg_map is None else kwarg_map
+        _json = JsonStream(encoder)
+
+        if cls.JSONIFY_PREFETCH:
+            cls.prefetch(value, _json.prefetched, kwarg_map, **json_kwargs)
+
+        if hasattr(value, cls.JSONIFY) and not inspect.isclass(value):
+            jsonified = value.jsonify(kwarg_map=kwarg_map, _json=_json, **json_kwargs)
+            if jsonified is not _json:  # nested
+                yield from _json.iterencode(jsonified)
+                return
+            yield from _json.close()
+            return
+
+        _path = FieldPath(None, (k for k, v in kwarg_map.items() if 'config' in v))
+        is_query = hasattr(value, 'count') and hasattr(value, 'filter')
+        is_sequence = isinstance(value, (list, tuple, set)) and not hasattr(value, '_make')
+        if not (is_sequence or is_query):
+            _json[cls.JSON_ROOT] = cls.jsonify_value(value, kwarg_map, _path, _json, **json_kwargs)
+            yield from _json.close()
+            return
+
+        limit, = cls.extract_json_kwargs(json_kwargs, 'limit')
+        all_item_iterator = PeekableIterator(value)
+        item_iterator = islice(all_item_iterator, limit) if limit > 0 else all_item_iterator
+
+        items = []
+        for item in item_iterator:
+            items.append(cls.jsonify_value(item, kwarg_map, _path, _json, **json_kwargs))
+            yield from _json.drain()
+
+        if all_item_iterator.has_next():  # paginate
+            try:
+                total = len(value)
+            except TypeError:
+                total = value.count()
+            if limit < total:
+                items.append(cls.paginate(len(items), limit, total))
+
+        _json[cls.JSON_ROOT] = items
+        yield from _json.close()
+
+    @classmethod
+    def jsonify_plan(cls, model, config, depth, hide, hide_all, kwarg_map, _path):
+        """
+        Jsonify plan
+
+        Return the compiled plan for jsonifying instances of the class
+        at the current field path. Plans are cached by a hash of the
+        inputs that determine them, so repeat configurations only pay
+        for attribute reads and value conversion.
+
+        I/O:
+        model: model of the instances being jsonified
+        config, depth, hide, hide_all, kwarg_map: see jsonify
+        _path: FieldPath object with the model as its last component
+        return: JsonifyPlan namedtuple containing the '.' settings,
+            the resulting depth, and a JsonifyStep per shown field
+        """
+        paths = tuple(_path.emit())
+        anchor_models = {anchor_model for anchor_model, path in paths[1:]}
+        anchor_models.add(model)
+        anchor_configs = {m: kwarg_map[m]['config'] for m in anchor_models
+                          if m in kwarg_map and 'config' in kwarg_map[m]}
+        try:
+            key = (cls, model, paths, freeze(config), freeze(anchor_configs),
+                   freeze(hide), hide_all, depth)
+            hash(key)
+        except TypeError:  # unhashable setting, so compile without caching
+            return cls._compile_jsonify_plan(
+                model, config, depth, hide, hide_all, anchor_configs, paths)
+
+        plans = Jsonable._jsonify_plans
+        try:
+            plans.move_to_end(key)
+            return plans[key]
+        except KeyError:
+            plan = cls._compile_jsonify_plan(
+                model, config, depth, hide, hide_all, anchor_configs, paths)
+            plans[key] = plan
+            if len(plans) > cls.JSONIFY_PLAN_CACHE_SIZE:
+                plans.popitem(last=False)
+            return plan
+
+    @classmethod
+    def _compile_jsonify_plan(cls, model, config, depth, hide, hide_all, anchor_configs,
+                              paths):
+        """Compile jsonify plan (see "jsonify_plan")"""
+        is_base = len(paths) == 1 and paths[0][1] == FieldPath.SELF_DESIGNATION
+        dot_config = config if is_base else anchor_configs.get(model)
+
+        settings = {}
+        if dot_config and '.' in dot_config:
+            settings = cls.extract_settings('.', dot_config, use_floor=True) or {}
+            depth = settings.get('depth', depth)
+            hide_all = settings.get('hide_all', hide_all)
+
+        if depth < 1:
+            raise ValueError(f'Jsonify depth must be >= 1; value: {depth}')
+
+        field_configs = [config] + [anchor_configs.get(anchor_model)
+                                    for anchor_model, path in paths[1:]]
+        prefixes = ['' if path == FieldPath.SELF_DESIGNATION else path
+                    for anchor_model, path in paths]
+        delimiter = FieldPath.PATH_DELIMITER
+
+        steps = []
+        for field, prop in cls.fields().items():
+            is_json_property = isinstance(prop, JsonProperty)
+            hide_field = hide_all or field in hide or (is_json_property and prop.hide)
+
+            field_settings = depth_setting = None
+
+            for field_config, prefix in zip(field_configs, prefixes):
+                field_path = delimiter.join((prefix, field))
+                if field_config and field_path in field_config:
+                    field_settings = cls.extract_settings(field_path, field_config)
+                    break
+
+            if field_settings and 'depth' in field_settings:
+                depth_setting = field_settings.pop('depth')
+                hide_field = depth_setting == 0  # override hide setting
+
+            if hide_field:
+                continue
+
+            is_method = is_json_property and bool(prop.method)
+
+            if depth_setting is not None:
+                field_depth = int(floor(depth_setting))  # is floor necessary?
+            elif is_method:
+                field_depth = depth  # defer depth decrement to property
+            else:
+                field_depth = depth - 1
+
+            steps.append(cls.JsonifyStep(
+                field, prop, is_method, field_depth, field_settings or None))
+
+        return cls.JsonifyPlan(settings, depth, tuple(steps))
+
+    @classmethod
+    def prefetch(cls, value, prefetched, kwarg_map=None, **json_kwargs):
+        """
+        Prefetch
+
+        Load the relationships that jsonify will traverse for the value,
+        issuing one query per relationship per level for all instances
+        at that level instead of one lazy load per instance. Loadable
+        relationships are populated in the session via selectinload.
+        Dynamic relationships, which cannot be eager loaded, are fetched
+        by a single IN query and stored in prefetched for jsonify to use
+        in place of per-instance queries.
+
+        A relationship is only prefetched for a lone instance if its
+        related objects are to be jsonified as well, as otherwise there
+        is no batch to be gained.
+
+        I/O:
+        value: jsonable instance or list/tuple/set of jsonable instances
+        prefetched: dict in which dynamic relationship values are stored,
+            keyed by (id(instance), field)
+        kwarg_map=None, **json_kwargs: see jsonify_value
+        return: None
+        """
+        kwarg_map = {} if kwarg_map is None else kwarg_map
+        anchor_models = [k for k, v in kwarg_map.items() if 'config' in v]
+
+        if hasattr(value, cls.JSONIFY) and not inspect.isclass(value):
+            values = (value,)
+        elif isinstance(value, (list, tuple, set)):
+            values = value
+        else:
+            return
+
+        level = OrderedDict()
+        seen = set()
+        cls._batch_for_prefetch(level, (), values, json_kwargs, kwarg_map, seen)
+
+        while level:
+            next_level = OrderedDict()
+
+            for (components, model), (batch_kwargs, instances) in level.items():
+                path = FieldPath(components[0][FieldPath.Field.MODEL], anchor_models)
+                for field, field_model in components[1:]:
+                    path.push(field, field_model)
+
+                config, depth, hide, hide_all = cls.extract_json_kwargs(
+                    batch_kwargs, 'config', 'depth', 'hide', 'hide_all')
+                config = {} if config is None else config
+                hide = set() if hide is None else hide
+                plan = model.jsonify_plan(model, config, depth, hide, hide_all, kwarg_map, path)
+
+                base_kwargs = dict(batch_kwargs)
+                base_kwargs.update(plan.settings)
+                base_kwargs.pop('depth', None)
+
+                for field, prop, is_method, field_depth, field_settings in plan.steps:
+                    if is_method:
+                        continue
+                    rp = cls._relationship_property(model, prop)
+                    if rp is None:
+                        continue
+
+                    field_kwargs = dict(depth=field_depth, **base_kwargs)
+                    if field_settings:
+                        field_kwargs.update(field_settings)
+
+                    if field_depth < 1 and len(instances) == 1:
+                        continue  # Nothing to batch
+
+                    related = cls._prefetch_relationship(
+                        model, rp, field, instances, prefetched)
+
+                    if field_depth < 1:
+                        continue
+
+                    limit, = cls.extract_json_kwargs(field_kwargs, 'limit')
+                    related_values = chain.from_iterable(
+                        islice(items, limit) if rp.uselist and limit > 0 else items
+                        for items in related)
+
+                    cls._batch_for_prefetch(
+                        next_level, components + ((field, None),), related_values,
+                        field_kwargs, kwarg_map, seen)
+
+            level = next_level
+
+    @classmethod
+    def _batch_for_prefetch(cls, batch, components, values, json_kwargs, kwarg_map, seen):
+        """Add persistent values to be jsonified to the prefetch batch"""
+        nest, = cls.extract_json_kwargs(json_kwargs, 'nest')
+        for value in values:
+            state = sqlalchemy.inspect(value, raiseerr=False)
+            if state is None or not getattr(state, 'persistent', False):
+                continue
+            if not nest:
+                if id(value) in seen:
+                    continue  # Already jsonified, so only keyed
+                seen.add(id(value))
+
+            model = get_class(value)
+            value_kwargs = json_kwargs
+            class_kwargs = kwarg_map.get(model)
+            if class_kwargs:
+                value_kwargs = dict(json_kwargs, **class_kwargs)
+
+            depth, = cls.extract_json_kwargs(value_kwargs, 'depth')
+            if depth < 1:
+                continue
+
+            field = (components[-1][FieldPath.Field.FIELD] if components
+                     else FieldPath.SELF_DESIGNATION)
+            value_components = components[:-1] + ((field, model),)
+
+            batch_key = (value_components, model)
+            if batch_key not in batch:
+                batch[batch_key] = (value_kwargs, [])
+            batch[batch_key][1].append(value)
+
+    @classmethod
+    def _relationship_property(cls, model, prop):
+        """Return relationship property for field property, if any"""
+        if isinstance(prop, SP):
+            prop = orm.class_mapper(model).get_property(prop.name)
+        return prop if isinstance(prop, RP) else None
+
+    @classmethod
+    def _prefetch_relationship(cls, model, rp, field, instances, prefetched):
+        """
+        Prefetch relationship
+
+        Load the relationship for all instances with one IN query per
+        chunk and return a list of related object lists aligned with
+        the instances.
+
+        I/O:
+        model: model of the instances
+        rp: SQLAlchemy relationship property to be prefetched
+        field: field name by which jsonify accesses the relationship
+        instances: list of persistent model instances
+        prefetched: dict in which dynamic relationship values are stored
+        return: list of lists of related objects, one per instance
+        """
+        session = orm.object_session(instances[0])
+        mapper = orm.class_mapper(model)
+        if session is None or len(mapper.primary_key) != 1:
+            return [cls._related_values(getattr(inst, rp.key)) for inst in instances]
+
+        pk_column = mapper.primary_key[0]
+        pk_attribute = getattr(model, mapper.get_property_by_column(pk_column).key)
+        relationship = getattr(model, rp.key)
+        chunk_size = cls.PREFETCH_CHUNK_SIZE
+
+        if rp.lazy == 'dynamic':
+            target = orm.aliased(rp.mapper.class_)
+            target_mapper = sqlalchemy.inspect(target)
+            # Without a relationship order_by, leave order to the database
+            # within each instance, as with the per-instance query
+            adapter = ClauseAdapter(target_mapper.selectable)
+            order_by = [adapter.traverse(clause) for clause in rp.order_by or ()]
+
+            pks = [mapper.primary_key_from_instance(inst)[0] for inst in instances]
+            related_map = {pk: [] for pk in pks}
+            for i in range(0, len(pks), chunk_size):
+                query = (session.query(pk_attribute, target)
+                                .select_from(model)
+                                .join(target, relationship)
+                                .filter(pk_attribute.in_(pks[i:i + chunk_size]))
+                                .order_by(pk_attribute, *order_by))
+                for pk, related_instance in query:
+                    related_map[pk].append(related_instance)
+
+            related = [related_map[pk] for pk in pks]
+            for inst, items in zip(instances, related):
+                prefetched[(id(inst), field)] = items
+            return related
+
+        unloaded = [inst for inst in instances
+                    if rp.key in sqlalchemy.inspect(inst).unloaded and
+                    not cls._is_in_identity_map(session, rp, inst)]
+        pks = [mapper.primary_key_from_instance(inst)[0] for inst in unloaded]
+        for i in range(0, len(pks), chunk_size):
+            (session.query(model)
+                    .filter(pk_attribute.in_(pks[i:i + chunk_size]))
+                    .options(orm.selectinload(relationship))
+                    .all())
+
+        return [cls._related_values(getattr(inst, rp.key)) for inst in instances]
+
+    @classmethod
+    def _is_in_identity_map(cls, session, rp, inst):
+        """True iff many-to-one related object is in the identity map"""
+        # Only simple foreign key joins are resolved from the identity map
+        primaryjoin = rp.primaryjoin
+        if (rp.direction is not orm.interfaces.MANYTOONE or
+                not isinstance(primaryjoin, BinaryExpression) or
+                primaryjoin.operator is not operators.eq):
+            return False
+        local, remote = rp.local_remote_pairs[0]
+        target_mapper = rp.mapper
+        if list(target_mapper.primary_key) != [remote]:
+            return False
+        state = sqlalchemy.inspect(inst)
+        local_key = orm.class_mapper(get_class(inst)).get_property_by_column(local).key
+        if local_key not in state.dict:
+            return False
+        fk = state.dict[local_key]
+        if fk is None:
+            return True  # No related object to load
+        identity_key = target_mapper.identity_key_from_primary_key([fk])
+        return identity_key in session.identity_map
+
+    @classmethod
+    def _related_values(cls, value):
+        """Return related object(s) from relationship value as a list"""
+        if value is None:
+            return []
+        if hasattr(value, 'values'):  # attribute mapped collection
+            return list(value.values())
+        if isinstance(value, (list, tuple, set)):
+            return list(value)
+        return [value]
+
+    @classmethod
+    def extract_settings(cls, path, config, use_floor=False):
         """Extract settings for the given path and config"""
         settings = config[path]
         if hasattr(settings, 'items'):
             setting_kwargs = {k: v for k, v in settings.items()
-                              if isinstance(v, self.JSONIFY_ARG_TYPES[k])}
+                              if isinstance(v, cls.JSONIFY_ARG_TYPES[k])}
             if len(setting_kwargs) < len(settings):
                 missing = {k: v for k, v in settings.items() if k not in setting_kwargs}
                 raise ValueError(f'Invalid type for setting in path {path!r}: {missing}')
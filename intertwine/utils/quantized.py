@@ -19,6 +19,14 @@ class QuantizedDecimal:
     the result to QuantizedDecimal. The only exception is divmod, which
     uses the Decimal value and returns a tuple without modification.
 
+    Internally, the value is kept as an integer scaled by the precision
+    (i.e. the dequantized value) and the Decimal is only materialized
+    when the value is requested. As such, requantizing an integer is
+    cheap, and comparisons, addition, subtraction, multiplication by
+    integers, unary operators and casts are performed on integers when
+    the other operand is an integer or a QuantizedDecimal of the same
+    precision.
+
     Caution: iterative application of operators on QuantizedDecimals may
     lead to rounding errors since the result is automatically quantized.
     If multiple operators need to be applied in succession without
@@ -28,16 +36,26 @@ class QuantizedDecimal:
     DEFAULT_PRECISION = 2
 
     _multipliers = {}
+    _int_multipliers = {}
 
     @property
     def value(self):
         """Return the value, a Decimal quantized with the precision"""
-        return self._value
+        value = self._value
+        if value is None:
+            value = self._value = Decimal(self._integer).scaleb(-self._precision)
+        return value
 
     @value.setter
     def value(self, number):
         """Set the Decimal value quantized with the default precision"""
-        self._value = self.quantize(number, self.precision)
+        if (isinstance(number, QuantizedDecimal) and
+                number._precision == self._precision):
+            self._integer, self._value = number._integer, number._value
+            return
+        value = self.quantize(number, self._precision)
+        self._integer = int(value.scaleb(self._precision))
+        self._value = value
 
     @property
     def precision(self):
@@ -49,14 +67,16 @@ class QuantizedDecimal:
         """Set the precision and use it to quantize the Decimal value"""
         precision = self._get_precision(number)
         try:
-            self._value = self.quantize(self.value, precision)
+            value = self.value
         except AttributeError:
-            pass  # During __init__ self.value has not yet been defined
+            value = None  # During __init__ self.value has not yet been defined
         self._precision = precision
+        if value is not None:
+            self.value = value
 
     def dequantize(self):
         """Move decimal point to the right and return the integer"""
-        return int(self.value * self._get_multiplier(self.precision))
+        return self._integer
 
     @classmethod
     def requantize(cls, integer, precision=None):
@@ -90,6 +110,15 @@ class QuantizedDecimal:
             cls._multipliers[precision] = multiplier
             return multiplier
 
+    @classmethod
+    def _get_int_multiplier(cls, precision):
+        try:
+            return cls._int_multipliers[precision]
+        except KeyError:
+            multiplier = 10 ** precision
+            cls._int_multipliers[precision] = multiplier
+            return multiplier
+
     @classmethod
     def _get_quant(cls, precision):
         multiplier = cls._get_multiplier(precision)
@@ -111,8 +140,26 @@ class QuantizedDecimal:
             return number
         return cls(number, precision)
 
+    def _scale(self, other):
+        """Return other as an integer scaled by precision, if exact"""
+        if isinstance(other, QuantizedDecimal):
+            return other._integer if other._precision == self._precision else None
+        if isinstance(other, int):
+            return other * self._get_int_multiplier(self._precision)
+        return None
+
+    def _from_integer(self, integer):
+        """Return new instance of the same class/precision from integer"""
+        inst = self.__class__.__new__(self.__class__)
+        inst._precision, inst._integer, inst._value = (
+            self._precision, integer, None)
+        return inst
+
     def __init__(self, number, precision=None, requantize=False):
-        self.precision = precision  # Must precede value
+        self._precision = self._get_precision(precision)  # Must precede value
+        if requantize and isinstance(number, int):
+            self._integer, self._value = number, None
+            return
         self.value = (self.requantize(number, precision) if requantize
                       else number)
 
@@ -129,32 +176,58 @@ class QuantizedDecimal:
     # Comparison Operators
 
     def __eq__(self, other):
+        scaled = self._scale(other)
+        if scaled is not None:
+            return self._integer == scaled
         return self.value == other
 
     def __ne__(self, other):
+        scaled = self._scale(other)
+        if scaled is not None:
+            return self._integer != scaled
         return self.value != other
 
     def __lt__(self, other):
+        scaled = self._scale(other)
+        if scaled is not None:
+            return self._integer < scaled
         return self.value < other
 
     def __le__(self, other):
+        scaled = self._scale(other)
+        if scaled is not None:
+            return self._integer <= scaled
         return self.value <= other
 
     def __gt__(self, other):
+        scaled = self._scale(other)
+        if scaled is not None:
+            return self._integer > scaled
         return self.value > other
 
     def __ge__(self, other):
+        scaled = self._scale(other)
+        if scaled is not None:
+            return self._integer >= scaled
         return self.value >= other
 
     # Left-Variant Mathematical Operators
 
     def __add__(self, other):
+        scaled = self._scale(other)
+        if scaled is not None:
+            return self._from_integer(self._integer + scaled)
         return self.__class__(self.value + other, self.precision)
 
     def __sub__(self, other):
+        scaled = self._scale(other)
+        if scaled is not None:
+            return self._from_integer(self._integer - scaled)
         return self.__class__(self.value - other, self.precision)
 
     def __mul__(self, other):
+        if isinstance(other, int):
+            return self._from_integer(self._integer * other)
         return self.__class__(self.value * other, self.precision)
 
     def __truediv__(self, other):
@@ -178,12 +251,20 @@ class QuantizedDecimal:
     # Right-Variant Mathematical Operators
 
     def __radd__(self, other):
+        scaled = self._scale(other)
+        if scaled is not None:
+            return self._from_integer(scaled + self._integer)
         return self.__class__(other + self.value, self.precision)
 
     def __rsub__(self, other):
+        scaled = self._scale(other)
+        if scaled is not None:
+            return self._from_integer(scaled - self._integer)
         return self.__class__(other - self.value, self.precision)
 
     def __rmul__(self, other):
+        if isinstance(other, int):
+            return self._from_integer(other * self._integer)
         return self.__class__(other * self.value, self.precision)
 
     def __rtruediv__(self, other):
@@ -207,10 +288,18 @@ class QuantizedDecimal:
     # In-Place Mathematical Operators
 
     def __iadd__(self, other):
+        scaled = self._scale(other)
+        if scaled is not None:
+            self._integer, self._value = self._integer + scaled, None
+            return self
         self.value += other
         return self
 
     def __isub__(self, other):
+        scaled = self._scale(other)
+        if scaled is not None:
+            self._integer, self._value = self._integer - scaled, None
+            return self
         self.value -= other
         return self
 
@@ -241,13 +330,13 @@ class QuantizedDecimal:
     # Unary Mathematical Operators
 
     def __abs__(self):
-        return self.__class__(abs(self.value), self.precision)
+        return self._from_integer(abs(self._integer))
 
     def __neg__(self):
-        return self.__class__(-self.value, self.precision)
+        return self._from_integer(-self._integer)
 
     def __pos__(self):
-        return self.__class__(+self.value, self.precision)
+        return self._from_integer(self._integer)
 
     # Number Type Casts
 
@@ -255,7 +344,9 @@ class QuantizedDecimal:
         return complex(self.value)
 
     def __float__(self):
-        return float(self.value)
+        return self._integer / self._get_int_multiplier(self._precision)
 
     def __int__(self):
-        return int(self.value)
+        # Truncate toward zero, as does int(Decimal)
+        integer = abs(self._integer) // self._get_int_multiplier(self._precision)
+        return integer if self._integer >= 0 else -integer
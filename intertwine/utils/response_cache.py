@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import time
+from collections import OrderedDict, namedtuple
+from functools import wraps
+from itertools import chain
+from threading import RLock
+
+from flask import Response, request
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from intertwine.trackable import Trackable
+from .tools import freeze, get_class
+from .versions import shared_versions
+
+
+class ResponseCache:
+    """
+    Response Cache
+
+    Process-wide cache of rendered responses, keyed by normalized URI
+    (path, objectified JSON kwargs and remaining query args). Identical
+    requests are served the cached bytes rather than recomputing the
+    payload, which matters as bots crawl the JSON endpoints heavily.
+
+    The cache is bounded by size (least recently used entries evicted)
+    and by time (entries expire after a TTL in seconds). Each entry is
+    tagged with the names of the models its payload depends on, and is
+    invalidated when any such model is updated. Invalidation is fired
+    by Trackable updates (register_update/_update_/modify) and by
+    session commits of new, modified or deleted instances.
+
+    Responses carry an ETag so clients revalidating with If-None-Match
+    receive a 304 (Not Modified) without a body.
+
+    Each process (e.g. uWSGI worker) holds its own cache. Invalidations
+    reach the other processes via a shared version per tag: each flush
+    increments the versions of the tags it touches and each process
+    invalidates entries of any tags whose versions changed since last
+    read. Other processes thus serve stale responses for at most the
+    shared versions interval after a commit.
+
+    A size of 0 disables the cache.
+    """
+    DEFAULT_SIZE = 1024
+    DEFAULT_TTL = 300  # seconds
+
+    Entry = namedtuple('Entry', 'data, etag, mimetype, headers, tags, expires')
+
+    PENDING_INVALIDATIONS_TAG = 'response_cache_invalidations'
+
+    def configure(self, size=None, ttl=None, session=None):
+        """
+        Configure cache, evicting entries beyond the new size
+
+        I/O:
+        size=None: max number of entries
+        ttl=None: seconds until entries expire
+        session=None: session on which shared versions are read
+        None leaves the setting unchanged.
+        """
+        with self._lock:
+            if size is not None:
+                self.size = size
+            if ttl is not None:
+                self.ttl = ttl
+            if session is not None:
+                self.session = session
+            while len(self._entries) > self.size:
+                self._evict(next(iter(self._entries)))
+
+    def cached(self, *models, jsonable=None):
+        """
+        Cached (decorator)
+
+        Cache successful (200) responses from the decorated view
+        function. Streamed responses are not cached.
+
+        I/O:
+        *models: models (or model names) on which the payload depends;
+            updates to any of these invalidate the cached response
+        jsonable=None: Jsonable class used to objectify JSON kwargs in
+            the query string, so equivalent query strings share a key
+        return: decorator
+        """
+        tags = frozenset(m if isinstance(m, str) else m.__name__ for m in models)
+
+        def decorator(func):
+            @wraps(func)
+            def wrapped(*args, **kwds):
+                if not self.size:
+                    return func(*args, **kwds)
+                self.sync()
+                try:
+                    key = self.form_key(jsonable)
+                except (TypeError, ValueError):
+                    return func(*args, **kwds)
+
+                entry = self.get(key)
+                if entry is None:
+                    response = func(*args, **kwds)
+                    if response.status_code != 200 or response.is_streamed:
+                        return response
+                    entry = self.put(key, response, tags)
+
+                return self.respond(entry)
+
+            return wrapped
+
+        return decorator
+
+    @staticmethod
+    def form_key(jsonable=None):
+        """Form cache key from the current request"""
+        args = request.args
+        json_kwargs = json_kwarg_names = frozenset()
+        if jsonable is not None:
+            json_kwargs = freeze(dict(jsonable.objectify_json_kwargs(args)))
+            json_kwarg_names = jsonable.JSONIFY_ARG_DEFAULTS.keys()
+        other_args = frozenset((k, v) for k, v in args.items(multi=True)
+                               if k not in json_kwarg_names)
+        return (request.path, json_kwargs, other_args)
+
+    def get(self, key):
+        """Get unexpired entry for key, refreshing recency, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry.expires <= self.clock():
+                self._evict(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, response, tags):
+        """Put response in cache under key with tags; return entry"""
+        data = response.get_data()
+        etag = hashlib.sha1(data).hexdigest()
+        headers = tuple((k, v) for k, v in response.headers.items()
+                        if k not in {'Content-Type', 'Content-Length', 'ETag'})
+        entry = self.Entry(data=data, etag=etag, mimetype=response.mimetype,
+                           headers=headers, tags=tags,
+                           expires=self.clock() + self.ttl)
+        with self._lock:
+            if key in self._entries:
+                self._evict(key)
+            self._entries[key] = entry
+            for tag in tags:
+                self._tagged.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.size:
+                self._evict(next(iter(self._entries)))
+        return entry
+
+    @staticmethod
+    def respond(entry):
+        """Respond with cached entry, honoring If-None-Match"""
+        response = Response(entry.data, status=200, headers=entry.headers,
+                            mimetype=entry.mimetype)
+        response.set_etag(entry.etag)
+        return response.make_conditional(request)
+
+    def invalidate(self, *models):
+        """Invalidate entries tagged with any of the models/names"""
+        if not self._entries:
+            return
+        with self._lock:
+            for model in models:
+                tag = model if isinstance(model, str) else model.__name__
+                for key in self._tagged.pop(tag, ()):
+                    self._evict(key)
+
+    def sync(self):
+        """
+        Sync with other processes
+
+        Invalidate entries tagged with any tag whose shared version has
+        changed since last seen.
+        """
+        if self.session is None:
+            return
+        versions = self.versions.read(self.session)
+        with self._lock:
+            if versions is self._versions:
+                return
+            changed = [tag for tag, version in versions.items()
+                       if self._versions.get(tag) != version]
+            self._versions = versions
+            self.invalidate(*changed)
+
+    def clear(self):
+        """Clear all entries and reset statistics"""
+        with self._lock:
+            self._entries.clear()
+            self._tagged.clear()
+            self.hits = self.misses = 0
+
+    def _evict(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry.tags:
+            keys = self._tagged.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tagged[tag]
+
+    def register_changes(self, session, *models):
+        """
+        Register changes to models/names within session's transaction
+
+        Entries tagged with any of the models/names are invalidated upon
+        commit, here and in other processes. Flushed instances register
+        their models automatically; call this for writes bypassing the
+        ORM, such as those maintaining denormalized tables.
+        """
+        tags = {m if isinstance(m, str) else m.__name__ for m in models}
+        if not tags:
+            return
+        session.info.setdefault(self.PENDING_INVALIDATIONS_TAG, set()).update(tags)
+        self.versions.increment(session, tags)
+
+    def _on_trackable_update(self, cls, inst):
+        self.invalidate(cls)
+
+    def _on_flush(self, session, flush_context):
+        # Session still holds pre-flush new/dirty/deleted collections
+        self.register_changes(session, *{
+            get_class(inst)
+            for inst in chain(session.new, session.dirty, session.deleted)})
+
+    def _on_commit(self, session):
+        pending = session.info.pop(self.PENDING_INVALIDATIONS_TAG, None)
+        if pending:
+            self.invalidate(*pending)
+
+    def _on_transaction_end(self, session, transaction):
+        # Invalidations pending from a rolled back savepoint are kept, as
+        # those of the enclosing transaction may be among them
+        if transaction.parent is None:
+            session.info.pop(self.PENDING_INVALIDATIONS_TAG, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __init__(self, size=DEFAULT_SIZE, ttl=DEFAULT_TTL, session=None,
+                 versions=shared_versions, clock=time.monotonic):
+        self.size = size
+        self.ttl = ttl
+        self.session = session
+        self.versions = versions
+        self.clock = clock
+        self.hits = self.misses = 0
+        self._entries = OrderedDict()
+        self._tagged = {}
+        self._versions = {}
+        self._lock = RLock()
+
+
+response_cache = ResponseCache()
+
+Trackable.add_update_listener(response_cache._on_trackable_update)
+event.listen(Session, 'after_flush', response_cache._on_flush)
+event.listen(Session, 'after_commit', response_cache._on_commit)
+event.listen(Session, 'after_transaction_end',
+             response_cache._on_transaction_end)
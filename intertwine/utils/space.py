@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 from collections import namedtuple
+from functools import lru_cache
 
 import pendulum
 from timezonefinder import TimezoneFinder
@@ -18,6 +19,70 @@ class Coordinate(QuantizedDecimal):
     DEFAULT_PRECISION = 7  # 7: 11 mm; 6: 0.11 m (https://goo.gl/7qq5sR)
 
 
+class TimezoneResolver:
+    """
+    TimezoneResolver
+
+    Resolves timezone names from coordinates (latitude & longitude).
+
+    The TimezoneFinder, which loads polygon data upon creation, is only
+    created upon first use and then shared by all resolutions. Names are
+    cached (LRU) by coordinates quantized with CACHE_PRECISION, so
+    nearby locations share a single polygon test. A process-wide
+    resolver is available as timezone_resolver.
+
+    Coordinates may be Coordinates, Decimals, floats or strings. Use
+    resolve_many() to resolve a batch of locations, such as all geos.
+    """
+    CACHE_PRECISION = 4  # 4: 11 m
+    CACHE_SIZE = 2 ** 16
+
+    @property
+    def finder(self):
+        """Return the TimezoneFinder, creating it upon first use"""
+        if self._finder is None:
+            self._finder = TimezoneFinder()
+        return self._finder
+
+    def quantize(self, latitude, longitude):
+        """Return latitude/longitude quantized as cache key integers"""
+        return (Coordinate(latitude, self.CACHE_PRECISION).dequantize(),
+                Coordinate(longitude, self.CACHE_PRECISION).dequantize())
+
+    def resolve(self, latitude, longitude):
+        """Return timezone name at/closest to location, or None if none"""
+        return self._resolve_quantized(*self.quantize(latitude, longitude))
+
+    def resolve_many(self, locations):
+        """
+        Resolve many
+
+        I/O:
+        locations: iterable of GeoLocations or latitude/longitude pairs
+        return: list of timezone names (or None) in order of locations
+        """
+        keys = [self.quantize(*location) for location in locations]
+        names = {key: self._resolve_quantized(*key) for key in set(keys)}
+        return [names[key] for key in keys]
+
+    def _resolve(self, latitude, longitude):
+        multiplier = 10 ** self.CACHE_PRECISION
+        lat, lng = latitude / multiplier, longitude / multiplier
+        finder = self.finder
+        tz_name = finder.timezone_at(lng=lng, lat=lat)
+        if tz_name is None:
+            tz_name = finder.closest_timezone_at(lng=lng, lat=lat)
+        return tz_name
+
+    def __init__(self):
+        self._finder = None
+        self._resolve_quantized = lru_cache(maxsize=self.CACHE_SIZE)(
+            self._resolve)
+
+
+timezone_resolver = TimezoneResolver()
+
+
 class GeoLocation:
     """
     GeoLocation
@@ -58,11 +123,7 @@ class GeoLocation:
 
     @property
     def timezone_name(self):
-        tz_finder = TimezoneFinder()
-        tz_name = tz_finder.timezone_at(lng=self.longitude, lat=self.latitude)
-        if tz_name is None:
-            tz_name = tz_finder.closest_timezone_at(lng=self.longitude,
-                                                    lat=self.latitude)
+        tz_name = timezone_resolver.resolve(self.latitude, self.longitude)
         if tz_name is None:
             raise ValueError('No timezone exists for this geo location')
         return tz_name
@@ -517,6 +517,13 @@ class FieldPath(Stack):
         finally:
             self.pop()
 
+    def copy(self):
+        """Return copy of path that may be traversed independently"""
+        path = type(self)(None, self.models)
+        path[:] = [list(component) for component in self]
+        path._starts = list(self._starts)
+        return path
+
     def element(self, element):
         """Element is not supported; see 'component' context manager"""
         raise AttributeError("'FieldPath' object has no attribute 'element'")
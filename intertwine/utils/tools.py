@@ -217,6 +217,17 @@ def find_any_words(text, words):
     return False
 
 
+def freeze(thing):
+    """Freeze thing into hashable form, recursing into collections"""
+    if hasattr(thing, 'items'):
+        return frozenset((k, freeze(v)) for k, v in thing.items())
+    if isinstance(thing, (set, frozenset)):
+        return frozenset(freeze(x) for x in thing)
+    if isinstance(thing, (list, tuple)):
+        return tuple(freeze(x) for x in thing)
+    return thing
+
+
 def get_class(obj):
     """Get object's class, supporting model_class override"""
     if hasattr(obj, 'model_class'):
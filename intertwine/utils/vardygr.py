@@ -1,4 +1,6 @@
 # -*- coding: utf-8 -*-
+from itertools import chain
+
 from sqlalchemy.orm.attributes import InstrumentedAttribute, QueryableAttribute
 
 
@@ -46,6 +48,7 @@ class Vardygr(type):
     VARDYGR_NULLIFIED = (InstrumentedAttribute, QueryableAttribute)
 
     _vardygr_classes = {}
+    _slotted_classes = {}
 
     @classmethod
     def _set_vardygr_attributes(meta, model_class, attrs):
@@ -82,6 +85,49 @@ class Vardygr(type):
             setattr(instance, k, v)
         return instance
 
+    @classmethod
+    def slotted(meta, model_class, fields):
+        """
+        Slotted
+
+        Return the slotted Vardygr class for the model and fields. Each
+        field that would otherwise be a nullified class attribute is a
+        slot, so instances have no __dict__ and store only the fields
+        provided; all other attributes resolve to the (shared) class
+        attributes, just as they do for unset fields of vardygr
+        instances. Slots not set on an instance read as None.
+
+        Slotted classes are cached by model and fields.
+        """
+        fields = tuple(fields)
+        key = (model_class, fields)
+        try:
+            return meta._slotted_classes[key]
+        except KeyError:
+            pass
+
+        attrs = {meta.MODEL_CLASS_TAG: model_class}
+        meta._set_vardygr_attributes(model_class, attrs)
+        slots = tuple(field for field in fields if attrs.get(field) is None)
+        for slot in slots:
+            attrs.pop(slot, None)
+        attrs['__slots__'] = slots
+        attrs['__getattr__'] = meta._get_unset_slot
+        attrs['_vardygr_slots'] = frozenset(slots)
+
+        name = f'SlottedVardygr{model_class.__name__}'
+        # Bypass Vardygr.__new__, as attributes are already set
+        slotted_class = type.__new__(meta, name, (), attrs)
+        meta._slotted_classes[key] = slotted_class
+        return slotted_class
+
+    @staticmethod
+    def _get_unset_slot(instance, name):
+        # Only called if normal lookup fails, e.g. for an unset slot
+        if name in type(instance)._vardygr_slots:
+            return None
+        raise AttributeError(name)
+
 
 def vardygrify(model_class, **kwds):
     attrs = {}
@@ -89,3 +135,44 @@ def vardygrify(model_class, **kwds):
     vardygr_class = Vardygr(None, (), attrs)
     vardygr_instance = vardygr_class(**kwds)
     return vardygr_instance
+
+
+def vardygrify_many(model_class, rows, fields=None):
+    """
+    Vardygrify many
+
+    Bulk vardygrify constructor returning a list of slotted vardygr
+    instances. Only the given fields are stored per instance, so it is
+    substantially faster and lighter than calling vardygrify per row
+    when furnishing many unpersisted instances (e.g. a community for
+    every problem without one).
+
+    I/O:
+    model_class: model class to imitate
+    rows: iterable of dicts keyed by field, or of sequences of values
+        ordered as fields
+    fields=None: sequence of field names to materialize; if None, the
+        keys of the first row (which must then be a dict)
+    return: list of slotted vardygr instances
+    """
+    rows = iter(rows)
+    try:
+        first = next(rows)
+    except StopIteration:
+        return []
+    is_mapping = hasattr(first, 'keys')
+    if fields is None:
+        if not is_mapping:
+            raise ValueError('Fields are required to vardygrify sequence rows')
+        fields = tuple(first.keys())
+
+    vardygr_class = Vardygr.slotted(model_class, fields)
+    new = object.__new__
+    instances = []
+    for row in chain((first,), rows):
+        instance = new(vardygr_class)
+        values = ((row[field] for field in fields) if is_mapping else row)
+        for field, value in zip(fields, values):
+            setattr(instance, field, value)
+        instances.append(instance)
+    return instances
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+import time
+from threading import RLock
+
+from sqlalchemy import Column, Table, select, types
+
+from intertwine import IntertwineModel
+
+# Named versions, by which processes share notice of committed changes
+shared_version_table = Table(
+    'shared_version', IntertwineModel.metadata,
+    Column('name', types.String(60), primary_key=True),
+    Column('version', types.Integer, nullable=False)
+)
+
+
+class SharedVersions:
+    """
+    Shared Versions
+
+    Named versions held in the database, by which each process (e.g.
+    uWSGI worker) holding state derived from the database, such as a
+    cache or index, learns of changes committed by other processes.
+    Writers increment versions within the transaction making the
+    changes, such that increments commit or roll back along with them:
+
+        shared_versions.increment(session, {'geo'})
+
+    Readers compare versions with those last seen. Versions are read
+    from the database at most once every interval seconds per process,
+    so changes by other processes are seen within that interval:
+
+        if shared_versions.read(session).get('geo') != seen_version:
+            rebuild()
+
+    While disabled, versions are neither incremented nor read.
+    """
+    DEFAULT_INTERVAL = 1  # seconds
+
+    table = shared_version_table
+
+    def configure(self, enabled=None, interval=None):
+        """Configure versions; None leaves the setting unchanged"""
+        with self._lock:
+            if enabled is not None:
+                self.enabled = enabled
+            if interval is not None:
+                self.interval = interval
+            self._read_at = float('-inf')
+
+    def increment(self, session, names):
+        """
+        Increment versions within session's transaction
+
+        I/O:
+        session: session in whose transaction versions are incremented
+        names: names of versions to increment
+        return: dictionary of incremented versions by name, as seen by
+            the transaction; empty if disabled
+        """
+        if not self.enabled:
+            return {}
+        # Execute via the session, which binds statements by table, as
+        # the session's own bind may differ from that of the table
+        v = self.table.c
+        for name in sorted(names):  # Consistent lock order across processes
+            updated = session.execute(
+                self.table.update().where(v.name == name)
+                .values(version=v.version + 1)).rowcount
+            if not updated:
+                session.execute(self.table.insert().values(name=name,
+                                                           version=1))
+        return dict(session.execute(
+            select([v.name, v.version]).where(v.name.in_(sorted(names))))
+            .fetchall())
+
+    def expire(self):
+        """Expire versions read, such that the next read is anew"""
+        with self._lock:
+            self._read_at = float('-inf')
+
+    def read(self, session):
+        """Return dictionary of versions by name, read once per interval"""
+        if not self.enabled:
+            return {}
+        now = self.clock()
+        with self._lock:
+            if now < self._read_at + self.interval:
+                return self._versions
+        v = self.table.c
+        versions = dict(session.execute(select([v.name, v.version])).fetchall())
+        with self._lock:
+            self._versions, self._read_at = versions, now
+        return versions
+
+    def __init__(self, enabled=True, interval=DEFAULT_INTERVAL,
+                 clock=time.monotonic):
+        self.enabled = enabled
+        self.interval = interval
+        self.clock = clock
+        self._versions = {}
+        self._read_at = float('-inf')
+        self._lock = RLock()
+
+
+shared_versions = SharedVersions()  # Configured via create_app
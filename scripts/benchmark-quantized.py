@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmarks quantized decimal arithmetic throughput, comparing the scaled
+integer path with the equivalent Decimal path
+
+Usage:
+    benchmark-quantized [options]
+
+Options:
+    -h --help           This message
+    -n --num NUM        Number of quantized decimals per trial [default: 10000]
+    -t --trials TRIALS  Number of trials (best is reported) [default: 5]
+"""
+import os
+import sys
+from time import perf_counter
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+
+from intertwine.utils.quantized import QuantizedDecimal  # noqa: E402
+
+PRECISIONS = (6, 7)  # Those of coordinates and areas
+
+
+def make_integers(num):
+    return [(-1) ** i * (i * 7919 + 1234567) for i in range(num)]
+
+
+def integer_path(integers, precision):
+    """Construct from scaled integers and sum, max and double"""
+    qds = [QuantizedDecimal(i, precision, requantize=True) for i in integers]
+    return sum(qds), max(qds), sum(qd * 2 for qd in qds)
+
+
+def decimal_path(integers, precision):
+    """Construct from Decimals and sum, max and double via Decimals"""
+    qds = [QuantizedDecimal(QuantizedDecimal.requantize(i, precision),
+                            precision) for i in integers]
+    total, doubled = (QuantizedDecimal(0, precision),
+                      QuantizedDecimal(0, precision))
+    for qd in qds:
+        total += qd.value
+        doubled += qd.value * 2
+    return total, max(qds, key=lambda qd: qd.value), doubled
+
+
+def measure_rate(path, integers, precision, trials):
+    """Return best rate (quantized decimals per second)"""
+    best = float('inf')
+    for _ in range(trials):
+        start = perf_counter()
+        path(integers, precision)
+        best = min(best, perf_counter() - start)
+    return len(integers) / best
+
+
+def main(**options):
+    num = int(options.get('num'))
+    trials = int(options.get('trials'))
+    integers = make_integers(num)
+
+    print('{num} quantized decimals, best of {trials} trials'.format(
+        num=num, trials=trials))
+    print('{:<16}{:>12}{:>16}'.format('path', 'precision', 'ops/s'))
+    for precision in PRECISIONS:
+        if integer_path(integers, precision) != decimal_path(integers, precision):
+            sys.exit('Paths differ at precision {}'.format(precision))
+        for name, path in (('integer', integer_path),
+                           ('decimal', decimal_path)):
+            rate = measure_rate(path, integers, precision, trials)
+            print('{:<16}{:>12}{:>16,.0f}'.format(name, precision, rate))
+
+
+if __name__ == '__main__':
+    from docopt import docopt
+
+    options = {k.lstrip('--'): v for k, v in docopt(__doc__).items()}
+    main(**options)
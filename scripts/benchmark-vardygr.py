@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmarks vardygr construction rate and memory per instance, comparing
+vardygrify (one call per instance) with vardygrify_many (slotted, bulk)
+
+Usage:
+    benchmark-vardygr [options]
+
+Options:
+    -h --help           This message
+    -n --num NUM        Number of instances per trial [default: 10000]
+    -t --trials TRIALS  Number of trials (best is reported) [default: 5]
+"""
+import gc
+import os
+import sys
+import tracemalloc
+from time import perf_counter
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+
+from config import TestingConfig  # noqa: E402
+from intertwine import create_app  # noqa: E402
+from intertwine.utils.vardygr import vardygrify, vardygrify_many  # noqa: E402
+
+
+def construct_each(Community, problems):
+    return [vardygrify(Community, problem=problem, org=None, geo=None, num_followers=0)
+            for problem in problems]
+
+
+def construct_many(Community, problems):
+    return vardygrify_many(Community, ((problem, None, None, 0) for problem in problems),
+                           fields=('problem', 'org', 'geo', 'num_followers'))
+
+
+def measure_rate(construct, Community, problems, trials):
+    """Return best construction rate (instances per second)"""
+    best = float('inf')
+    for _ in range(trials):
+        start = perf_counter()
+        construct(Community, problems)
+        best = min(best, perf_counter() - start)
+    return len(problems) / best
+
+
+def measure_memory(construct, Community, problems):
+    """Return memory allocated per instance (bytes)"""
+    construct(Community, problems[:1])  # Create and cache vardygr class
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    instances = construct(Community, problems)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    allocated = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+    del instances
+    return allocated / len(problems)
+
+
+def main(**options):
+    num = int(options.get('num'))
+    trials = int(options.get('trials'))
+    create_app(config=TestingConfig)
+
+    from intertwine.communities.models import Community
+    from intertwine.problems.models import Problem
+
+    problems = [vardygrify(Problem, name='Problem {}'.format(i)) for i in range(num)]
+
+    print('{num} vardygr communities, best of {trials} trials'.format(
+        num=num, trials=trials))
+    print('{:<16}{:>16}{:>20}'.format('constructor', 'instances/s', 'bytes/instance'))
+    for name, construct in (('vardygrify', construct_each),
+                            ('vardygrify_many', construct_many)):
+        rate = measure_rate(construct, Community, problems, trials)
+        memory = measure_memory(construct, Community, problems)
+        print('{:<16}{:>16,.0f}{:>20,.1f}'.format(name, rate, memory))
+
+
+if __name__ == '__main__':
+    from docopt import docopt
+
+    options = {k.lstrip('--'): v for k, v in docopt(__doc__).items()}
+    main(**options)
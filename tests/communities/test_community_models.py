@@ -45,3 +45,134 @@ def test_community_model_create(session, problem_name, org_name, geo_name,
     assert community_from_db.name == problem.name + (
         ' at ' + org_name if org_name else '') + (
         ' in ' + geo.display(show_abbrev=False) if geo else '')
+
+
+@pytest.mark.unit
+@pytest.mark.smoke
+def test_aggregate_ratings_maintained_on_write(session):
+    """Test strict/inclusive aggregate ratings are updated by ratings"""
+    from intertwine.communities.models import Community
+    from intertwine.geos.models import Geo
+    from intertwine.problems.models import (
+        AggregateProblemConnectionRating as APCR,
+        ProblemConnection as PC,
+        ProblemConnectionRating as PCR,
+        Problem)
+
+    texas = Geo(name='Texas')
+    travis = Geo(name='Travis County', path_parent=texas, parents=[texas])
+    austin = Geo(name='Austin', path_parent=texas, parents=[travis, texas])
+    problem1, problem2, problem3 = (Problem('Test Problem {}'.format(i))
+                                    for i in range(1, 4))
+    connection12 = PC('causal', problem1, problem2)
+    connection13 = PC('causal', problem1, problem3)
+    texas_community = Community(problem=problem1, org=None, geo=texas)
+    austin_community = Community(problem=problem1, org=None, geo=austin)
+    session.add_all([texas, travis, austin, connection12, connection13,
+                     texas_community, austin_community])
+    session.commit()
+
+    rating1 = PCR(rating=2, weight=1, connection=connection12,
+                  problem=problem1, org=None, geo=austin)
+    session.add(rating1)
+    session.commit()
+
+    # First read materializes aggregate ratings
+    strict, = austin_community.aggregate_connection_ratings(APCR.STRICT)
+    inclusive, = texas_community.aggregate_connection_ratings(APCR.INCLUSIVE)
+    assert (strict.rating, strict.weight) == (2, 1)
+    assert (inclusive.rating, inclusive.weight) == (2, 1)
+
+    # Rating in a county within Texas updates Texas inclusive only
+    rating2 = PCR(rating=4, weight=1, connection=connection12,
+                  problem=problem1, org=None, geo=travis)
+    session.add(rating2)
+    session.commit()
+    assert (strict.rating, strict.weight) == (2, 1)
+    assert (inclusive.rating, inclusive.weight) == (3, 2)
+
+    # Changed rating updates strict and inclusive, counting Texas once
+    rating1.rating = 0
+    session.commit()
+    assert (strict.rating, strict.weight) == (0, 1)
+    assert (inclusive.rating, inclusive.weight) == (2, 2)
+
+    # Rating a new connection creates it in materialized communities
+    rating3 = PCR(rating=3, weight=2, connection=connection13,
+                  problem=problem1, org=None, geo=austin)
+    session.add(rating3)
+    session.commit()
+    for community, aggregation in ((austin_community, APCR.STRICT),
+                                   (texas_community, APCR.INCLUSIVE)):
+        apcr = APCR.query.filter_by(community=community, connection=connection13,
+                                    aggregation=aggregation).one()
+        assert (apcr.rating, apcr.weight) == (3, 2)
+
+
+@pytest.mark.unit
+@pytest.mark.smoke
+def test_community_stats_maintained_on_write(session):
+    """Test community stats are maintained by followers and ratings"""
+    from intertwine.communities.models import Community
+    from intertwine.communities.stats import CommunityStats
+    from intertwine.geos.models import Geo
+    from intertwine.problems.models import (
+        AggregateProblemConnectionRating as APCR,
+        ProblemConnection as PC,
+        ProblemConnectionRating as PCR,
+        Problem)
+
+    austin = Geo(name='Austin')
+    problem1, problem2 = (Problem('Test Problem {}'.format(i)) for i in range(1, 3))
+    connection = PC('causal', problem1, problem2)
+    community1 = Community(problem=problem1, org=None, geo=austin, num_followers=10)
+    community2 = Community(problem=problem2, org=None, geo=austin)
+    session.add_all([austin, connection, community1, community2])
+    session.commit()
+
+    community_ids = [community1.id, community2.id, -1]
+    stats = CommunityStats.get_many(session, community_ids)
+    assert set(stats) == {community1.id, community2.id}
+    stats1 = stats[community1.id]
+    assert stats1.num_followers == 10
+    assert stats1.significance == pytest.approx(community1.significance)
+    assert (stats1.num_ratings, stats1.num_aggregate_ratings) == (0, 0)
+    assert stats1.last_activity is None
+    assert stats[community2.id] == CommunityStats.default(community2.id)
+
+    # Ratings count as activity
+    rating = PCR(rating=2, weight=1, connection=connection,
+                 problem=problem1, org=None, geo=austin)
+    session.add(rating)
+    session.commit()
+    stats1 = CommunityStats.get_many(session, community_ids)[community1.id]
+    assert stats1.num_ratings == 1
+    assert stats1.last_activity is not None
+    last_activity = stats1.last_activity
+
+    # Materializing aggregate ratings does not
+    community1.aggregate_connection_ratings(APCR.STRICT)
+    stats1 = CommunityStats.get_many(session, community_ids)[community1.id]
+    assert stats1.num_aggregate_ratings == 1
+    assert stats1.last_activity == last_activity
+
+    community1.num_followers = 100
+    session.commit()
+    stats1 = CommunityStats.get_many(session, community_ids)[community1.id]
+    assert stats1.num_followers == 100
+    assert stats1.significance == pytest.approx(community1.significance)
+    assert stats1.last_activity >= last_activity
+
+    session.delete(rating)
+    session.commit()
+    assert CommunityStats.get_many(session, community_ids)[community1.id].num_ratings == 0
+
+    # Rebuild reproduces maintained stats
+    stats = CommunityStats.get_many(session, community_ids)
+    CommunityStats.rebuild(session)
+    assert CommunityStats.get_many(session, community_ids) == stats
+
+    # Deleting a community deletes its stats ahead of it
+    community2.destroy()
+    session.commit()
+    assert set(CommunityStats.get_many(session, community_ids)) == {community1.id}
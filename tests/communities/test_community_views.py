@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+import json
+import pytest
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+@pytest.mark.unit
+@pytest.mark.smoke
+def test_get_problem_network(session, client):
+    """Tests problem network matches community JSON in fixed queries"""
+    from intertwine.communities.models import Community
+    from intertwine.communities.views import configure_problem_network_community_json
+    from intertwine.geos.models import Geo
+    from intertwine.problems.models import (ProblemConnection as PC,
+                                            ProblemConnectionRating as PCR,
+                                            Problem)
+    from intertwine.utils.jsonable import Jsonable
+    from intertwine.utils.vardygr import vardygrify
+
+    austin = Geo(name='Austin')
+    problems = [Problem('Test Problem {}'.format(i)) for i in range(1, 6)]
+    p1, p2, p3, p4, p5 = problems
+    connections = [PC('causal', p1, p2), PC('scoped', p1, p3),
+                   PC('causal', p4, p1), PC('causal', p2, p5)]
+    c12, c13, c41, c25 = connections
+    community1 = Community(problem=p1, org=None, geo=austin, num_followers=5)
+    community2 = Community(problem=p2, org=None, geo=austin, num_followers=2)
+    session.add_all([austin, community1, community2] + connections)
+    session.commit()
+
+    for rating, weight, connection, problem in ((2, 1, c12, p1),
+                                                (4, 1, c12, p2),
+                                                (1, 1, c13, p1),
+                                                (3, 2, c41, p1)):
+        PCR(rating=rating, weight=weight, connection=connection,
+            problem=problem, org=None, geo=austin)
+    session.commit()
+
+    url = 'http://localhost:5000/communities/problems/austin'
+    headers = {'Accept': 'application/json'}
+    # First render materializes aggregate ratings
+    client.get(url, headers=headers)
+
+    statements = []
+
+    def count_statement(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(Engine, 'before_cursor_execute', count_statement)
+    try:
+        response = client.get(url, headers=headers)
+    finally:
+        event.remove(Engine, 'before_cursor_execute', count_statement)
+
+    assert response.status_code == 200
+    network = json.loads(response.get_data(as_text=True))
+    # geo, communities, problems, connections, aggregate ratings, ratings
+    assert len(statements) == 6
+
+    communities = Community.query.filter_by(geo=austin).all()
+    community_problems = {c.problem for c in communities}
+    communities.extend(vardygrify(Community, problem=p, org=None, geo=austin,
+                                  num_followers=0)
+                       for p in Problem.query.all() if p not in community_problems)
+    kwarg_map = {Community: {'config': configure_problem_network_community_json(),
+                             'nest': False}}
+    expected = Jsonable.jsonify_value(communities, kwarg_map, limit=-1)
+    assert network == json.loads(json.dumps(expected))
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+import pytest
+from sqlalchemy import func
+
+from intertwine.geos.models import Geo
+
+
+@pytest.mark.unit
+@pytest.mark.smoke
+def test_bulk_insert_mode_advances_sequences_per_commit(session,
+                                                        monkeypatch):
+    """Test sequences are advanced on each commit, not just on exit"""
+    from data.geos import bulk
+
+    advanced = []
+
+    def advance_sequences(session, models):
+        advanced.append(session.query(func.max(Geo.id)).scalar())
+
+    monkeypatch.setattr(bulk, 'advance_sequences', advance_sequences)
+
+    with pytest.raises(ValueError):
+        with bulk.BulkInsertMode(session):
+            us = Geo(name='United States', abbrev='U.S.')
+            session.add(us)
+            session.commit()
+            # Pending geos are flushed before sequences are advanced
+            assert advanced == [us.id]
+
+            Geo(name='Texas', abbrev='TX', path_parent=us, parents=[us])
+            raise ValueError('Failed batch')
+
+    # The committed batch keeps its advanced sequences on failure
+    assert advanced == [us.id]
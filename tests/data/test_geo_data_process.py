@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from intertwine.geos.models import Geo, GeoData
+
+
+def create_geo(name, abbrev, total_pop, path_parent=None, parents=()):
+    geo = Geo(name=name, abbrev=abbrev, path_parent=path_parent,
+              parents=list(parents))
+    GeoData(geo=geo, total_pop=total_pop, urban_pop=total_pop // 2,
+            latitude=40, longitude=-100, land_area=10, water_area=1)
+    return geo
+
+
+@pytest.mark.unit
+@pytest.mark.smoke
+def test_update_us_data_includes_pending_states(session):
+    """Test US totals include states pending without autoflush"""
+    from data.geos.geo_data_process import update_us_data
+
+    us = create_geo('United States', 'U.S.', 0)
+    session.add(us)
+    session.commit()
+
+    with session.no_autoflush:
+        create_geo('Texas', 'TX', 25000000, path_parent=us, parents=[us])
+        create_geo('Ohio', 'OH', 11000000, path_parent=us, parents=[us])
+        update_us_data()
+
+    assert us.data.total_pop == 36000000
+    assert us.data.urban_pop == 18000000
+    assert us.data.land_area == 20
+
+
+@pytest.mark.unit
+@pytest.mark.smoke
+def test_load_geos_updates_us_data_after_all_states(session, monkeypatch):
+    """Test US totals are updated once all state batches are loaded"""
+    from data.geos import geo_data_process
+
+    pops = {'OK': 4000000, 'TX': 25000000}
+    batches = []
+
+    def load_subdivision1_geos(geo_session, session, sub1keys=None):
+        us = Geo['us']
+        for sub1key in sub1keys:
+            batches.append(sub1key)
+            create_geo(sub1key, sub1key, pops[sub1key], path_parent=us,
+                       parents=[us])
+
+    monkeypatch.setattr(geo_data_process, 'load_subdivision1_geos',
+                        load_subdivision1_geos)
+    geo_data_process.load_geos(None, session,
+                               stages=['country', 'subdivision1'],
+                               sub1keys=list(pops), out=lambda *args: None)
+
+    us = Geo['us']
+    assert batches == ['OK', 'TX']
+    assert us.data.total_pop == sum(pops.values())
+    assert (session.query(GeoData.total_pop)
+            .filter(GeoData.geo_id == us.id).scalar()) == sum(pops.values())
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+import pytest
+from sqlalchemy import create_engine, select
+
+from intertwine.geos.models import (
+    BaseGeoModel, Geo, GeoData, GeoID, GeoLevel,
+    geo_alias_association_table, geo_parent_child_association_table)
+
+
+def create_staging_db(path, geos, data, levels, geoids, links, aliases=()):
+    """Create staging database at path with rows given as tuples"""
+    engine = create_engine('sqlite:///{}'.format(path))
+    tables = [Geo.__table__, GeoData.__table__, GeoLevel.__table__,
+              GeoID.__table__, geo_parent_child_association_table,
+              geo_alias_association_table]
+    BaseGeoModel.metadata.create_all(engine, tables=tables)
+    with engine.begin() as connection:
+        for table, columns, rows in (
+                (tables[0], ('id', 'name', 'human_id', 'path_parent_id'),
+                 geos),
+                (tables[1], ('id', 'geo_id', 'total_pop'), data),
+                (tables[2], ('id', 'geo_id', 'level'), levels),
+                (tables[3], ('id', 'level_id', 'standard', 'code'), geoids),
+                (tables[4], ('parent_id', 'child_id'), links),
+                (tables[5], ('alias_target_id', 'alias_id'), aliases)):
+            if rows:
+                connection.execute(table.insert(),
+                                   [dict(zip(columns, row)) for row in rows])
+    engine.dispose()
+    return str(path)
+
+
+@pytest.mark.unit
+@pytest.mark.smoke
+def test_staging_merge(session, tmpdir):
+    """Test merge of staging databases matches keys and unions links"""
+    from data.geos.parallel import StagingMerge
+
+    us = Geo(name='United States', abbrev='U.S.')
+    GeoData(geo=us, total_pop=36)
+    tx = Geo(name='Texas', abbrev='TX', path_parent=us, parents=[us])
+    GeoData(geo=tx, total_pop=25)
+    ok = Geo(name='Oklahoma', abbrev='OK', path_parent=us, parents=[us])
+    GeoData(geo=ok, total_pop=4)
+    session.add(us)
+    session.commit()
+
+    # Worker ids overlap across staging databases and with main ids
+    tx_path = create_staging_db(
+        tmpdir.join('tx.db'),
+        geos=[(1, 'United States', 'us', None),
+              (2, 'Texas', 'us/tx', 1),
+              (3, 'Travis County', 'us/tx/travis_county', 2),
+              (4, 'Austin', 'us/tx/austin', 2),
+              (5, 'ATX', 'us/tx/atx', 2)],
+        data=[(1, 1, 25), (2, 2, 26), (3, 3, 1), (4, 4, 1)],
+        levels=[(1, 3, 'subdivision2')],
+        geoids=[(1, 1, 'FIPS', '48453')],
+        links=[(1, 2), (2, 3), (3, 4)],
+        aliases=[(4, 5)])
+    ok_path = create_staging_db(
+        tmpdir.join('ok.db'),
+        geos=[(1, 'United States', 'us', None),
+              (2, 'Oklahoma', 'us/ok', 1),
+              (3, 'Tulsa County', 'us/ok/tulsa_county', 2)],
+        data=[(1, 1, 4), (2, 2, 4), (3, 3, 1)],
+        levels=[(1, 3, 'subdivision2')],
+        geoids=[(1, 1, 'FIPS', '40143')],
+        links=[(1, 2), (2, 3)])
+
+    merge = StagingMerge(session)
+    tx_inserted = merge.merge(tx_path, scope='us/tx')
+    ok_inserted = merge.merge(ok_path, scope='us/ok')
+
+    # Existing links, like the country to the state, are not reinserted
+    geo, data, level, geoid, links, aliases = (
+        table.name for table in (
+            Geo.__table__, GeoData.__table__, GeoLevel.__table__,
+            GeoID.__table__, geo_parent_child_association_table,
+            geo_alias_association_table))
+    assert tx_inserted == {geo: 3, data: 2, level: 1, geoid: 1, links: 2,
+                           aliases: 1}
+    assert ok_inserted == {geo: 1, data: 1, level: 1, geoid: 1, links: 1}
+
+    g, d = Geo.__table__.c, GeoData.__table__.c
+    max_id = max(us.id, tx.id, ok.id)
+    ids = dict(session.execute(select([g.human_id, g.id])).fetchall())
+    # Staged geos are assigned ids in merge order after the existing ids
+    assert [ids[human_id] for human_id in (
+        'us/tx/travis_county', 'us/tx/austin', 'us/tx/atx',
+        'us/ok/tulsa_county')] == list(range(max_id + 1, max_id + 5))
+    assert session.execute(select([g.path_parent_id]).where(
+        g.id == ids['us/tx/austin'])).scalar() == tx.id
+
+    # Data is updated within scope only, so the country keeps its totals
+    pops = dict(session.execute(select([d.geo_id, d.total_pop])).fetchall())
+    assert pops[us.id] == 36
+    assert pops[tx.id] == 26
+    assert pops[ids['us/ok/tulsa_county']] == 1
+
+    level_id = session.execute(select([GeoLevel.__table__.c.id]).where(
+        GeoLevel.__table__.c.geo_id == ids['us/ok/tulsa_county'])).scalar()
+    assert session.execute(select([GeoID.__table__.c.level_id]).where(
+        GeoID.__table__.c.code == '40143')).scalar() == level_id
+
+    parent_child = set(map(tuple, session.execute(
+        select([geo_parent_child_association_table]))))
+    assert parent_child == {(us.id, tx.id), (us.id, ok.id),
+                            (tx.id, ids['us/tx/travis_county']),
+                            (ids['us/tx/travis_county'], ids['us/tx/austin']),
+                            (ok.id, ids['us/ok/tulsa_county'])}
+    alias_links = set(map(tuple, session.execute(
+        select([geo_alias_association_table]))))
+    assert alias_links == {(ids['us/tx/austin'], ids['us/tx/atx'])}
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from intertwine.geos.models import (
+    Geo, GeoData, GeoID, GeoLevel, geo_closure_table)
+
+
+def create_geo(name, level, code, total_pop, parents=()):
+    geo = Geo(name=name, parents=list(parents))
+    GeoData(geo=geo, total_pop=total_pop, urban_pop=0, land_area=1,
+            water_area=0)
+    glvl = GeoLevel(geo=geo, level=level)
+    GeoID(level=glvl, standard='FIPS', code=code)
+    return geo
+
+
+def data_record(geo, **changes):
+    return GeoData.Record(*(getattr(geo.data, field)
+                            for field in GeoData.Record._fields))._replace(
+        **changes)
+
+
+def create_geos(session):
+    state = create_geo('Test State', 'subdivision1', '48', 1000)
+    county = create_geo('Test County', 'subdivision2', '48453', 600,
+                        parents=[state])
+    city = create_geo('Test City', 'place', '4805000', 500,
+                      parents=[county, state])
+    town = create_geo('Test Town', 'place', '4863500', 80,
+                      parents=[county, state])
+    village = create_geo('Test Village', 'place', '4899999', 20,
+                         parents=[county, state])
+    session.add(state)
+    session.commit()
+    return state, county, city, town, village
+
+
+@pytest.mark.unit
+@pytest.mark.smoke
+def test_diff_geos(session):
+    """Test diff of incoming records with existing geo levels"""
+    from data.geos.refresh import diff_geos, existing_levels
+
+    state, county, city, town, village = create_geos(session)
+    existing = existing_levels(session, 'FIPS', ['place'])
+    assert existing == {'4805000': city.levels['place'],
+                        '4863500': town.levels['place'],
+                        '4899999': village.levels['place']}
+
+    incoming = {'4805000': data_record(city, total_pop=510),
+                '4863500': data_record(town),
+                '4812345': data_record(town, total_pop=10)}
+    diff = diff_geos(incoming, existing)
+
+    assert diff.inserts == ['4812345']
+    assert diff.updates == [(city.levels['place'], incoming['4805000'])]
+    assert diff.deletes == [village.levels['place']]
+
+
+@pytest.mark.unit
+@pytest.mark.smoke
+def test_refresh_geos(session, monkeypatch):
+    """Test refresh applies changes and refreshes the closure rows"""
+    from data.geos import refresh
+
+    state, county, city, town, village = create_geos(session)
+    village_id = village.id
+
+    monkeypatch.setattr(refresh, 'incoming_state_data',
+                        lambda *args: {'48': data_record(state)})
+    monkeypatch.setattr(refresh, 'incoming_county_data',
+                        lambda *args: {'48453': data_record(county)})
+    monkeypatch.setattr(refresh, 'incoming_cousub_data', lambda *args: {})
+    monkeypatch.setattr(refresh, 'incoming_place_data', lambda *args: {
+        '4805000': data_record(city, total_pop=510),
+        '4863500': data_record(town),
+        '4812345': data_record(town, total_pop=10)})
+
+    inserted = []
+
+    def load_place_geos(geo_session, session, sub1keys=None, placeids=None):
+        assert placeids == ['4812345']
+        inserted.append(create_geo('Test Hamlet', 'place', '4812345', 10,
+                                   parents=[county, state]))
+
+    monkeypatch.setattr(refresh, 'load_place_geos', load_place_geos)
+
+    diffs = refresh.refresh_geos(None, session, out=lambda *args: None)
+
+    assert [len(diffs['place'].inserts), len(diffs['place'].updates),
+            len(diffs['place'].deletes)] == [1, 1, 1]
+    assert not any(diffs[level].inserts or diffs[level].updates or
+                   diffs[level].deletes
+                   for level in ('subdivision1', 'subdivision2',
+                                 'subdivision3'))
+    assert city.data.total_pop == 510
+    assert session.query(Geo).filter(Geo.id == village_id).first() is None
+
+    hamlet, = inserted
+    closure_rows = {tuple(row) for row in
+                    session.execute(geo_closure_table.select())}
+    assert closure_rows == {
+        (state.id, county.id, 1, 'subdivision2', 600),
+        (state.id, city.id, 1, 'place', 510),
+        (county.id, city.id, 1, 'place', 510),
+        (state.id, town.id, 1, 'place', 80),
+        (county.id, town.id, 1, 'place', 80),
+        (state.id, hamlet.id, 1, 'place', 10),
+        (county.id, hamlet.id, 1, 'place', 10)}
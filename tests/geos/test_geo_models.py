@@ -118,7 +118,7 @@ def test_geo_level_model(session):
     assert GeoLevel[glvl.derive_key()] is glvl
 
     glvl_from_db = session.query(GeoLevel).filter(
-                    GeoLevel.geo == geo, GeoLevel.level == level).first()
+        GeoLevel.geo == geo, GeoLevel.level == level).first()
 
     assert glvl_from_db is glvl
     assert glvl_from_db.geo is geo
@@ -153,7 +153,7 @@ def test_geo_id_model(session):
     assert GeoID[(standard, code)] is gid
 
     gid_from_db = session.query(GeoID).filter(
-                    GeoID.standard == standard, GeoID.code == code).first()
+        GeoID.standard == standard, GeoID.code == code).first()
 
     assert gid_from_db is gid
     assert gid_from_db.level is glvl
@@ -251,6 +251,241 @@ def test_form_aggregate_geo(session):
     assert parent_geo_data_from_db.water_area == aggregate_dict['water_area']
 
 
+@pytest.mark.unit
+@pytest.mark.smoke
+def test_geo_data_aggregates(session):
+    """Test batch aggregation of parent data matches create_parent_data"""
+    from intertwine.geos.aggregates import GeoDataAggregates
+
+    def create_geo(name, level, total_pop, latitude, longitude, land_area,
+                   water_area, parents=()):
+        geo = Geo(name=name, parents=list(parents))
+        GeoData(geo=geo, total_pop=total_pop, urban_pop=total_pop // 2,
+                latitude=latitude, longitude=longitude, land_area=land_area,
+                water_area=water_area)
+        GeoLevel(geo=geo, level=level)
+        return geo
+
+    area_a = Geo(name='Test Area A')
+    GeoLevel(geo=area_a, level='core_area')
+    area_b = Geo(name='Test Area B')
+    GeoData(geo=area_b, total_pop=0, urban_pop=0, latitude=0, longitude=0,
+            land_area=0, water_area=0)
+    GeoLevel(geo=area_b, level='core_area')
+
+    create_geo('Test County A', 'subdivision2', 100, 42.1234567, -71.7654321,
+               321.123456, 123.654321, parents=[area_a])
+    create_geo('Test County B', 'subdivision2', 300, 44.0, -73.0,
+               645, 21, parents=[area_a, area_b])
+    create_geo('Test Place', 'place', 1000, 30.0, -97.0,
+               4321, 1234, parents=[area_a])
+    session.add_all([area_a, area_b])
+    session.commit()
+
+    expected = {area.id: GeoData.aggregate_children_data(
+        area, child_level='subdivision2') for area in (area_a, area_b)}
+
+    aggregates = GeoDataAggregates.refresh(session, 'core_area', 'subdivision2')
+    session.commit()
+
+    assert set(aggregates) == {area_a.id, area_b.id}
+    for area in (area_a, area_b):
+        data = expected[area.id]
+        assert area.data.total_pop == data['total_pop']
+        assert area.data.urban_pop == data['urban_pop']
+        assert area.data.land_area == data['land_area']
+        assert area.data.water_area == data['water_area']
+        assert area.data.latitude == data['latitude']
+        assert area.data.longitude == data['longitude']
+
+    aggregates = GeoDataAggregates.refresh(session, 'core_area', 'subdivision2',
+                                           parent_ids=[area_b.id])
+    assert set(aggregates) == {area_b.id}
+
+
+@pytest.mark.unit
+@pytest.mark.smoke
+def test_geo_data_timezones(session):
+    """Test timezones are precomputed and invalidated by location"""
+    austin = Geo(name='Test Austin')
+    GeoData(geo=austin, total_pop=1000, urban_pop=800, latitude=30.2672,
+            longitude=-97.7431, land_area=4321, water_area=1234)
+    honolulu = Geo(name='Test Honolulu')
+    GeoData(geo=honolulu, total_pop=1000, urban_pop=800, latitude=21.3069,
+            longitude=-157.8583, land_area=4321, water_area=1234)
+    session.add_all([austin, honolulu])
+    session.commit()
+
+    assert austin.data.timezone_name is None
+    assert austin.data.timezone.name == 'America/Chicago'
+
+    assert GeoData.resolve_timezones(session) == 2
+    session.commit()
+    assert austin.data.timezone_name == 'America/Chicago'
+    assert honolulu.data.timezone_name == 'Pacific/Honolulu'
+    assert GeoData.resolve_timezones(session) == 0
+
+    austin.data.location = GeoLocation(40.7128, -74.0060)
+    assert austin.data.timezone_name is None
+    assert GeoData.resolve_timezones(session, geo_ids=[austin.id]) == 1
+    assert austin.data.timezone_name == 'America/New_York'
+
+
+@pytest.mark.unit
+@pytest.mark.smoke
+def test_geo_spatial_index(session):
+    """Test spatial index nearest and bounding box queries"""
+    from intertwine.geos.spatial import GeoSpatialIndex
+    from intertwine.utils.versions import SharedVersions, shared_versions
+
+    locations = (('Test Austin', 'place', 950000, 30.2672, -97.7431),
+                 ('Test Travis', 'subdivision2', 1300000, 30.3, -97.8),
+                 ('Test Round Rock', 'place', 120000, 30.5083, -97.6789),
+                 ('Test Houston', 'place', 2300000, 29.7604, -95.3698),
+                 ('Test Suva', 'place', 93000, -18.1248, 178.4501),
+                 ('Test Apia', 'place', 37000, -13.8507, -171.7514))
+    geos = {}
+    for name, level, total_pop, latitude, longitude in locations:
+        geo = geos[name] = Geo(name=name)
+        GeoData(geo=geo, total_pop=total_pop, urban_pop=0, latitude=latitude,
+                longitude=longitude, land_area=1, water_area=0)
+        GeoLevel(geo=geo, level=level)
+    session.add_all(geos.values())
+    session.commit()
+    ids = {name: geo.id for name, geo in geos.items()}
+
+    index = GeoSpatialIndex()
+    index.build(session)
+    assert len(index) == len(locations)
+
+    nearest = index.nearest(30.40, -97.70, k=3)
+    assert [geo_id for geo_id, _ in nearest] == [
+        ids['Test Round Rock'], ids['Test Travis'], ids['Test Austin']]
+    assert nearest[0][1] == pytest.approx(12.2, abs=0.1)
+
+    nearest = index.nearest(30.40, -97.70, k=2, level='place',
+                            min_pop=200000)
+    assert [geo_id for geo_id, _ in nearest] == [
+        ids['Test Austin'], ids['Test Houston']]
+
+    # Nearest and within span the antimeridian
+    nearest = index.nearest(-16.0, 179.9, k=2)
+    assert [geo_id for geo_id, _ in nearest] == [
+        ids['Test Suva'], ids['Test Apia']]
+    assert index.within(-20, 170, -10, -170) == [
+        ids['Test Suva'], ids['Test Apia']]
+
+    assert index.within(29, -98, 31, -95, level='place') == [
+        ids['Test Houston'], ids['Test Austin'], ids['Test Round Rock']]
+    assert index.within(29, -98, 31, -95, limit=1) == [ids['Test Houston']]
+
+    # Searches via bounded SQL queries match those via the index
+    for args, kwds in (((30.40, -97.70), dict(k=3)),
+                       ((30.40, -97.70), dict(k=2, level='place',
+                                              min_pop=200000)),
+                       ((-16.0, 179.9), dict(k=2)),
+                       ((30.40, -97.70), dict(k=10))):
+        assert GeoSpatialIndex.query_nearest(session, *args, **kwds) == (
+            index.nearest(*args, **kwds))
+    for args, kwds in (((-20, 170, -10, -170), {}),
+                       ((29, -98, 31, -95), dict(level='place')),
+                       ((29, -98, 31, -95), dict(limit=1)),
+                       ((29, -98, 31, -95), dict(min_pop=1000000))):
+        assert GeoSpatialIndex.query_within(session, *args, **kwds) == (
+            index.within(*args, **kwds))
+
+    # Indexes of other processes are rebuilt once geos change
+    shared_versions.configure(enabled=True, interval=0)
+    try:
+        other = GeoSpatialIndex()
+        other.ensure_built(session)
+        geos['Test Round Rock'].data.total_pop = 3000000
+        session.commit()
+        other.ensure_built(session)
+        assert other.within(29, -98, 31, -95, limit=1) == [
+            ids['Test Round Rock']]
+    finally:
+        shared_versions.configure(enabled=False,
+                                  interval=SharedVersions.DEFAULT_INTERVAL)
+
+    (geo, distance), = Geo.find_nearest(30.40, -97.70, distances=True)
+    assert geo is geos['Test Round Rock']
+    assert distance == pytest.approx(12.2, abs=0.1)
+    assert Geo.find_within(29, -98, 31, -95, min_pop=1000000) == [
+        geos['Test Round Rock'], geos['Test Houston'], geos['Test Travis']]
+
+
+@pytest.mark.unit
+@pytest.mark.smoke
+def test_geo_resolver(session):
+    """Test resolution of human_ids to geos and of aliases to targets"""
+    from intertwine.geos.resolver import GeoResolver, geo_resolver
+    from intertwine.utils.versions import SharedVersions, shared_versions
+
+    geo_data_dict = {'urban_pop': 0, 'latitude': 42, 'longitude': -71,
+                     'land_area': 1, 'water_area': 0}
+    big = Geo(name='Test Big Geo')
+    GeoData(geo=big, total_pop=1000, **geo_data_dict)
+    small = Geo(name='Test Small Geo')
+    GeoData(geo=small, total_pop=10, **geo_data_dict)
+    alias = Geo(name='Test Geo Alias', alias_targets=[small, big])
+    session.add_all((big, small, alias))
+    session.commit()
+
+    resolver = GeoResolver()
+    resolver.build(session)
+    assert len(resolver) == session.query(Geo).count()
+
+    disabled_resolver = GeoResolver(enabled=False)
+    for resolve in (resolver.resolve, disabled_resolver.resolve):
+        assert resolve(session, big.human_id) == (
+            big.id, big.human_id, False)
+        assert resolve(session, alias.human_id) == (
+            alias.id, alias.alias_targets[0].human_id, True)
+        assert resolve(session, alias.human_id).human_id == big.human_id
+        assert resolve(session, 'test_no_such_geo') is None
+
+    assert Geo.resolve_human_id(alias.human_id) == resolver.resolve(
+        session, alias.human_id)
+
+    # Geos missing from the map (e.g. added elsewhere) resolve via SQL
+    new = Geo(name='Test New Geo')
+    session.add(new)
+    session.commit()
+    assert new.human_id not in resolver._resolutions
+    assert resolver.resolve(session, new.human_id) == (
+        new.id, new.human_id, False)
+
+    # The map of this process is updated in place upon commit, whereas
+    # maps of other processes are rebuilt once geos change
+    geo_resolver.configure(enabled=True)
+    shared_versions.configure(enabled=True, interval=0)
+    try:
+        resolver.ensure_built(session)
+        geo_resolver.ensure_built(session)
+        resolutions = geo_resolver._resolutions
+        small.data.total_pop = 5000
+        session.commit()
+        for resolve in (resolver.resolve, geo_resolver.resolve):
+            assert resolve(session, alias.human_id) == (
+                alias.id, small.human_id, True)
+        assert geo_resolver._resolutions is resolutions
+
+        new_human_id = new.human_id
+        session.delete(new)
+        session.delete(small)
+        session.commit()
+        geo_resolver.ensure_built(session)
+        assert geo_resolver._resolutions is resolutions
+        assert new_human_id not in resolutions
+        assert geo_resolver.resolve(session, alias.human_id) == (
+            alias.id, big.human_id, True)
+    finally:
+        geo_resolver.configure(enabled=False)
+        shared_versions.configure(enabled=False,
+                                  interval=SharedVersions.DEFAULT_INTERVAL)
+
+
 @pytest.mark.unit
 @pytest.mark.smoke
 def test_geo_aliases(session):
@@ -334,3 +569,341 @@ def test_geo_aliases(session):
     assert geo_alias_1.path_parent is geo
     assert geo_alias_2.path_parent is parent_geo
     assert geo_alias_3.path_parent is parent_geo
+
+
+@pytest.mark.unit
+@pytest.mark.smoke
+def test_geo_find_matches_limit(session):
+    """Test limited matches exclude redundant aliases yet reach the limit"""
+    def create_geo(name, abbrev=None, total_pop=None, path_parent=None):
+        geo = Geo(name=name, abbrev=abbrev, path_parent=path_parent)
+        GeoData(geo=geo, total_pop=total_pop, urban_pop=0, latitude=42,
+                longitude=-71, land_area=1, water_area=0)
+        return geo
+
+    texas = create_geo('Texas', 'TX', 25000000)
+    austin = create_geo('Austin', total_pop=800000, path_parent=texas)
+    austwell = create_geo('Austwell', total_pop=100, path_parent=texas)
+    Geo(name='Aus', path_parent=texas, alias_targets=[austin])
+    session.add(texas)
+    session.commit()
+
+    # Exact match alias is elevated to the top, then removed as redundant
+    assert Geo.find_matches('aus, tx', limit=2) == [austin, austwell]
+    assert Geo.find_matches('aus, tx', limit=1) == [austin]
+    assert Geo.find_matches('aus, tx') == [austin, austwell]
+
+
+@pytest.mark.unit
+@pytest.mark.smoke
+def test_geo_closure(session):
+    """Test geo closure table maintenance and children by level"""
+    from intertwine.geos.closure import GeoClosure
+    from intertwine.geos.models import geo_closure_table
+
+    def create_geo(name, level, total_pop, parents=()):
+        geo = Geo(name=name, parents=list(parents))
+        GeoData(geo=geo, total_pop=total_pop, urban_pop=0, latitude=42,
+                longitude=-71, land_area=1, water_area=0)
+        GeoLevel(geo=geo, level=level)
+        return geo
+
+    def closure_rows():
+        return {tuple(row) for row in
+                session.execute(geo_closure_table.select())}
+
+    state = create_geo('Test State', 'subdivision1', 1000)
+    county = create_geo('Test County', 'subdivision2', 600, parents=[state])
+    city = create_geo('Test City', 'place', 500, parents=[county, state])
+    town = create_geo('Test Town', 'place', 50, parents=[county, state])
+    session.add(state)
+    session.commit()
+
+    assert closure_rows() == {
+        (state.id, county.id, 1, 'subdivision2', 600),
+        (state.id, city.id, 1, 'place', 500),
+        (county.id, city.id, 1, 'place', 500),
+        (state.id, town.id, 1, 'place', 50),
+        (county.id, town.id, 1, 'place', 50)}
+
+    places = state.get_related_geos(Geo.CHILDREN, level='place')
+    assert places == [city, town]
+
+    children_by_level = state.get_children_by_level(limit=1)
+    assert list(children_by_level) == ['subdivision2', 'place']
+    assert children_by_level['place'] == ([city], 2)
+
+    # Population change reorders children
+    town.data.total_pop = 5000
+    session.commit()
+    places = state.get_related_geos(Geo.CHILDREN, level='place')
+    assert places == [town, city]
+
+    # Removing a direct parent leaves the geo a grandchild
+    city.parents.remove(state)
+    session.commit()
+    assert (state.id, city.id, 2, 'place', 500) in closure_rows()
+    assert state.get_related_geos(Geo.CHILDREN, level='place') == [town]
+
+    # Ancestors and descendants are read from the closure table
+    assert GeoClosure.find_ancestor_ids(session, city.id) == {state.id, county.id}
+    assert GeoClosure.find_descendant_ids(session, state.id) == {
+        county.id, city.id, town.id}
+
+    # Geos without data have rows without level or population
+    district = Geo(name='Test District', parents=[city])
+    session.add(district)
+    session.commit()
+    assert (city.id, district.id, 1, None, None) in closure_rows()
+    assert GeoClosure.find_ancestor_ids(session, district.id) == {
+        state.id, county.id, city.id}
+
+    # Rebuild reproduces incrementally maintained rows
+    rows = closure_rows()
+    GeoClosure.rebuild(session)
+    assert closure_rows() == rows
+
+    # Deletion removes rows of the geo and refreshes those of its children
+    county.destroy()
+    session.commit()
+    assert closure_rows() == {
+        (state.id, town.id, 1, 'place', 5000),
+        (city.id, district.id, 1, None, None)}
+
+    # Children are queried via the association table while deferred
+    assert GeoClosure.is_authoritative(session)
+    with GeoClosure.deferred(session):
+        assert not GeoClosure.is_authoritative(session)
+
+    # Children are queried via the association table until populated
+    session.execute(geo_closure_table.delete())
+    assert not GeoClosure.is_authoritative(session)
+    children_by_level = state.get_children_by_level()
+    assert children_by_level['place'] == ([town], 1)
+    assert state.get_related_geos(Geo.CHILDREN, level='place') == [town]
+
+
+@pytest.mark.unit
+@pytest.mark.smoke
+def test_geo_search_index(session, tmpdir):
+    """Test geo search index matches SQL and tracks committed changes"""
+    from intertwine.geos.search import GeoSearchIndex, geo_search_index
+    from intertwine.geos.versions import GeoVersion
+    from intertwine.utils.enums import MatchType
+    from intertwine.utils.versions import SharedVersions, shared_versions
+
+    def create_geo(name, abbrev=None, total_pop=None, path_parent=None):
+        geo = Geo(name=name, abbrev=abbrev, path_parent=path_parent)
+        if total_pop is not None:
+            GeoData(geo=geo, total_pop=total_pop, urban_pop=0, latitude=42,
+                    longitude=-71, land_area=1, water_area=0)
+        return geo
+
+    texas = create_geo('Texas', 'TX', 25000000)
+    create_geo('Tennessee', 'TN', 6000000)
+    austin = create_geo('Austin', total_pop=800000, path_parent=texas)
+    create_geo('San Antonio', total_pop=1300000, path_parent=texas)
+    create_geo('Port Aransas', total_pop=3000, path_parent=texas)
+    Geo(name='Austin Alias', path_parent=texas, alias_targets=[austin])
+    session.add(texas)
+    session.commit()
+
+    cases = [('t', MatchType.BEST, None),
+             ('tex', MatchType.BEST, None),
+             ('an', MatchType.BEST, texas),
+             ('a', MatchType.BEST, texas),
+             ('austin', MatchType.EXACT, texas),
+             ('Aus', MatchType.STARTS_WITH, texas)]
+
+    index = GeoSearchIndex()
+    index.build(session)
+    for match_string, match_type, parent in cases:
+        expected = Geo.find_component_matches(
+            match_string, match_type, parent, elevate_exact_matches=False)
+        geo_ids = index.search(match_string, match_type,
+                               parent_id=parent.id if parent else None)
+        assert Geo.get_by_ids(geo_ids) == expected
+
+    assert index.search('tex', MatchType.CONTAINS) is None
+    assert (index.search('a', parent_id=texas.id, limit=2) ==
+            index.search('a', parent_id=texas.id)[:2])
+    assert index.search('austin', parent_id=texas.id, limit=1,
+                        elevate_exact_matches=True) == [austin.id]
+
+    snapshot_path = str(tmpdir.join('geo_search_index.json'))
+    index.save(snapshot_path)
+    loaded = GeoSearchIndex()
+    loaded.load(snapshot_path, fingerprint=GeoVersion.fingerprint(session))
+    assert loaded.search('a', parent_id=texas.id) == index.search('a', parent_id=texas.id)
+
+    # Snapshots not matching the database are rebuilt and rewritten
+    temple = create_geo('Temple', total_pop=70000, path_parent=texas)
+    session.add(temple)
+    session.commit()
+    with pytest.raises(ValueError):
+        loaded.load(snapshot_path, fingerprint=GeoVersion.fingerprint(session))
+    rebuilt = GeoSearchIndex(snapshot_path=snapshot_path)
+    rebuilt.ensure_built(session)
+    assert temple.id in rebuilt
+    loaded.load(snapshot_path, fingerprint=GeoVersion.fingerprint(session))
+    assert temple.id in loaded
+
+    geo_search_index.configure(enabled=True)
+    try:
+        assert Geo.find_matches('austin, tx')[0] is austin
+        austin.name = 'Austen'
+        session.commit()
+        assert austin not in Geo.find_matches('austin, tx')
+        assert Geo.find_matches('austen, tx') == [austin]
+    finally:
+        geo_search_index.configure(enabled=False)
+
+    # Indexes of other processes are rebuilt once geos change, whereas
+    # this process's index applies its own changes without a rebuild
+    shared_versions.configure(enabled=True, interval=0)
+    geo_search_index.configure(enabled=True)
+    try:
+        other = GeoSearchIndex()
+        other.ensure_built(session)
+        geo_search_index.ensure_built(session)
+        entries = geo_search_index._entries
+        austin.name = 'Aston'
+        session.commit()
+        other.ensure_built(session)
+        assert other.search('aston') == [austin.id]
+        geo_search_index.ensure_built(session)
+        assert geo_search_index._entries is entries
+        assert geo_search_index.search('aston') == [austin.id]
+    finally:
+        geo_search_index.configure(enabled=False)
+        shared_versions.configure(enabled=False,
+                                  interval=SharedVersions.DEFAULT_INTERVAL)
+
+
+@pytest.mark.unit
+@pytest.mark.smoke
+def test_geo_snapshot(session, tmpdir):
+    """Test geo snapshot mirrors geo relations, levels and data"""
+    from intertwine.geos.snapshot import (GeoSnapshot, GeoSnapshotCache,
+                                          geo_snapshot_cache)
+    from intertwine.geos.versions import GeoVersion
+    from intertwine.utils.versions import SharedVersions, shared_versions
+
+    def create_geo(name, level, total_pop, abbrev=None, path_parent=None,
+                   parents=()):
+        geo = Geo(name=name, abbrev=abbrev, path_parent=path_parent,
+                  parents=list(parents))
+        GeoData(geo=geo, total_pop=total_pop, urban_pop=0, latitude=30.25,
+                longitude=-97.75, land_area=12.5, water_area=0)
+        GeoLevel(geo=geo, level=level)
+        return geo
+
+    us = create_geo('United States', 'country', 320000000, abbrev='US')
+    texas = create_geo('Texas', 'subdivision1', 25000000, abbrev='TX',
+                       path_parent=us, parents=[us])
+    travis = create_geo('Travis County', 'subdivision2', 1000000,
+                        path_parent=texas, parents=[texas])
+    austin = create_geo('Austin', 'place', 800000, path_parent=texas,
+                        parents=[texas, travis])
+    GeoLevel(geo=austin, level='subdivision3')
+    create_geo('Pflugerville', 'place', 60000, path_parent=texas,
+               parents=[texas, travis])
+    Geo(name='ATX', path_parent=texas, alias_targets=[austin])
+    session.add(us)
+    session.commit()
+
+    snapshot = GeoSnapshot.build(session)
+    geos = Geo.query.all()
+    assert len(snapshot) == len(geos)
+
+    for geo in geos:
+        human_id = geo.human_id
+        assert snapshot.geo_id(human_id) == geo.id
+        assert snapshot.path_parent(human_id) == (
+            geo.path_parent.human_id if geo.path_parent else None)
+        assert list(snapshot.level_down_keys(human_id)) == list(
+            geo.level_down_keys)
+        assert snapshot.top_level_key(human_id) == geo.top_level_key
+        assert snapshot.bottom_level_key(human_id) == geo.bottom_level_key
+        for relation in (Geo.PARENTS, Geo.CHILDREN, Geo.PATH_CHILDREN,
+                         Geo.ALIASES):
+            for level in (None, 'place'):
+                expected = geo.get_related_geos(relation, level=level,
+                                                include_aliases=True)
+                related = snapshot.get_related_geos(human_id, relation,
+                                                    level=level,
+                                                    include_aliases=True)
+                assert set(related) == {g.human_id for g in expected}
+
+    assert snapshot.get_related_geos(texas.human_id, Geo.PATH_CHILDREN) == [
+        travis.human_id, austin.human_id, 'us/tx/pflugerville']
+    assert snapshot.get_related_geos(travis.human_id, Geo.CHILDREN,
+                                     level='place') == [
+        austin.human_id, 'us/tx/pflugerville']
+    assert snapshot.get_related_geos(austin.human_id, Geo.ALIASES,
+                                     include_aliases=True) == ['us/tx/atx']
+    assert snapshot.data(austin.human_id) == GeoData.Record(
+        800000, 0, austin.data.latitude, austin.data.longitude,
+        austin.data.land_area, austin.data.water_area)
+    assert snapshot.data('us/tx/atx') is None
+    assert 'us/tx/atx' in snapshot and 'us/tx/dallas' not in snapshot
+    with pytest.raises(ValueError):
+        snapshot.get_related_geos(texas.human_id, 'cousins')
+
+    snapshot_path = str(tmpdir.join('geo_snapshot.bin'))
+    snapshot.save(snapshot_path)
+    loaded = GeoSnapshot.load(snapshot_path)
+    assert list(loaded.human_ids) == list(snapshot.human_ids)
+    assert list(loaded.names) == list(snapshot.names)
+    assert not loaded.ids.flags.writeable
+    assert (loaded.get_related_geos(texas.human_id, Geo.CHILDREN) ==
+            snapshot.get_related_geos(texas.human_id, Geo.CHILDREN))
+    assert loaded.data(austin.human_id) == snapshot.data(austin.human_id)
+    assert loaded.validate(session) == []
+
+    tmpdir.join('not_a_snapshot.bin').write_binary(b'\x00' * 64)
+    with pytest.raises(ValueError):
+        GeoSnapshot.load(str(tmpdir.join('not_a_snapshot.bin')))
+
+    # Truncated files and unknown sections are rejected
+    content = tmpdir.join('geo_snapshot.bin').read_binary()
+    tmpdir.join('truncated.bin').write_binary(content[:len(content) // 2])
+    with pytest.raises(ValueError):
+        GeoSnapshot.load(str(tmpdir.join('truncated.bin')))
+    name_offset = GeoSnapshot.HEADER.size
+    tmpdir.join('unknown.bin').write_binary(
+        content[:name_offset] + b'foo' + content[name_offset + 3:])
+    with pytest.raises(ValueError):
+        GeoSnapshot.load(str(tmpdir.join('unknown.bin')))
+
+    assert GeoSnapshot.load(snapshot_path,
+                            fingerprint=GeoVersion.fingerprint(session))
+    with pytest.raises(ValueError):
+        GeoSnapshot.load(snapshot_path, fingerprint=[None, 0, None])
+
+    austin.data.total_pop = 900000
+    session.flush()
+    assert loaded.validate(session) == ['Section data differs from database']
+
+    assert Geo.get_snapshot() is None  # Disabled
+    geo_snapshot_cache.configure(enabled=True)
+    try:
+        assert Geo.get_snapshot().top_level_key(austin.human_id) == (
+            'subdivision3')
+    finally:
+        geo_snapshot_cache.configure(enabled=False)
+
+    # Snapshots of other processes are rebuilt once geos change
+    shared_versions.configure(enabled=True, interval=0)
+    try:
+        other_path = str(tmpdir.join('other_snapshot.bin'))
+        other = GeoSnapshotCache(snapshot_path=other_path)
+        assert other.get(session).data(austin.human_id).total_pop == 900000
+        austin.data.total_pop = 950000
+        session.commit()
+        assert other.get(session).data(austin.human_id).total_pop == 950000
+        assert GeoSnapshot.load(other_path,
+                                fingerprint=GeoVersion.fingerprint(session))
+    finally:
+        shared_versions.configure(enabled=False,
+                                  interval=SharedVersions.DEFAULT_INTERVAL)
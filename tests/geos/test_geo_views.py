@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+import json
+import pytest
+
+from intertwine.geos.models import Geo, GeoData, GeoLevel
+from intertwine.geos.snapshot import geo_snapshot_cache
+
+
+@pytest.mark.unit
+@pytest.mark.smoke
+def test_find_geo_typeahead_matches(session, client):
+    """Tests typeahead geo matches are limited, ranked and projected"""
+    texas = Geo(name='Texas', abbrev='TX')
+    GeoLevel(geo=texas, level='subdivision1')
+    for name, total_pop in (('Austin', 800000), ('Austwell', 150),
+                            ('Aubrey', 2500)):
+        geo = Geo(name=name, path_parent=texas, parents=[texas])
+        GeoData(geo=geo, total_pop=total_pop, urban_pop=0, latitude=30,
+                longitude=-97, land_area=1, water_area=0)
+        GeoLevel(geo=geo, level='place', designation='city')
+    session.add(texas)
+    session.commit()
+
+    url = 'http://localhost:5000/geos/?match_string=au,%20tx&typeahead=1&match_limit=2'
+    response = client.get(url, headers={'Accept': 'application/json'})
+    assert response.status_code == 200
+    assert 'search;dur=' in response.headers['Server-Timing']
+
+    # Levels are looked up in the geo snapshot, if enabled
+    geo_snapshot_cache.configure(enabled=True)
+    try:
+        snapshot_response = client.get(
+            url, headers={'Accept': 'application/json'})
+        assert geo_snapshot_cache.built
+    finally:
+        geo_snapshot_cache.configure(enabled=False)
+    assert (snapshot_response.get_data(as_text=True) ==
+            response.get_data(as_text=True))
+
+    matches = json.loads(response.get_data(as_text=True))
+    assert matches == [
+        {'human_id': 'tx/austin', 'display': 'Austin, TX', 'levels': ['place']},
+        {'human_id': 'tx/aubrey', 'display': 'Aubrey, TX', 'levels': ['place']}]
+
+
+@pytest.mark.unit
+@pytest.mark.smoke
+def test_find_nearest_geos(session, client):
+    """Tests nearest geos are filtered, ordered by distance and projected"""
+    texas = Geo(name='Texas', abbrev='TX')
+    GeoLevel(geo=texas, level='subdivision1')
+    for name, total_pop, latitude, longitude in (
+            ('Austin', 800000, 30.2672, -97.7431),
+            ('Round Rock', 100000, 30.5083, -97.6789),
+            ('Manor', 5000, 30.3407, -97.5570),
+            ('Houston', 2300000, 29.7604, -95.3698)):
+        geo = Geo(name=name, path_parent=texas, parents=[texas])
+        GeoData(geo=geo, total_pop=total_pop, urban_pop=0, latitude=latitude,
+                longitude=longitude, land_area=1, water_area=0)
+        GeoLevel(geo=geo, level='place', designation='city')
+    session.add(texas)
+    session.commit()
+
+    url = ('http://localhost:5000/geos/?latitude=30.40&longitude=-97.70'
+           '&level=place&min_pop=10000&match_limit=2')
+    response = client.get(url, headers={'Accept': 'application/json'})
+    assert response.status_code == 200
+    assert 'search;dur=' in response.headers['Server-Timing']
+
+    geo_snapshot_cache.configure(enabled=True)
+    try:
+        snapshot_response = client.get(
+            url, headers={'Accept': 'application/json'})
+    finally:
+        geo_snapshot_cache.configure(enabled=False)
+    assert (snapshot_response.get_data(as_text=True) ==
+            response.get_data(as_text=True))
+
+    nearest = json.loads(response.get_data(as_text=True))
+    assert [geo['human_id'] for geo in nearest] == ['tx/round_rock', 'tx/austin']
+    assert nearest[0]['display'] == 'Round Rock, TX'
+    assert nearest[0]['levels'] == ['place']
+    assert 0 < nearest[0]['distance'] < nearest[1]['distance'] < 20
@@ -88,3 +88,46 @@ def test_add_rated_problem_connection(session, client, connection_category,
     assert rated_connection['connection'] == problem_connection.json_key()
 
     assert rated_connection['connection_category'] == connection_category
+
+
+@pytest.mark.unit
+@pytest.mark.smoke
+def test_get_problem_json_response_cache(session, client):
+    """Tests problem JSON is cached, revalidated and invalidated"""
+    from intertwine.utils.response_cache import response_cache
+
+    problem = Problem('Test Problem')
+    session.add(problem)
+    session.commit()
+
+    url = 'http://localhost:5000/problems/test_problem'
+    headers = {'Accept': 'application/json'}
+    response_cache.configure(size=16)
+    try:
+        response1 = client.get(url + '?depth=2&limit=5', headers=headers)
+        assert response1.status_code == 200
+        etag = response1.headers['ETag']
+        hits = response_cache.hits
+
+        # Equivalent query string (reordered, json kwarg cast to int) is a hit
+        response2 = client.get(url + '?limit=5&depth=02', headers=headers)
+        assert response_cache.hits == hits + 1
+        assert response2.get_data() == response1.get_data()
+
+        headers_304 = dict(headers, **{'If-None-Match': etag})
+        response3 = client.get(url + '?depth=2&limit=5', headers=headers_304)
+        assert response3.status_code == 304
+
+        problem.definition = 'Cache busting definition'
+        session.commit()
+        assert len(response_cache) == 0
+
+        response4 = client.get(url + '?depth=2&limit=5', headers=headers_304)
+        assert response4.status_code == 200
+        assert response4.headers['ETag'] != etag
+        payload = json.loads(response4.get_data(as_text=True))
+        assert payload[payload['root']]['definition'] == problem.definition
+
+    finally:
+        response_cache.configure(size=0)
+        response_cache.clear()
@@ -1,10 +1,15 @@
 # -*- coding: utf-8 -*-
+import gc
+
 import pytest
 
 from intertwine.communities.models import Community
-from intertwine.problems.models import Problem
+from intertwine.geos.models import Geo
+from intertwine.problems.models import Problem, ProblemConnection
 from intertwine.trackable import Trackable
 from intertwine.trackable.exceptions import KeyMissingFromRegistryAndDatabase
+from intertwine.trackable.registry import Registry
+from intertwine.utils.vardygr import vardygrify
 from tests.builders.master import Builder
 
 
@@ -154,3 +159,150 @@ def test_trackable_indexability(session, caching):
     # Unpacked 1-tuples can also be used to index from the database
     indexed_problem = Problem[problem_key.human_id]
     assert indexed_problem is problem
+
+
+class Thing:
+    """Weak-referenceable registry value"""
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize('policy', [Registry.LRU, Registry.LFU])
+def test_registry_eviction(policy):
+    """Test bounded registry eviction, pinning and counters"""
+    pinned = set()
+    registry = Registry(capacity=2, policy=policy, pinned=pinned.__contains__)
+    registry['a'] = 'A'
+    registry['b'] = 'B'
+    assert registry['a'] == 'A'
+    assert registry['a'] == 'A'
+    registry['c'] = 'C'  # Evicts 'b': least recently/frequently used
+    assert 'b' not in registry
+    assert set(registry) == {'a', 'c'}
+
+    pinned.update({'A', 'C'})
+    registry['d'] = 'D'  # All others pinned, so exceed capacity
+    assert set(registry) == {'a', 'c', 'd'}
+    pinned.clear()
+    registry['e'] = 'E'
+    assert len(registry) == 2
+    assert 'e' in registry
+
+    with pytest.raises(KeyError):
+        registry['b']
+    stats = registry.stats()
+    assert stats == Registry.Stats(size=2, capacity=2, hits=2, misses=1,
+                                   evictions=3)
+
+
+@pytest.mark.unit
+def test_registry_lfu_pinned_rotation():
+    """Test skipping pinned entries on LFU eviction counts no hits"""
+    registry = Registry(capacity=2, policy=Registry.LFU,
+                        pinned={'A'}.__contains__)
+    registry['a'] = 'A'
+    registry['b'] = 'B'
+    registry['c'] = 'C'  # Skips pinned 'a' to evict 'b'
+    assert set(registry) == {'a', 'c'}
+    assert registry._frequencies == {'a': 1, 'c': 1}
+    assert registry.hits == 0
+
+
+@pytest.mark.unit
+def test_registry_weak():
+    """Test weak registry drops collected instances"""
+    registry = Registry(weak=True)
+    thing1, thing2 = Thing(), Thing()
+    registry[1] = thing1
+    registry[2] = thing2
+    assert registry[1] is thing1
+    del thing1
+    gc.collect()
+    assert 1 not in registry
+    assert registry.values() == [thing2]
+
+
+@pytest.mark.unit
+def test_trackable_bounded_registry(session, caching):
+    """Test Trackable semantics with a bounded registry"""
+    Problem.configure_registry(capacity=2)
+    try:
+        problems = [Problem('Test Problem {}'.format(i)) for i in range(4)]
+        # New instances with tracked updates are pinned
+        assert len(list(Problem)) == 4
+        for problem in problems:
+            session.add(problem)
+        session.commit()
+        Trackable.clear_updates()
+
+        assert Problem[problems[0].derive_key()] is problems[0]
+        assert Problem.tget(problems[3].human_id) is problems[3]
+        problem4 = Problem('Test Problem 4')  # Evicts to capacity
+        assert set(Problem) == {problems[3], problem4}
+        problem5 = Problem('Test Problem 5')  # New problem4 still pinned
+        assert set(Problem) == {problem4, problem5}
+
+        # Evicted instances are retrieved from the database
+        assert Problem[problems[1].derive_key()] is problems[1]
+        stats = Trackable.registry_stats(Problem)['Problem']
+        assert stats.capacity == 2
+        assert stats.evictions == 4
+        assert stats.misses >= 1
+    finally:
+        Problem.configure_registry(capacity=Trackable.REGISTRY_CAPACITY)
+
+
+@pytest.mark.unit
+def test_trackable_tget_many(session, caching):
+    """Test Trackable get many (tget_many) with bulk queries"""
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    problems = [Problem('Test Problem {}'.format(i)) for i in range(3)]
+    geo = Geo('Test Geo')
+    connection = ProblemConnection('causal', problems[0], problems[1])
+    communities = [Community(problem=problems[0], org=None, geo=geo),
+                   Community(problem=problems[1], org='Test Org', geo=None)]
+    for inst in problems + [geo, connection] + communities:
+        session.add(inst)
+    session.commit()
+
+    nada = 'nada'
+    missing_problem_key = Problem.create_key(name='Missing Problem')
+    problem_keys = [problems[2].human_id, missing_problem_key,
+                    problems[0].derive_key(), problems[2].derive_key()]
+    connection_keys = [connection.derive_key(),
+                       ProblemConnection.Key('causal', problems[1], problems[0])]
+    community_keys = [c.derive_key() for c in reversed(communities)] + [
+        Community.Key(problems[2], None, geo),
+        Community.Key(vardygrify(Problem, name='Unsaved Problem'), None, None)]
+
+    problem_checks = [problems[2], nada, problems[0], problems[2]]
+    connection_checks = [connection, nada]
+    community_checks = list(reversed(communities)) + [nada, nada]
+
+    # Registry hits only
+    assert Problem.tget_many(problem_keys, default=nada,
+                             query_on_miss=False) == problem_checks
+
+    Trackable.clear_all()  # This deregisters the keys
+
+    assert Problem.tget_many(problem_keys, default=nada,
+                             query_on_miss=False) == [nada] * 4
+
+    statements = []
+
+    def count_statements(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(Engine, 'before_cursor_execute', count_statements)
+    try:
+        for cls, keys, checks in ((Problem, problem_keys, problem_checks),
+                                  (ProblemConnection, connection_keys, connection_checks),
+                                  (Community, community_keys, community_checks)):
+            del statements[:]
+            assert cls.tget_many(keys, default=nada) == checks
+            assert len(statements) == 1
+            # Found instances are now registered
+            assert cls.tget_many(keys, default=nada, query_on_miss=False) == checks
+    finally:
+        event.remove(Engine, 'before_cursor_execute', count_statements)
@@ -2,36 +2,36 @@
 import pytest
 from itertools import tee
 
-from intertwine.utils.analytics import average
+from intertwine.utils.analytics import average, symmetric_ratings
 from intertwine.utils.duck_typing import isiterator
 from intertwine.utils.tools import is_child_class
 
 
 @pytest.mark.unit
 @pytest.mark.parametrize(
-    ('idx', 'values',                   'weights',                 'check'),
+    ('idx',    'values',                   'weights',                 'check'),
     [
-     (0,    [0, 1],                     [1, 0],                    0),
-     (1,    [1, 2],                     [1, 0],                    1),
-     (2,    [1, 2],                     [0, 1],                    2),
-     (3,    [1, 4],                     [1, 2],                    3),
-     (4,    [2, 3, 5],                  [1, 2, 4],                 4),
-     (5,    [3, 5, 7],                  None,                      5),
-     (6,    (i * 6 for i in range(3)),  None,                      6),
-     (7,    (i * 7 for i in range(3)),  [1, 1, 1],                 7),
-     (8,    (i * 8 for i in range(3)),  (i for i in [1] * 3),      8),
-     (9,    [6, 9, 12],                 (i for i in [1] * 3),      9),
-     (10,   [1, 2, 3],                  [1, 1],                    ValueError),
-     (11,   [1, 2],                     [1, 1, 1],                 ValueError),
-     (12,   [1, 2],                     [0],                       ValueError),
-     (13,   [1, 2],                     ['a'],                     ValueError),
-     (14,   [1, 2],                     [0, 0],                    ZeroDivisionError),
-     (15,   [],                         [],                        ZeroDivisionError),
-     (16,   [1, 2],                     [1, 'a'],                  TypeError),
-     (17,   [1, 'a'],                   [1, 1],                    TypeError),
-     (18,   None,                       [1, 1],                    TypeError),
-     (19,   None,                       None,                      TypeError),
-     ])
+        (0,    [0, 1],                     [1, 0],                    0),
+        (1,    [1, 2],                     [1, 0],                    1),
+        (2,    [1, 2],                     [0, 1],                    2),
+        (3,    [1, 4],                     [1, 2],                    3),
+        (4,    [2, 3, 5],                  [1, 2, 4],                 4),
+        (5,    [3, 5, 7],                  None,                      5),
+        (6,    (i * 6 for i in range(3)),  None,                      6),
+        (7,    (i * 7 for i in range(3)),  [1, 1, 1],                 7),
+        (8,    (i * 8 for i in range(3)),  (i for i in [1] * 3),      8),
+        (9,    [6, 9, 12],                 (i for i in [1] * 3),      9),
+        (10,   [1, 2, 3],                  [1, 1],                    ValueError),
+        (11,   [1, 2],                     [1, 1, 1],                 ValueError),
+        (12,   [1, 2],                     [0],                       ValueError),
+        (13,   [1, 2],                     ['a'],                     ValueError),
+        (14,   [1, 2],                     [0, 0],                    ZeroDivisionError),
+        (15,   [],                         [],                        ZeroDivisionError),
+        (16,   [1, 2],                     [1, 'a'],                  TypeError),
+        (17,   [1, 'a'],                   [1, 1],                    TypeError),
+        (18,   None,                       [1, 1],                    TypeError),
+        (19,   None,                       None,                      TypeError),
+    ])
 def test_average(idx, values, weights, check):
     if is_child_class(check, Exception):
         with pytest.raises(check):
@@ -41,3 +41,32 @@ def test_average(idx, values, weights, check):
             values, values2 = tee(values, 2) if isiterator(values) else (values, values)
             assert average(values2) == check
         assert average(values, weights) == check
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize(
+    ('idx',    'forward',           'reverse',           'check'),
+    [
+        (0,    (0.5, 1),            (-1, 1),             0.5),
+        (1,    (-1, 1),             (3.0, 2),            3.0),
+        (2,    (-1, 1),             (-1, 1),             -1),
+        (3,    (1.0, 1),            (4.0, 2),            3.0),
+        (4,    (2.0, 3),            (4.0, 1),            2.5),
+        (5,    (2.0, 0),            (4.0, 0),            3.0),
+        (6,    (0.0, 1),            (4.0, 1),            2.0),
+    ])
+def test_symmetric_ratings(idx, forward, reverse, check):
+    assert symmetric_ratings([forward], [reverse]).tolist() == [check]
+
+
+@pytest.mark.unit
+def test_symmetric_ratings_batch():
+    forward = [(0.5, 1), (-1, 1), (1.0, 1), (2.0, 3)]
+    reverse = [(-1, 1), (3.0, 2), (4.0, 2), (4.0, 1)]
+    checks = [average([f[0], r[0]], [f[1], r[1]]) if f[0] != -1 and r[0] != -1
+              else (f[0] if r[0] == -1 else r[0])
+              for f, r in zip(forward, reverse)]
+    assert symmetric_ratings(forward, reverse).tolist() == pytest.approx(checks)
+    assert symmetric_ratings([], []).tolist() == []
+    with pytest.raises(ValueError):
+        symmetric_ratings(forward, reverse[:2])
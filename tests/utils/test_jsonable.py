@@ -102,3 +102,153 @@ def test_jsonify_depth2(session, problem_name, org_name, geo_name,
         assert geo_key in community_payload
 
     json.dumps(community_payload)
+
+
+@pytest.mark.unit
+def test_jsonify_plan_cache(session):
+    """Test jsonify plans are compiled once per configuration and reused"""
+    from intertwine.communities.models import Community
+    from intertwine.communities.views import configure_community_json
+    from intertwine.geos.models import Geo
+    from intertwine.problems.models import Problem
+    from intertwine.utils.jsonable import Jsonable
+
+    problem = Problem(name='Homelessness')
+    geo = Geo(name='Austin')
+    community = Community(problem=problem, org=None, geo=geo)
+
+    session.add(community)
+    session.commit()
+
+    Jsonable._jsonify_plans.clear()
+    config = configure_community_json()
+    payload = community.jsonify(config=config, depth=2)
+    num_plans = len(Jsonable._jsonify_plans)
+    assert num_plans > 0
+
+    plans = list(Jsonable._jsonify_plans.values())
+    assert community.jsonify(config=configure_community_json(), depth=2) == payload
+    assert len(Jsonable._jsonify_plans) == num_plans
+    assert all(p is q for p, q in zip(plans, Jsonable._jsonify_plans.values()))
+
+    community_json = payload[payload[Community.JSON_ROOT]]
+    problem_json = payload[community_json['problem']]
+    assert 'drivers' not in problem_json
+    assert 'impacts' not in problem_json
+
+    config['.geo'] = 0
+    community_json = community.jsonify(config=config, depth=2)[community.json_key()]
+    assert 'geo' not in community_json
+    assert len(Jsonable._jsonify_plans) > num_plans
+
+
+@pytest.mark.unit
+def test_jsonify_prefetch(session, monkeypatch):
+    """Test prefetch batches relationship loads without changing JSON"""
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+    from intertwine.communities.models import Community
+    from intertwine.geos.models import Geo
+    from intertwine.problems.models import Problem, ProblemConnection
+    from intertwine.utils.jsonable import Jsonable
+
+    num_problems = 10
+    geo = Geo(name='Austin')
+    problems = [Problem(name='Problem {}'.format(i)) for i in range(num_problems)]
+    connections = [ProblemConnection('causal', problems[i], problems[(i + j) % num_problems])
+                   for i in range(num_problems) for j in (1, 2)]
+    communities = [Community(problem=p, org=None, geo=geo) for p in problems]
+    session.add_all([geo] + problems + connections + communities)
+    session.commit()
+
+    statements = []
+
+    def count_statement(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    def jsonify_communities(prefetch):
+        monkeypatch.setattr(Jsonable, 'JSONIFY_PREFETCH', prefetch)
+        session.expire_all()
+        del statements[:]
+        event.listen(Engine, 'before_cursor_execute', count_statement)
+        try:
+            payload = Community.jsonify_value(communities, depth=3, limit=-1)
+        finally:
+            event.remove(Engine, 'before_cursor_execute', count_statement)
+        return payload, len(statements)
+
+    payload, num_queries = jsonify_communities(prefetch=False)
+    prefetched_payload, prefetched_num_queries = jsonify_communities(prefetch=True)
+
+    assert prefetched_payload == payload
+    assert prefetched_num_queries < num_queries
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("depth, nest, as_list", [
+    (1, False, False),
+    (2, False, False),
+    (2, True, False),
+    (2, False, True),
+])
+def test_iter_json(session, depth, nest, as_list):
+    """Test streamed JSON chunks decode to the jsonify payload"""
+    from intertwine.communities.models import Community
+    from intertwine.geos.models import Geo
+    from intertwine.problems.models import Problem, ProblemConnection
+    from intertwine.utils.jsonable import Jsonable
+
+    geo = Geo(name='Austin')
+    problems = [Problem(name='Problem {}'.format(i)) for i in range(3)]
+    connections = [ProblemConnection('causal', problems[i], problems[(i + 1) % 3])
+                   for i in range(3)]
+    communities = [Community(problem=p, org=None, geo=geo) for p in problems]
+    session.add_all([geo] + problems + connections + communities)
+    session.commit()
+
+    value = communities if as_list else communities[0]
+    json_kwargs = dict(depth=depth, nest=nest, limit=2)
+
+    if as_list:
+        payload = Jsonable.jsonify_value(value, **json_kwargs)
+    else:
+        payload = value.jsonify(**json_kwargs)
+
+    chunks = list(Jsonable.iter_json(value, **json_kwargs))
+    if as_list:
+        assert len(chunks) > len(communities)
+
+    assert json.loads(''.join(chunks)) == json.loads(json.dumps(payload))
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("depth", [1, 2])
+def test_iter_json_streams_unlimited_children(session, monkeypatch, depth):
+    """Test a single geo with unlimited children is streamed incrementally"""
+    from intertwine.geos.models import Geo, GeoData, GeoLevel
+    from intertwine.utils.jsonable import Jsonable, JsonStream
+
+    def create_geo(name, level, total_pop, parents=()):
+        geo = Geo(name=name, parents=list(parents))
+        GeoData(geo=geo, total_pop=total_pop, urban_pop=0, latitude=42,
+                longitude=-71, land_area=1, water_area=0)
+        GeoLevel(geo=geo, level=level)
+        return geo
+
+    num_children = 12
+    state = create_geo('Test State', 'subdivision1', 1000)
+    for i in range(num_children):
+        create_geo('Test Place {}'.format(i), 'place', i, parents=[state])
+    session.add(state)
+    session.commit()
+
+    json_kwargs = dict(depth=depth, limit=-1)
+    payload = state.jsonify(**json_kwargs)
+
+    monkeypatch.setattr(JsonStream, 'BUFFER_SIZE', 1)
+    chunks = Jsonable.iter_json(state, **json_kwargs)
+    first_chunk = next(chunks)  # Yielded before children are all jsonified
+    chunks = [first_chunk] + list(chunks)
+    assert len(chunks) > num_children
+
+    assert json.loads(''.join(chunks)) == json.loads(json.dumps(payload))
@@ -177,3 +177,27 @@ def test_quantized_decimal_type_cast(operator, number, precision):
 
     assert qd2 == qd2_value
     assert type(qd2) is type(qd2_value)
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize('count', [1000])
+@pytest.mark.parametrize('precision', [6, 7])
+def test_quantized_decimal_integer_path(count, precision):
+    """Test quantized decimal integer path matches Decimal path"""
+    integers = [(-1) ** i * (i * 7919 + 1234567) for i in range(count)]
+
+    qds = [QuantizedDecimal(i, precision, requantize=True) for i in integers]
+    results = sum(qds), max(qds), sum(qd * 2 for qd in qds)
+
+    decimal_qds = [QuantizedDecimal(QuantizedDecimal.requantize(i, precision),
+                                    precision) for i in integers]
+    total, doubled = (QuantizedDecimal(0, precision),
+                      QuantizedDecimal(0, precision))
+    for qd in decimal_qds:
+        total += qd.value
+        doubled += qd.value * 2
+    decimal_results = (total, max(decimal_qds, key=lambda qd: qd.value),
+                       doubled)
+
+    assert results == decimal_results
+    assert all(isinstance(qd, QuantizedDecimal) for qd in results)
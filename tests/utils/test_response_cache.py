@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+import pytest
+from flask import jsonify
+
+from intertwine.utils.response_cache import ResponseCache
+
+
+class Clock:
+    """Manually advanced clock"""
+    def __call__(self):
+        return self.now
+
+    def __init__(self, now=0):
+        self.now = now
+
+
+@pytest.mark.unit
+@pytest.mark.smoke
+def test_response_cache_bounds(app):
+    """Test response cache LRU eviction, TTL expiry and tag invalidation"""
+    clock = Clock()
+    cache = ResponseCache(size=2, ttl=10, clock=clock)
+
+    with app.test_request_context('/'):
+        e1 = cache.put('k1', jsonify(value=1), {'Problem'})
+        cache.put('k2', jsonify(value=2), {'Geo'})
+        assert cache.get('k1') is e1  # k1 now most recently used
+        cache.put('k3', jsonify(value=3), {'Geo'})
+        assert 'k2' not in cache
+        assert 'k1' in cache and 'k3' in cache
+
+        cache.invalidate('Geo')
+        assert cache.get('k3') is None
+        assert cache.get('k1') is e1
+
+        clock.now = 10
+        assert cache.get('k1') is None
+        assert len(cache) == 0
+        assert (cache.hits, cache.misses) == (2, 2)
+
+        cache.configure(size=0)
+        assert cache.put('k4', jsonify(value=4), set()) and len(cache) == 0
+
+
+@pytest.mark.unit
+@pytest.mark.smoke
+def test_response_cache_etag(app):
+    """Test cached response carries ETag and honors If-None-Match"""
+    cache = ResponseCache()
+
+    with app.test_request_context('/'):
+        entry = cache.put('key', jsonify(value=1), set())
+        response = cache.respond(entry)
+        assert response.status_code == 200
+        assert response.headers['ETag'] == '"{}"'.format(entry.etag)
+        assert response.get_data() == entry.data
+
+    headers = {'If-None-Match': '"{}"'.format(entry.etag)}
+    with app.test_request_context('/', headers=headers):
+        response = cache.respond(entry)
+        assert response.status_code == 304
+
+
+@pytest.mark.unit
+@pytest.mark.smoke
+def test_response_cache_shared_invalidation(app, session):
+    """Test commits invalidate entries cached by other processes"""
+    from intertwine.communities.models import Community
+    from intertwine.problems.models import Problem
+    from intertwine.utils.response_cache import response_cache
+    from intertwine.utils.versions import SharedVersions, shared_versions
+
+    clock = Clock()
+    other = ResponseCache(session=session, clock=clock,
+                          versions=SharedVersions(interval=10, clock=clock))
+    with app.test_request_context('/'):
+        other.put('problems', jsonify(value=1), {'Problem'})
+        other.put('geos', jsonify(value=2), {'Geo'})
+        other.put('stats', jsonify(value=3), {'community_stats'})
+    other.sync()
+    assert len(other) == 3  # no versions yet
+
+    shared_versions.configure(enabled=True)
+    try:
+        session.begin_nested()
+        session.add(Problem('Rolled Back Problem'))
+        session.flush()
+        session.rollback()  # savepoint only
+        assert response_cache.PENDING_INVALIDATIONS_TAG in session.info
+
+        # Community stats rows are written via Core on flush
+        problem = Problem('Shared Invalidation Problem')
+        session.add(Community(problem=problem, org=None, geo=None))
+        session.commit()
+    finally:
+        shared_versions.configure(enabled=False)
+
+    other.sync()
+    assert len(other) == 3  # within interval
+
+    clock.now = 10
+    other.sync()
+    assert 'problems' not in other and 'stats' not in other
+    assert 'geos' in other
@@ -3,7 +3,8 @@ from decimal import Decimal
 
 import pytest
 
-from intertwine.utils.space import Area, Coordinate, GeoLocation
+from intertwine.utils.space import (Area, Coordinate, GeoLocation,
+                                    TimezoneResolver)
 
 
 def perform_core_quantized_interactions(cls, number):
@@ -185,3 +186,29 @@ def test_geo_location_combine(lat1, lon1, wt1, lat2, lon2, wt2, lat3, lon3, wt3)
         (geo_location3.values, wt3))
 
     assert GeoLocation(*sequentially_combined_coordinates) == coordinates_check
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize(('latitude', 'longitude', 'tz_name'), [
+    ('30.2672', '-97.7431', 'America/Chicago'),
+    ('40.7128', '-74.0060', 'America/New_York'),
+    ('21.3069', '-157.8583', 'Pacific/Honolulu'),
+])
+def test_timezone_resolver(latitude, longitude, tz_name):
+    """Test TimezoneResolver resolution, batching and caching"""
+    resolver = TimezoneResolver()
+    geo_location = GeoLocation(latitude, longitude)
+
+    assert resolver.resolve(latitude, longitude) == tz_name
+    assert geo_location.timezone_name == tz_name
+    assert resolver.finder is resolver.finder
+
+    # Nearby locations share a cached resolution
+    nearby = GeoLocation(geo_location.latitude + Decimal('0.00001'),
+                         geo_location.longitude)
+    tz_names = resolver.resolve_many([geo_location, nearby,
+                                      (latitude, longitude)])
+    assert tz_names == [tz_name] * 3
+    cache_info = resolver._resolve_quantized.cache_info()
+    assert cache_info.misses == 1
+    assert cache_info.hits == 1
@@ -178,3 +178,43 @@ def test_vardygrify(session, problem_name, org_name, geo_name, num_followers):
     real_community_json = json.dumps(real_community_payload)
     vardygr_community_json = json.dumps(vardygr_community_payload)
     assert real_community_json == vardygr_community_json
+
+
+@pytest.mark.unit
+def test_vardygrify_many(session):
+    """Test vardygrify_many by comparing slotted vardygr and real communities"""
+    from intertwine.communities.models import Community
+    from intertwine.geos.models import Geo
+    from intertwine.problems.models import Problem
+    from intertwine.utils.vardygr import vardygrify_many
+
+    geo = Geo(name='Austin')
+    problems = [Problem(name='Test Problem {}'.format(i)) for i in range(3)]
+    fields = ('problem', 'org', 'geo', 'num_followers')
+    rows = [(problem, None, geo, i * 10) for i, problem in enumerate(problems)]
+    real_communities = [Community(**dict(zip(fields, row))) for row in rows]
+    session.add_all(real_communities)
+    session.commit()
+
+    vardygr_communities = vardygrify_many(Community, rows, fields=fields)
+    assert vardygrify_many(Community, []) == []
+    assert (type(vardygrify_many(Community, [dict(zip(fields, rows[0]))])[0]) is
+            type(vardygr_communities[0]))
+
+    hide = Community.ID_FIELDS
+    for real_community, vardygr_community in zip(real_communities,
+                                                 vardygr_communities):
+        assert not hasattr(vardygr_community, '__dict__')
+        assert vardygr_community.model_class is Community
+        assert vardygr_community.derive_key() == real_community.derive_key()
+        assert vardygr_community.significance == real_community.significance
+        assert (vardygr_community.jsonify(hide=hide) ==
+                real_community.jsonify(hide=hide))
+
+    # Unset fields read as None
+    vardygr_community, = vardygrify_many(Community, [{'problem': problems[0]}])
+    assert vardygr_community.org is vardygr_community.geo is None
+    with pytest.raises(AttributeError):
+        vardygr_community.nonexistent_field
+    with pytest.raises(ValueError):
+        vardygrify_many(Community, rows)